@@ -1,43 +1,104 @@
-from flask import Flask,render_template, request, redirect
+from flask import Flask,render_template, request, redirect, Response
 import requests
 import consts
-from random import randrange
 from apscheduler.schedulers.background import BackgroundScheduler
 import json
+import threading
 import time
-import random
 
 from hashlib import sha256
 
+from cache import ChainCache
+from peers import StickyPeers
+
 app = Flask(__name__)
 sched = BackgroundScheduler(daemon=True)    
-peers = []
-chain = []
+peers = StickyPeers(consts.first_peer_contact, consts.peer_base_backoff, consts.peer_max_backoff)
+cache = ChainCache(consts.chain_cache_file)
+
+def node_request(method, path, **kwargs):
+    """
+    Send request to current node, recording its round trip time or failure
+    :return: (node address, response)
+    """
+    peer = peers.current()
+    start = time.perf_counter()
+    try:
+        response = requests.request(method, peer + path, timeout=consts.request_timeout, **kwargs)
+    except requests.exceptions.RequestException:
+        peers.record_failure(peer)
+        raise
+    if response.status_code >= 500:
+        peers.record_failure(peer)
+    else:
+        peers.record_success(peer, time.perf_counter() - start)
+    return peer, response
 
 def update_peers(peers_list):
-    selected_peer = random.choice(peers_list)
-    response = requests.get(f"{selected_peer}peers")
+    try:
+        _, response = node_request('GET', 'peers')
+    except requests.exceptions.RequestException as e:
+        print(f"Updating peers failed: {e}")
+        return
     if response.status_code == 200:
-        if selected_peer not in peers:
-            peers.append(selected_peer)
         for p in response.json()['peers']:
-            if p not in peers:
-                peers.append(selected_peer)
-
-def chain_messages():
-    messages = []
-    for tx in chain:
-        for m in tx['transactions']:
-            add = m
-            add['time'] = time.ctime(add['time'])
-            messages.append(m)
-    return messages
+            peers_list.add(p)
+
+def follow_chain():
+    """
+    Keep chain cache up to date in the background: sync once, then again on every tip event
+    pushed by the node. Another peer is followed after a failure.
+    """
+    while True:
+        peer = peers.current()
+        try:
+            cache.sync(peer)
+            peers.record_success(peer)
+            with requests.get(peer + 'events', stream=True,
+                              timeout=(consts.request_timeout, consts.events_timeout)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('data:'):
+                        cache.sync(peer)
+        except requests.exceptions.RequestException as e:
+            peers.record_failure(peer)
+            print(f"Following chain of {peer} failed: {e}")
+        time.sleep(consts.chain_retry_interval)
+
+def current_page():
+    page = request.args.get('page', 1, type=int)
+    return max(page, 1)
 
 @app.route('/')
 def home():
-    update_peers([consts.first_peer_contact])
-    synchronize_chain()
-    return render_template('home.html', msgs = chain_messages())
+    page = current_page()
+    msgs, pages = cache.page(page, consts.messages_per_page)
+    return render_template('home.html', msgs=msgs, page=page, pages=pages)
+
+@app.route('/messages')
+def messages():
+    """
+    Rendered list of messages of one page, used to refresh the page on live updates
+    """
+    page = current_page()
+    msgs, pages = cache.page(page, consts.messages_per_page)
+    return render_template('messages.html', msgs=msgs, page=page, pages=pages)
+
+@app.route('/events')
+def events():
+    """
+    Server-Sent Events telling the browser the cached chain changed
+    """
+    def stream():
+        seen = cache.version
+        while True:
+            version = cache.wait(seen, consts.events_keep_alive)
+            if version == seen:
+                yield ": keep-alive\n\n"
+                continue
+            seen = version
+            yield f"event: chain\ndata: {json.dumps({'height': cache.height})}\n\n"
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/submit_transaction', methods=['POST'])
 def submit_transaction():
@@ -48,21 +109,56 @@ def submit_transaction():
             }
     data['hash'] = sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
 
-    peer = peers[randrange(0,len(peers))]
-    print(peers)
-    print(f"Chosen peer: {peer}")
-    requests.post(peer + "new_transaction", data=json.dumps(data), headers=consts.json_headers)
+    try:
+        peer, _ = node_request('POST', "new_transaction", data=json.dumps(data), headers=consts.json_headers)
+        print(f"Chosen peer: {peer}")
+    except requests.exceptions.RequestException as e:
+        print(f"Submitting transaction failed: {e}")
     return redirect('/')
 
-def synchronize_chain():
-    global chain
-    peer = peers[randrange(0,len(peers))]
-    response = requests.get(peer + 'chain')
-    if response.status_code == 200:
-        chain = response.json()['chain']
+def header_hash(header):
+    header = {k: v for k, v in header.items() if k != 'hash'}
+    return sha256(json.dumps(header, sort_keys=True).encode('utf-8')).hexdigest()
+
+def verify_merkle_proof(tx_hash, proof, root):
+    # Leaves and inner nodes are prefixed as in node/merkle.py
+    digest = sha256(b'\x00' + tx_hash.encode('utf-8')).digest()
+    for sibling, side in proof:
+        if side == 'l':
+            digest = sha256(b'\x01' + bytes.fromhex(sibling) + digest).digest()
+        else:
+            digest = sha256(b'\x01' + digest + bytes.fromhex(sibling)).digest()
+    return digest.hex() == root
+
+def block_target(header):
+    # blocks without target have the initial target of the nodes
+    if header.get('target') is not None:
+        return int(header['target'], 16)
+    return 16 ** (64 - consts.difficulty) - 1
+
+@app.route('/verify/<tx_hash>')
+def verify_transaction(tx_hash):
+    """
+    Check that message is included in a block using only block header and Merkle proof
+    """
+    try:
+        peer, response = node_request('GET', 'tx_proof/' + tx_hash)
+    except requests.exceptions.RequestException as e:
+        return {"verified": False, "message": f"node unreachable: {e}"}, 502
+    if response.status_code != 200:
+        return {"verified": False, "message": "transaction not found"}, 404
+    data = response.json()
+    header = data['header']
+    # the header has to be a block of the followed chain with valid proof of work, not only self-consistent
+    cached = cache.block(header['hash'])
+    verified = (cached is not None and header_hash(header) == header['hash'] and
+                int(header['hash'], 16) <= block_target(header) and
+                verify_merkle_proof(tx_hash, data['proof'], header['merkle_root']))
+    return {"verified": verified, "block": header['id'], "block_hash": header['hash'], "peer": peer}
 
 
 sched.add_job(update_peers, 'interval', args = (peers,), seconds=consts.update_peers_timeout)
 sched.start()
+threading.Thread(target=follow_chain, name='chain-follower', daemon=True).start()
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
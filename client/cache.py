@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+
+def display_message(tx):
+    """
+    Return copy of transaction prepared for rendering, cached transactions are never modified
+    """
+    message = dict(tx)
+    if isinstance(tx.get('time'), (int, float)):
+        message['time'] = time.ctime(tx['time'])
+    return message
+
+
+class ChainCache:
+    """
+    Blocks of the chain kept in a JSON lines file and updated incrementally from a node.
+
+    Only blocks after the cached tip are downloaded. When the chain of the node
+    switched to another branch, cached blocks are dropped back to the fork and
+    the new branch is downloaded. Messages are prepared for rendering once when
+    their block is added, pages are slices of that list. When the node pruned
+    bodies of blocks the cache lacks, the cache restarts at the first block the
+    node still has, the cached chain then does not start with the genesis block.
+    """
+
+    def __init__(self, path, timeout=(2, 30)):
+        """
+        Constructor for ChainCache class
+        :param path: JSON lines file of cached blocks, created if missing
+        :param timeout: (connect, read) timeout in seconds of requests to nodes
+        """
+        self.path = path
+        self.timeout = timeout
+        self.blocks = []
+        self.first = 0  # id of first cached block
+        self.messages = []  # display messages in chain order
+        self._offsets = []  # number of messages before each block
+        self._heights = {}  # block hash -> id of cached blocks
+        self.version = 0  # incremented on every change of cached chain
+        self._changed = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    block = json.loads(line)
+                except ValueError:
+                    break  # partially written last line
+                if self.blocks and block.get('previous_hash') != self.blocks[-1]['hash']:
+                    break
+                if not self.blocks:
+                    self.first = block['id']
+                self._add(block)
+        self._rewrite()
+
+    def _add(self, block):
+        self._heights[block['hash']] = len(self.blocks)
+        self.blocks.append(block)
+        self._offsets.append(len(self.messages))
+        self.messages.extend(display_message(tx) for tx in block['transactions'])
+
+    def _truncate(self, length):
+        if length < len(self.blocks):
+            del self.messages[self._offsets[length]:]
+            del self._offsets[length:]
+            for block in self.blocks[length:]:
+                del self._heights[block['hash']]
+            del self.blocks[length:]
+
+    def _rewrite(self):
+        with open(self.path + '.tmp', 'w') as f:
+            for block in self.blocks:
+                f.write(json.dumps(block, sort_keys=True) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+
+    def block(self, block_hash):
+        """
+        Return cached block with hash, None if it is not in the cached chain
+        """
+        with self._changed:
+            height = self._heights.get(block_hash)
+            return self.blocks[height] if height is not None else None
+
+    @property
+    def tip_hash(self):
+        return self.blocks[-1]['hash'] if self.blocks else None
+
+    @property
+    def height(self):
+        """
+        Id of last cached block, first - 1 if nothing is cached
+        """
+        return self.first + len(self.blocks) - 1
+
+    def _peer_hash_at(self, peer, height):
+        response = requests.get(peer + 'headers', params={"from": height, "limit": 1}, timeout=self.timeout)
+        response.raise_for_status()
+        headers = response.json()['headers']
+        return headers[0]['hash'] if headers else None
+
+    def _fork_point(self, peer, peer_height):
+        """
+        Highest cached block the node has too, steps back exponentially so few headers are requested
+        """
+        height = min(self.height, peer_height)
+        step = 1
+        while height >= self.first and self._peer_hash_at(peer, height) != self.blocks[height - self.first]['hash']:
+            height -= step
+            step *= 2
+        return max(height, self.first - 1)
+
+    def _fetch(self, peer, start):
+        """
+        Stream blocks of node from id start on, from the first block the node still has the body of if it
+        pruned the blocks at start, see the 410 answer of /chain
+        :return: (id of first block, list of block dicts)
+        """
+        while True:
+            with requests.get(peer + 'chain', params={"from": start, "format": "ndjson"}, timeout=self.timeout,
+                              stream=True) as response:
+                if response.status_code == 410:
+                    available_from = response.json().get('available_from')
+                    if isinstance(available_from, int) and available_from > start:
+                        start = available_from
+                        continue
+                response.raise_for_status()
+                return start, [json.loads(line) for line in response.iter_lines() if line]
+
+    def sync(self, peer):
+        """
+        Download blocks of node after the last block both chains share
+        :param peer: node address
+        :return: number of downloaded blocks
+        """
+        with self._sync_lock:
+            response = requests.get(peer + 'tip', timeout=self.timeout)
+            response.raise_for_status()
+            tip = response.json()
+            if tip['hash'] == self.tip_hash:
+                return 0
+
+            fork = self._fork_point(peer, tip['height'])
+            start, blocks = self._fetch(peer, fork + 1)
+
+            with self._changed:
+                appended = start == self.first + len(self.blocks)
+                if start > fork + 1:
+                    # blocks after the fork were pruned by the node, the cache restarts at start
+                    self._truncate(0)
+                    self.first = start
+                self._truncate(start - self.first)
+                for block in blocks:
+                    if self.blocks and block['previous_hash'] != self.blocks[-1]['hash']:
+                        break  # chain of node switched while streaming, next sync continues
+                    self._add(block)
+                if appended:
+                    with open(self.path, 'a') as f:
+                        for block in self.blocks[start - self.first:]:
+                            f.write(json.dumps(block, sort_keys=True) + '\n')
+                else:
+                    self._rewrite()
+                self.version += 1
+                self._changed.notify_all()
+            return len(blocks)
+
+    def wait(self, seen, timeout=None):
+        """
+        Wait until cached chain changed after version seen
+        :return: current version, equal to seen on timeout
+        """
+        with self._changed:
+            if self.version == seen:
+                self._changed.wait(timeout)
+            return self.version
+
+    def page(self, number, per_page):
+        """
+        Return messages of page, newest first
+        :param number: page number starting at 1
+        :param per_page: messages per page
+        :return: (list of messages, number of pages)
+        """
+        with self._changed:
+            total = len(self.messages)
+            end = total - (number - 1) * per_page
+            messages = self.messages[max(0, end - per_page):max(0, end)]
+        return messages[::-1], max(1, -(-total // per_page))
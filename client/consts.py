@@ -1,5 +1,14 @@
 first_peer_contact = "http://127.0.0.1:8000/"
 update_peers_timeout = 5
+request_timeout = 2  # seconds to connect to node
+peer_base_backoff = 1  # seconds a node is skipped after a failed request, doubled with every further failure
+peer_max_backoff = 60  # maximum seconds a failing node is skipped
+chain_cache_file = "chain_cache.jsonl"  # blocks cached between runs
+chain_retry_interval = 5  # seconds before following chain again after failure
+events_timeout = 60  # seconds without data from node events before reconnecting, above node keep alive interval
+events_keep_alive = 15  # seconds between comments keeping idle browser event streams open
+messages_per_page = 20
+difficulty = 2  # initial difficulty of nodes, sets the target of blocks without target
 
 # flask
 json_headers = {'Content-Type': "application/json"}
\ No newline at end of file
@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+
+
+class StickyPeers:
+    """
+    Nodes known to the client, requests keep going to the same node while it answers.
+
+    The client then reads the chain it wrote to and its cache follows one chain.
+    A node failing a request is skipped for an exponentially growing time and
+    the client switches to the node with the lowest round trip time among the others.
+    """
+
+    def __init__(self, first_peer, base_backoff=1, max_backoff=60):
+        """
+        Constructor for StickyPeers class
+        :param first_peer: address of node used first
+        :param base_backoff: seconds a node is skipped after its first failure, doubled with every further failure
+        :param max_backoff: maximum seconds a node is skipped
+        """
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._peers = {}  # address -> [round trip time, consecutive failures, monotonic time until skipped]
+        self._current = first_peer
+        self._lock = threading.Lock()
+        self.add(first_peer)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._peers))
+
+    def __contains__(self, peer):
+        return peer in self._peers
+
+    def __len__(self):
+        return len(self._peers)
+
+    def add(self, peer):
+        with self._lock:
+            self._peers.setdefault(peer, [None, 0, 0.0])
+
+    def current(self):
+        """
+        Return node requests go to, switches away from a node that is backed off
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._peers[self._current][2] <= now:
+                return self._current
+            healthy = [p for p, (_, _, until) in self._peers.items() if until <= now]
+            if healthy:
+                # nodes without measured round trip time are tried before slower ones
+                measured = [p for p in healthy if self._peers[p][0] is not None]
+                unmeasured = [p for p in healthy if self._peers[p][0] is None]
+                self._current = random.choice(unmeasured) if unmeasured else min(measured,
+                                                                                 key=lambda p: self._peers[p][0])
+            else:
+                self._current = min(self._peers, key=lambda p: self._peers[p][2])
+            return self._current
+
+    def record_success(self, peer, rtt=None):
+        """
+        Record answered request
+        :param peer: node address
+        :param rtt: seconds until response, None if not measured
+        """
+        with self._lock:
+            stats = self._peers.get(peer)
+            if stats is None:
+                return
+            if rtt is not None:
+                stats[0] = rtt if stats[0] is None else 0.8 * stats[0] + 0.2 * rtt
+            stats[1] = 0
+            stats[2] = 0.0
+
+    def record_failure(self, peer):
+        """
+        Record failed request, node is skipped until its backoff is over
+        :param peer: node address
+        """
+        with self._lock:
+            stats = self._peers.get(peer)
+            if stats is None:
+                return
+            stats[1] += 1
+            stats[2] = time.monotonic() + min(self.max_backoff, self.base_backoff * 2 ** (stats[1] - 1))
@@ -1,242 +1,879 @@
+import argparse
+import asyncio
 import json
+import logging
+import os
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from apscheduler.schedulers.background import BackgroundScheduler
-from cryptography.hazmat.primitives import serialization
-from flask import Flask, request
-from copy import deepcopy
+from aiohttp import web
 
 import consts
-from block import Block
-from blockchain import BlockChain
+import metrics
+import wire
+from block import transaction_valid
+from gossip import GossipBuffer
 from node import Node
+from runtime import Batcher, Notifier, StateOwner, periodic
+from snapshot import checkpoint, snapshot_source
+from sync import adopt_genesis, bootstrap_from_peer, peer_tip, sync_with_peer
+
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run blockchain node")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data-dir', help="directory of block store, port directory in consts.block_store_dir "
+                                           "if not given")
+    return parser.parse_args(argv)
+
+
+def data_dir(args: argparse.Namespace):
+    """
+    Return block store directory of node, every node on a host gets its own so they do not share a store
+    """
+    if args.data_dir:
+        return args.data_dir
+    return os.path.join(consts.block_store_dir, str(args.port)) if consts.block_store_dir else None
+
+
+args = parse_args() if __name__ == '__main__' else parse_args([])
+routes = web.RouteTableDef()
+node = Node(data_dir(args))
+# Chain and mempool are mutated only through owner, handlers on the event loop may read them directly
+owner = StateOwner()
+# Proof of work runs on its own thread, blocking requests to peers on the default executor
+pow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='proof-of-work')
+mining_lock = asyncio.Lock()
+snapshot_lock = asyncio.Lock()  # one snapshot is built at a time, requests waiting for it get the cached message
+# Blocks are appended on the event loop through owner, waiting event streams are woken by the change of tip
+tip_changed = Notifier()
+node.blockchain.tip_listeners.append(tip_changed.notify)
+# Signed messages of peers arriving together, e.g. keep-alives, are verified as one batch off the event loop
+signed_messages = Batcher(node.open_messages, consts.signature_batch_delay, consts.signature_max_batch)
+
+logger = logging.getLogger(__name__)
+sync_failures = metrics.counter("peer_sync_failures_total", "Synchronizations with peers failed per reason",
+                                ("peer", "reason"))
+pruned_blocks = metrics.counter("pruned_blocks_total", "Blocks whose bodies were dropped by pruning")
+
+http_seconds = metrics.histogram("http_request_seconds", "Time of handling requests per endpoint", ("endpoint",))
+http_received_bytes = metrics.counter("http_received_bytes_total", "Request body bytes received per endpoint",
+                                      ("endpoint",))
+http_sent_bytes = metrics.counter("http_sent_bytes_total", "Response bytes sent per endpoint", ("endpoint",))
+metrics.gauge("mining_hash_rate", "Hashes per second of last proof of work", node.blockchain.miner.hash_rate)
+metrics.gauge("mempool_transactions", "Unconfirmed transactions in mempool", lambda: len(node.blockchain.mempool))
+metrics.gauge("chain_height", "Number of blocks in chain", lambda: len(node.blockchain.chain))
+metrics.gauge("peers", "Number of known peers", lambda: len(node.peers))
+metrics.gauge("peers_healthy", "Number of peers not backed off after failed requests",
+              lambda: len(node.peer_table.healthy()))
+# Relays and catching up with announced blocks run after the response to the sender,
+# references keep the tasks alive
+background = set()
+catch_up_lock = asyncio.Lock()
+catch_up_requested = asyncio.Event()
+
+
+async def run_blocking(func, *args):
+    """
+    Run blocking function, e.g. requests to peers, on the default executor
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def host_url(request: web.Request) -> str:
+    return f"{request.scheme}://{request.host}/"
+
+
+def query_arg(request: web.Request, name: str, default=None, type=int):
+    """
+    Return query argument converted to type, default if it is missing or malformed
+    """
+    try:
+        return type(request.query[name])
+    except (KeyError, ValueError):
+        return default
 
-app = Flask(__name__)
-node = Node()
-# Contains the host addresses of other participating members of the network
-sched = BackgroundScheduler(daemon=True)
 
+async def read_body(request: web.Request) -> tuple:
+    """
+    Return wire format and raw body of request from peer, format is taken from Content-Type
+    """
+    return wire.format_of(request.content_type), await request.read()
+
+
+def message_encoder(data: dict):
+    """
+    Return function signing data in the wire format it is called with, for Node.broadcast
+    """
+    def encode(fmt):
+        msg = node.create_message(data, fmt)
+        return msg if fmt == wire.MSGPACK else json.dumps(msg)
+    return encode
 
-def send_keep_alive():
+
+@web.middleware
+async def measure_requests(request, handler):
+    """
+    Record latency and body bytes of requests, endpoints are route patterns so paths with ids share one series
+    """
+    if not metrics.enabled:
+        return await handler(request)
+    resource = request.match_info.route.resource
+    labels = (resource.canonical if resource is not None else "unmatched",)
+    start = time.perf_counter()
+    response = await handler(request)
+    http_seconds.observe(time.perf_counter() - start, labels)
+    http_received_bytes.inc(request.content_length or 0, labels)
+    # streamed responses are sent by now, others are sent after the middleware returns
+    http_sent_bytes.inc(response.body_length if response.prepared else response.content_length or 0, labels)
+    return response
+
+
+async def send_keep_alive():
     node.peer_timeout_update()
     data = {"node_address": node.host,
-            "time": time.time()}
-    msg = node.create_message(data)
+            "time": time.time(),
+            "height": len(node.blockchain.chain) - 1,
+            "work": node.blockchain.total_work()}
 
-    for peer in node.peers:
-        try:
-            requests.post(peer + "/keep_alive", data=json.dumps(msg), headers=consts.json_headers)
-        except requests.exceptions.ConnectionError:
-            pass
+    # unreachable peers are aged out by peer_timeout_update, backed off peers are probed too
+    await run_blocking(node.broadcast, "keep_alive", message_encoder(data), list(node.peers))
 
 
-@app.route('/keep_alive', methods=['POST'])
-def receive_keep_alive():
-    msg = request.get_json()["msg"]
-    if node.verify_message(request.get_json()):
+@routes.post('/keep_alive')
+async def receive_keep_alive(request):
+    fmt, body = await read_body(request)
+    msg = await signed_messages.submit((body, fmt))
+    if msg is not None:
         node.peer_keep_alive_update(msg)
-        return "Keep alive received", 200
-    return "Signature verification failed",400
+        return web.Response(text="Keep alive received")
+    return web.Response(text="Signature verification failed", status=400)
+
+
+def add_transactions(transactions: list) -> tuple:
+    """
+    Add valid transactions to mempool, duplicates of pending transactions are skipped
+    :param transactions: list of transaction dicts
+    :return: (list of added transactions, number of duplicates, number of invalid transactions)
+    """
+    added = []
+    duplicates = 0
+    invalid = 0
+    for tx_data in transactions:
+        if not transaction_valid(tx_data):
+            invalid += 1
+        elif node.blockchain.add_new_transaction(tx_data):
+            added.append(tx_data)
+        else:
+            duplicates += 1
+    return added, duplicates, invalid
+
+
+def announce_transactions(transactions: list):
+    """
+    Send batch of transactions to gossip peers, called by gossip buffer
+    Failed requests are counted by the transport in peer_request_failures_total
+    """
+    node.broadcast("announce_transactions", lambda fmt: wire.dumps(transactions, fmt), node.gossip_peers())
+
+
+@routes.post('/new_transaction')
+async def new_transaction(request):
+    tx_data = await request.json()
+    if not transaction_valid(tx_data):
+        return web.Response(text="Invalid transaction data", status=404)
+
+    if not await owner.call(node.blockchain.add_new_transaction, tx_data):
+        return web.Response(text="Transaction already pending")
+
+    # announce transaction to other nodes, batched with other new transactions
+    gossip.add([tx_data])
+    return web.Response(text="Success", status=201)
+
+
+@routes.post('/new_transactions')
+async def new_transactions(request):
+    """
+    Accept array of transactions from client
+    """
+    transactions = await request.json()
+    if not isinstance(transactions, list):
+        return web.Response(text="Invalid data, expected array of transactions", status=400)
+
+    added, duplicates, invalid = await owner.call(add_transactions, transactions)
+    gossip.add(added)
+    return web.json_response({"accepted": len(added), "duplicates": duplicates, "invalid": invalid},
+                             status=201 if added else 200)
+
+
+@routes.post('/announce_transaction')
+async def announce_transaction(request):
+    tx_data = await request.json()
+    if not transaction_valid(tx_data):
+        return web.Response(text="Invalid transaction data", status=404)
+
+    if not await owner.call(node.blockchain.add_new_transaction, tx_data):
+        return web.Response(text="Transaction already pending")
+    return web.Response(text="Success", status=201)
+
+
+@routes.post('/announce_transactions')
+async def announce_transactions_batch(request):
+    """
+    Receive batch of transactions announced by peer
+    """
+    fmt, body = await read_body(request)
+    transactions = wire.loads(body, fmt)
+    if not isinstance(transactions, list):
+        return web.Response(text="Invalid data, expected array of transactions", status=400)
+
+    added, duplicates, invalid = await owner.call(add_transactions, transactions)
+    if node.relays_gossip:
+        gossip.add(added)
+    return web.json_response({"accepted": len(added), "duplicates": duplicates, "invalid": invalid},
+                             status=201 if added else 200)
+
+
+@routes.get('/chain')
+async def get_chain(request):
+    """
+    Stream blocks of chain, optionally `limit` blocks starting at id `from`
+    The response is one JSON object, or one block per line with `format=ndjson` or Accept: application/x-ndjson,
+    or msgpack encoded blocks following each other with Accept: application/msgpack.
+    Blocks are read and written in chunks of consts.chain_stream_batch, so memory does not grow with the chain.
+    A chain switched while streaming shows as blocks not linking to the previous ones, receivers validate links.
+    Bodies of pruned blocks are read from the archive, requests starting below archived and kept bodies fail
+    with 410 Gone, such chains are joined from /snapshot.
+    """
+    length = len(node.blockchain.chain)
+    start = max(query_arg(request, 'from', 0), 0)
+    limit = query_arg(request, 'limit', None)
+    stop = length if limit is None else min(length, start + max(limit, 0))
+    if start < stop and start < node.blockchain.available_from():
+        return web.json_response({"message": "blocks were pruned", "available_from": node.blockchain.available_from()},
+                                 status=410)
+    accept = request.headers.get('Accept', '')
+    if wire.MSGPACK in node.formats and wire.format_of(accept) == wire.MSGPACK:
+        mode = wire.MSGPACK
+    elif request.query.get('format') == 'ndjson' or 'application/x-ndjson' in accept:
+        mode = 'ndjson'
+    else:
+        mode = wire.JSON
+
+    response = web.StreamResponse()
+    response.content_type = {wire.MSGPACK: wire.content_types[wire.MSGPACK], 'ndjson': 'application/x-ndjson',
+                             wire.JSON: 'application/json'}[mode]
+    await response.prepare(request)
+    if mode == wire.JSON:
+        await response.write(b'{"length": %d, "from": %d, "chain": [' % (length, start))
+    # JSON is written from the cached encodings of recent sealed blocks instead of re-encoding every block
+    for batch_start in range(start, stop, consts.chain_stream_batch):
+        blocks = node.blockchain.bodies(batch_start, min(stop, batch_start + consts.chain_stream_batch))
+        if mode == wire.MSGPACK:
+            chunk = b''.join(wire.encode_block(block, mode) for block in blocks)
+        elif mode == 'ndjson':
+            chunk = b''.join(block.encoded() + b'\n' for block in blocks)
+        else:
+            chunk = (b', ' if batch_start > start else b'') + b', '.join(block.encoded() for block in blocks)
+        await response.write(chunk)
+    if mode == wire.JSON:
+        await response.write(b']}')
+    await response.write_eof()
+    return response
+
+
+def tip_data() -> dict:
+    last_block = node.blockchain.last_block()
+    return {"height": last_block.id, "hash": last_block.hash, "work": node.blockchain.total_work()}
+
+
+@routes.get('/tip')
+async def get_tip(request):
+    return web.json_response(tip_data())
+
+
+@routes.get('/events')
+async def stream_events(request):
+    """
+    Server-Sent Events stream of chain changes, a `tip` event with height, hash and work is sent on connect and
+    whenever the tip changes, blocks added while an event is written are reported by one event of the latest tip.
+    Comments keep idle connections open. Browsers of other origins may subscribe.
+    """
+    response = web.StreamResponse(headers={'Content-Type': "text/event-stream", 'Cache-Control': "no-cache",
+                                           'Access-Control-Allow-Origin': "*"})
+    await response.prepare(request)
+    seen = None
+    try:
+        while not tip_changed.closed:
+            version = await tip_changed.wait(seen, consts.events_keep_alive)
+            if tip_changed.closed:
+                break
+            if version == seen:
+                await response.write(b': keep-alive\n\n')
+                continue
+            seen = version
+            await response.write(b'event: tip\ndata: %s\n\n' % json.dumps(tip_data()).encode())
+    except ConnectionResetError:
+        pass  # subscriber went away
+    return response
+
+
+@routes.get('/headers')
+async def get_headers(request):
+    """
+    Return block headers without transactions, `limit` headers starting at id `from`, limit is capped by
+    consts.sync_page_size
+    """
+    start = max(query_arg(request, 'from', 0), 0)
+    limit = min(max(query_arg(request, 'limit', consts.sync_page_size), 0), consts.sync_page_size)
+
+    headers = []
+    for block in node.blockchain.chain[start:start + limit]:
+        header = block.header()
+        header["hash"] = block.hash
+        headers.append(header)
+    return web.json_response({"headers": headers})
+
+
+@routes.get('/tx_proof/{tx_hash}')
+async def get_transaction_proof(request):
+    """
+    Return header of block containing transaction and Merkle proof of its inclusion
+    """
+    tx_hash = request.match_info['tx_hash']
+    location = node.blockchain.index.locate(tx_hash)
+    if location is None:
+        if not node.blockchain.index.ready:
+            return index_not_ready()
+        return web.json_response({"message": "transaction not found"}, status=404)
+    if location[0] < node.blockchain.pruned_height:
+        return web.json_response({"message": "block of transaction was pruned", "block": location[0]}, status=410)
+    block = node.blockchain.chain[location[0]]
+    index, proof = block.transaction_proof(tx_hash)
+    header = block.header()
+    header["hash"] = block.hash
+    return web.json_response({"header": header, "index": index, "proof": proof})
+
+
+@routes.get('/tx/{tx_hash}')
+async def get_transaction(request):
+    """
+    Return transaction of chain by hash together with id of its block and position in it
+    """
+    location = node.blockchain.index.locate(request.match_info['tx_hash'])
+    if location is None:
+        if not node.blockchain.index.ready:
+            return index_not_ready()
+        return web.json_response({"message": "transaction not found"}, status=404)
+    block_id, position = location
+    if block_id < node.blockchain.pruned_height:
+        return web.json_response({"message": "block of transaction was pruned", "block": block_id,
+                                  "position": position}, status=410)
+    return web.json_response({"block": block_id, "position": position,
+                              "transaction": node.blockchain.chain[block_id].transactions[position]})
+
+
+@routes.get('/snapshot')
+async def get_snapshot(request):
+    """
+    Return signed snapshot of latest checkpoint, new nodes start from it and the headers up to it
+    The state owner only copies the transaction index, the message is built and signed on the executor
+    once per checkpoint and served from cache afterwards.
+    """
+    address = host_url(request)
+    if not node.blockchain.index.ready:
+        return index_not_ready()
+    async with snapshot_lock:
+        point = await owner.call(node.snapshot_checkpoint)
+        if point is None:
+            return web.json_response({"message": "no checkpoint yet"}, status=404)
+        body = node.cached_snapshot(point, address)
+        if body is None:
+            source = await owner.call(snapshot_source, node.blockchain, point[0])
+            body = await run_blocking(node.sign_snapshot, source, address)
+    return web.Response(body=body, content_type='application/json')
+
+
+def index_not_ready() -> web.Response:
+    """
+    Response of queries needing the whole transaction index while blocks stored before start are indexed
+    """
+    return web.json_response({"message": "transaction index is being built"}, status=503,
+                             headers={'Retry-After': "1"})
+
+
+def page_args(request: web.Request) -> tuple:
+    """
+    Return pagination arguments `offset` and `limit` of request, limit is capped by consts.query_max_page_size
+    """
+    offset = max(query_arg(request, 'offset', 0), 0)
+    limit = query_arg(request, 'limit', consts.query_page_size)
+    return offset, min(max(limit, 0), consts.query_max_page_size)
+
+
+@routes.get('/messages/author/{author}')
+async def get_messages_by_author(request):
+    """
+    Return page of messages of author in chain order
+    """
+    author = request.match_info['author']
+    offset, limit = page_args(request)
+    if not node.blockchain.index.ready:
+        return index_not_ready()
+    total, messages = node.blockchain.index.by_author(author, offset, limit)
+    return web.json_response({"author": author, "total": total, "offset": offset, "messages": messages})
+
 
+@routes.get('/messages')
+async def get_messages(request):
+    """
+    Return page of messages with `start` <= time < `end` ordered by time, bounds are optional
+    """
+    start = query_arg(request, 'start', type=float)
+    end = query_arg(request, 'end', type=float)
+    offset, limit = page_args(request)
+    if not node.blockchain.index.ready:
+        return index_not_ready()
+    total, messages = node.blockchain.index.by_time(start, end, offset, limit)
+    return web.json_response({"start": start, "end": end, "total": total, "offset": offset,
+                              "messages": messages})
 
-@app.route('/new_transaction', methods=['POST'])
-def new_transaction():
-    tx_data = request.get_json()
-    required_fields = ["author", "content"]
 
-    for field in required_fields:
-        if not tx_data.get(field):
-            return "Invalid transaction data", 404
+@routes.get('/pending_transactions')
+async def get_pending_transactions(request):
+    return web.json_response({"count": len(node.blockchain.mempool),
+                              "unconfirmed_transactions": node.blockchain.mempool.take()})
 
-    node.blockchain.add_new_transaction(tx_data)
 
-    # announce transaction to other nodes
-    for peer in node.peers:
-        print(f"announcing transaction to node: {peer}")
-        requests.post(peer + "/announce_transaction", data=json.dumps(tx_data), headers=consts.json_headers)
-    return "Success", 201
+@routes.get('/pending_transactions/count')
+async def get_pending_transactions_count(request):
+    return web.json_response({"count": len(node.blockchain.mempool)})
 
 
-@app.route('/announce_transaction', methods=['POST'])
-def announce_transaction():
-    tx_data = request.get_json()
-    required_fields = ["author", "content"]
+@routes.get('/mining_stats')
+async def get_mining_stats(request):
+    miner = node.blockchain.miner
+    return web.json_response({"workers": miner.workers,
+                              "hash_rate": miner.hash_rate(),
+                              "per_worker": miner.last_stats})
 
-    for field in required_fields:
-        if not tx_data.get(field):
-            return "Invalid transaction data", 404
 
-    node.blockchain.add_new_transaction(tx_data)
-    return "Success", 201
+@routes.get('/metrics')
+async def get_metrics(request):
+    return web.Response(body=metrics.render().encode(),
+                        headers={'Content-Type': "text/plain; version=0.0.4; charset=utf-8"})
 
 
-@app.route('/chain', methods=['GET'])
-def get_chain():
-    chain_data = []
-    for block in node.blockchain.chain:
-        chain_data.append(block.__dict__)
-    return {"length": len(chain_data), "chain": chain_data}
+@routes.post('/profiler/start')
+async def start_profiler(request):
+    """
+    Start sampling profiler, optional query arguments interval in seconds and reset=1 dropping earlier samples
+    """
+    interval = query_arg(request, "interval", consts.profiler_interval, float)
+    if not metrics.profiler.min_interval <= interval < float('inf'):
+        return web.json_response({"message": f"interval has to be at least {metrics.profiler.min_interval} seconds"},
+                                 status=400)
+    if query_arg(request, "reset", 0):
+        metrics.profiler.reset()
+    started = metrics.profiler.start(interval)
+    return web.json_response({"running": True, "started": started, "interval": metrics.profiler.interval})
+
 
+@routes.post('/profiler/stop')
+async def stop_profiler(request):
+    stopped = await run_blocking(metrics.profiler.stop)
+    return web.json_response({"running": False, "stopped": stopped, "samples": metrics.profiler.samples})
 
-@app.route('/pending_transactions', methods=['GET'])
-def get_pending_transactions():
-    return json.dumps({"unconfirmed_transactions": node.blockchain.unconfirmed_transactions})
 
+@routes.get('/profiler')
+async def get_profile(request):
+    """
+    Return samples as collapsed stacks, input of flame graph tools
+    """
+    return web.Response(text=metrics.profiler.collapsed())
 
-@app.route('/peers', methods=['GET'])
-def return_peers():
-    return json.dumps({"peers": node.peers})
 
+@routes.get('/peers')
+async def return_peers(request):
+    """
+    Return known peers and their health: round trip time, failure rate, remaining backoff and reported tip
+    """
+    return web.json_response({"peers": node.peers, "health": node.peer_table.snapshot()})
 
-@app.route('/mine', methods=['GET'])
-def mine_unconfirmed_transactions():
-    if len(node.blockchain.unconfirmed_transactions) != 0:
-        result = node.blockchain.mine()
 
-        # Making sure we have the longest chain before announcing to the network
-        chain_length = len(node.blockchain.chain) - 1
-        consensus()
-        if chain_length == len(node.blockchain.chain):
-            # announce the recently mined block to the network
-            announce_new_block(node.blockchain.last_block())
-            return "Block #{} is mined.".format(result)
+async def mine():
+    """
+    Mine block of pending transactions, proof of work runs on pow_executor while requests are served
+    :return: id of mined block, None if there were no transactions, False if mining was cancelled
+    """
+    async with mining_lock:
+        block = await owner.call(node.blockchain.new_block)
+        if block is None:
+            return None
+        # Only this coroutine refers to the new block until it is added
+        block.hash = await asyncio.get_running_loop().run_in_executor(pow_executor, node.blockchain.proof_of_work,
+                                                                       block)
+        if block.hash is None:
+            return False
+
+        def add():
+            return node.blockchain.add_block(block) and node.blockchain.last_block() is block
+
+        return block.id if await owner.call(add) else False
+
+
+@routes.get('/mine')
+async def mine_unconfirmed_transactions(request=None):
+    result = await mine()
+    if result is None:
+        return web.Response(text="No transactions to mine")
+    if not result:
+        return web.Response(text="Mining was cancelled")
+
+    # Making sure we have the longest chain before announcing to the network
+    last_hash = node.blockchain.last_block().hash
+    await consensus()
+    if last_hash == node.blockchain.last_block().hash:
+        # announce the recently mined block to the network
+        await announce_new_block(node.blockchain.last_block())
+        return web.Response(text="Block #{} is mined.".format(result))
+    return web.Response(text="Block #{} was replaced by longer chain of peer.".format(result))
+
+
+async def mine_pending():
+    """
+    Mine blocks while there are pending transactions, the target keeps blocks consts.block_interval apart
+    """
+    while len(node.blockchain.mempool):
+        await mine_unconfirmed_transactions()
 
 
-@app.route('/update_peers', methods=['POST'])
-def update_peers():
-    print(f"received update peers {request.get_json()}")
-    msg = request.get_json()["msg"]
-    if node.verify_message(request.get_json()):
-        if "peers" not in msg:
-            return "Invalid data", 400
-        for p in [p for p in msg["peers"] if p["node_address"] != request.host_url]:
-            node.peer_management([p])
-        return "Peers updated"
+@routes.post('/update_peers')
+async def update_peers(request):
+    fmt, body = await read_body(request)
+    msg = await signed_messages.submit((body, fmt))
+    if msg is not None:
+        if not isinstance(msg.get("peers"), list):
+            return web.Response(text="Invalid data", status=400)
+        logger.debug("received %d peers from node %s", len(msg["peers"]), msg.get("node_address"))
+        # invalid entries are skipped, the other peers are still added
+        node.peer_management([p for p in msg["peers"]
+                              if not isinstance(p, dict) or p.get("node_address") != host_url(request)])
+        return web.Response(text="Peers updated")
+    return web.Response(text="Signature verification failed", status=400)
 
 
 # Endpoint to add new peers to the network
-@app.route('/register_node', methods=['POST'])
-def register_new_peers():
-    node.host = request.host_url
+@routes.post('/register_node')
+async def register_new_peers(request):
+    node.host = host_url(request)
 
-    data = request.get_json()["msg"]
-    if list(data.keys()).sort() != consts.register_node_fields.sort():
-        return "Invalid data", 400
+    data = (await request.json())["msg"]
+    if not all(field in data for field in consts.register_node_fields):
+        return web.Response(text="Invalid data", status=400)
 
     # Add the node to the peer list
-    node.peer_management([data])
+    if node.peer_management([data]):
+        return web.Response(text="Invalid data, public key or signature scheme is not supported", status=400)
 
+    peers = node.peers
     peers_to_announce = []
-    for p in node.peers:
+    for p in peers:
         peer_dict = {}
         peer_dict["node_address"] = p
-        peer_dict["public_key"] = node.peers[p]["public_key"]
+        peer_dict["public_key"] = peers[p]["public_key"]
+        peer_dict["scheme"] = peers[p]["scheme"]
+        peer_dict["formats"] = peers[p]["formats"]
         peers_to_announce.append(peer_dict)
 
-    print(f"peers to announce: {peers_to_announce}")
+    logger.debug("announcing %d peers", len(peers_to_announce))
     # Announce node to peers
     data_to_send = {"node_address": node.host,
                     "peers": peers_to_announce}
 
+    await run_blocking(node.broadcast, "update_peers", message_encoder(data_to_send),
+                       [p for p in node.peers if p != data["node_address"]])
 
-    msg = node.create_message(data_to_send)
-    for peer in [p for p in node.peers if p != data["node_address"]]:
-        requests.post(peer + "/update_peers", data=json.dumps(msg), headers=consts.json_headers)
-
-    # Return the blockchain to the newly registered node so that it can sync
+    # The newly registered node syncs the blockchain on its own through /tip, /headers and /chain
     data_to_send = {"node_address": node.host,
                     "public_key": node.public_key,
-                    "blockchain": get_chain(),
+                    "scheme": node.scheme.name,
+                    "formats": node.formats,
                     "peers": peers_to_announce}
     msg = node.create_message(data_to_send)
-    return json.dumps(msg)
+    return web.json_response(msg)
 
 
-@app.route('/register_with', methods=['POST'])
-def register_with_existing_node():
+@routes.post('/register_with')
+async def register_with_existing_node(request):
     """
     Internally calls the `register_node` endpoint to
     register current node with the remote node specified in the
     request, and sync the blockchain as well with the remote node.
     """
-    node.host = request.host_url
-    node_address = request.get_json()["node_address"]
+    node.host = host_url(request)
+    node_address = (await request.json())["node_address"]
     if not node_address:
-        return "Invalid data", 400
+        return web.Response(text="Invalid data", status=400)
 
-    data = {"node_address": request.host_url,
-            "public_key": node.public_key}
+    data = {"node_address": node.host,
+            "public_key": node.public_key,
+            "scheme": node.scheme.name,
+            "formats": node.formats}
     msg = node.create_message(data)
 
     # Make a request to register with remote node and obtain information
-    response = requests.post(node_address + "/register_node", data=json.dumps(msg), headers=consts.json_headers)
+    try:
+        response = await run_blocking(node.transport.post, node_address, "register_node", msg)
+    except requests.exceptions.RequestException as e:
+        return web.Response(text=f"Node {node_address} is unreachable: {e}", status=502)
 
     if response.status_code == 200:
         data = response.json()["msg"]
-        chain_dump = data.pop("blockchain")['chain']
-        # update chain and the peers
-        node.peer_management([data])
-        for p in [p for p in data["peers"] if p["node_address"] != request.host_url]:
-            node.peer_management([p])
-
-        # Sync blockchain
-        node.blockchain = node.create_chain_from_dump(chain_dump)
-        return "Registration successful", 200
+        # update chain and the peers, invalid entries of other peers are skipped
+        if node.peer_management([data]):
+            return web.Response(text=f"Node {node_address} sent invalid registration data", status=502)
+        node.peer_management([p for p in data.get("peers", [])
+                              if not isinstance(p, dict) or p.get("node_address") != node.host])
+
+        # Sync blockchain, only blocks after the fork point are downloaded, a new node starts from the snapshot
+        # of the remote node or takes over its genesis block
+        snapshot = await bootstrap_with(node_address) if consts.snapshot_bootstrap else None
+        error = await join_chain(node_address)
+        available_from = pruned_from(error)
+        if available_from is not None and snapshot is None and await bootstrap_with(node_address) is not None:
+            # remote node pruned blocks this node lacks, its chain is joined from its snapshot instead
+            error = await join_chain(node_address)
+            available_from = pruned_from(error)
+        if available_from is not None:
+            return web.json_response({"message": f"Node {node_address} pruned blocks this node lacks",
+                                      "available_from": available_from}, status=502)
+        if error is not None:
+            return web.Response(text=f"Synchronizing with node {node_address} failed: {error!r}", status=502)
+        return web.Response(text="Registration successful")
     else:
         # if something goes wrong, pass it on to the API response
-        return response.content, response.status_code
+        return web.Response(body=response.content, status=response.status_code)
 
 
-@app.route('/add_block', methods=['POST'])
-def verify_and_add_block():
-    block_data = request.get_json()
-    block = Block(block_data["id"],
-                  block_data["transactions"],
-                  block_data["timestamp"],
-                  block_data["previous_hash"],
-                  block_data["nonce"])
-    block.hash = block_data['hash']
-    added = node.blockchain.add_block(block)
-
+async def bootstrap_with(node_address: str):
+    """
+    Take over headers and transaction index of the signed snapshot of node, see bootstrap_from_peer
+    :param node_address: address of registered node
+    :return: snapshot dict or None if chain was not bootstrapped
+    """
+    try:
+        snapshot = await run_blocking(bootstrap_from_peer, node.blockchain, node.transport, node_address,
+                                      node.open_message, owner.call_threadsafe)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning("bootstrapping from snapshot of node %s failed: %s", node_address, e)
+        return None
+    if snapshot is not None:
+        node.save_bootstrap(snapshot)
+        logger.info("bootstrapped from snapshot of block #%d of node %s", snapshot['height'], node_address)
+    return snapshot
+
+
+async def join_chain(node_address: str):
+    """
+    Take over genesis block of node if chain has no other blocks and sync with node
+    :param node_address: address of registered node
+    :return: None if synced, otherwise the raised exception, e.g. HTTPError of blocks the node pruned
+    """
+    try:
+        await run_blocking(adopt_genesis, node.blockchain, node.transport, node_address, owner.call_threadsafe,
+                           node.peer_format(node_address))
+        await sync_with(node_address)
+    except requests.exceptions.RequestException as e:
+        return e
+    except (LookupError, ValueError, TypeError) as e:
+        node.peer_table.record_failure(node_address)  # malformed data, see consensus
+        return e
+    return None
+
+
+def pruned_from(error):
+    """
+    Return first block a peer still serves if error is its 410 Gone answer for pruned blocks, see get_chain
+    :param error: exception returned by join_chain or None
+    :return: block id or None for other errors
+    """
+    response = getattr(error, 'response', None)
+    if response is None or response.status_code != 410:
+        return None
+    try:
+        return int(response.json()["available_from"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+@routes.post('/add_block')
+async def verify_and_add_block(request):
+    fmt, body = await read_body(request)
+    try:
+        block = wire.decode_block(body, fmt)
+    except ValueError as e:
+        return web.Response(text=f"Invalid block data: {e}", status=400)
+
+    def add():
+        return node.blockchain.add_block(block), node.blockchain.last_block() is block
+
+    added, tip = await owner.call(add)
     if not added:
-        return "The block was discarded by the node", 400
-    return "Block added to the chain", 201
+        if block.id >= len(node.blockchain.chain):
+            # parent is unknown, a peer is ahead, e.g. announcements of earlier blocks took another path
+            run_in_background(catch_up())
+        return web.Response(text="The block was discarded by the node", status=400)
+    if tip and node.relays_gossip:
+        run_in_background(announce_new_block(block))
+    return web.Response(text="Block added to the chain", status=201)
+
 
+def run_in_background(coroutine) -> None:
+    task = asyncio.create_task(coroutine)
+    background.add(task)
+    task.add_done_callback(background.discard)
 
-def announce_new_block(block):
+
+async def anti_entropy():
+    """
+    Ask sync peers for their tips when announcements reach only some peers, catches up with blocks
+    whose announcements missed this node
+    """
+    if node.relays_gossip:
+        await catch_up()
+
+
+async def catch_up():
+    """
+    Run consensus, requests while it runs are merged into one more run, since tips may have been
+    asked before the block announced last
+    """
+    catch_up_requested.set()
+    if catch_up_lock.locked():
+        return
+    async with catch_up_lock:
+        while catch_up_requested.is_set():
+            catch_up_requested.clear()
+            await consensus()
+
+
+async def announce_new_block(block):
     """
     A function to announce to the network once a block has been mined.
     Other blocks can simply verify the proof of work and add it to their
-    respective chains.
+    respective chains. The block is sent to gossip peers, which relay it in large networks.
+    Failed requests are counted by the transport in peer_request_failures_total
     """
-    for peer in node.peers:
-        url = f"{peer}add_block"
-        requests.post(url, data=json.dumps(block.__dict__, sort_keys=True), headers=consts.json_headers)
+    await run_blocking(node.broadcast, "add_block", lambda fmt: wire.encode_block(block, fmt), node.gossip_peers())
+
 
-def consensus():
+async def sync_with(peer: str) -> bool:
     """
-    If a longer valid chain is found, chain is replaced with it.
+    Stream blocks of peer on the default executor, received blocks are validated and added through owner
+    :param peer: peer address
+    :return: True if last block of chain changed
     """
+    return await run_blocking(sync_with_peer, node.blockchain, node.transport, peer, owner.call_threadsafe,
+                              node.peer_format(peer))
 
-    longest_chain = node.blockchain.chain
-    current_len = len(longest_chain)
 
-    for peer in node.peers:
-        response = requests.get(f'{peer}/chain')
-        length = response.json()['length']
-        chain = response.json()['chain']
-        peer_blockchain = node.create_chain_from_dump(chain)
-        if length >= current_len and node.blockchain.check_chain_validity(peer_blockchain.chain):
-            current_len = length
-            longest_chain = chain
+async def consensus():
+    """
+    If a valid chain with more work is found, chain is replaced with it.
+    Peers only report their tip, blocks after the fork point are downloaded from the peer with most work.
+    Only the fastest peers and peers which reported more work are asked, see Node.sync_peers.
+    """
+    def ask(peer):
+        try:
+            tip = peer_tip(node.transport, peer)
+        except ValueError:
+            # malformed tip, the peer fails like an unreachable one
+            node.peer_table.record_failure(peer)
+            sync_failures.inc(1, (peer, "malformed"))
+            raise
+        node.peer_table.record_tip(peer, tip["height"], tip["work"])
+        return tip["work"]
+
+    tips, _ = await run_blocking(node.transport.gather, node.sync_peers(node.blockchain.total_work()), ask)
+
+    for peer, work in sorted(tips.items(), key=lambda tip: tip[1], reverse=True):
+        if work <= node.blockchain.total_work():
+            break
+        try:
+            if await sync_with(peer):
+                return True
+        except requests.exceptions.RequestException:
+            sync_failures.inc(1, (peer, "unreachable"))
+        except (ValueError, KeyError, TypeError) as e:
+            # malformed tip, header or block, the peer fails like an unreachable one and the next peer is asked
+            node.peer_table.record_failure(peer)
+            sync_failures.inc(1, (peer, "malformed"))
+            logger.warning("synchronizing with node %s failed, it sent malformed data: %r", peer, e)
+    return False
+
+
+async def prune_chain():
+    """
+    Drop bodies of blocks below the checkpoint consts.prune_depth blocks below the last block
+    """
+    height = checkpoint(len(node.blockchain.chain) - 1 - consts.prune_depth, consts.snapshot_interval)
+    pruned = await owner.call(node.blockchain.prune, height)
+    if pruned:
+        pruned_blocks.inc(pruned)
 
-    node.blockchain.chain = longest_chain
 
+async def build_index():
+    """
+    Index blocks stored before start in steps of consts.index_build_batch through owner, requests are
+    served between the steps. Until then transactions of stored blocks are not located, pending ones
+    are still deduplicated by the mempool.
+    """
+    while not await owner.call(node.blockchain.index.build, consts.index_build_batch):
+        pass
+
+
+async def close_event_streams(app):
+    tip_changed.close()
 
-sched.add_job(send_keep_alive, 'interval', seconds=consts.keep_alive_timeout)
-sched.add_job(mine_unconfirmed_transactions, 'interval', seconds=consts.block_timeout)
-sched.start()
+
+async def background_tasks(app):
+    """
+    Start state owner and periodic tasks with the server, cancel them and release resources on shutdown
+    """
+    owner.start()
+    tasks = [asyncio.create_task(periodic(consts.keep_alive_timeout, send_keep_alive, "keep alive")),
+             asyncio.create_task(periodic(consts.mining_idle_interval, mine_pending, "mining")),
+             asyncio.create_task(periodic(consts.sync_interval, anti_entropy, "anti entropy")),
+             asyncio.create_task(build_index())]
+    if consts.prune_depth is not None:
+        tasks.append(asyncio.create_task(periodic(consts.prune_interval, prune_chain, "pruning")))
+    yield
+    node.blockchain.miner.cancel()
+    metrics.profiler.stop()
+    for task in tasks + list(background):
+        task.cancel()
+    await asyncio.gather(*tasks, *background, return_exceptions=True)
+    await run_blocking(gossip.flush)  # pending announcements go out before the transport is closed
+    await owner.stop()
+    pow_executor.shutdown()
+    node.close()
+
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[measure_requests])
+    app.add_routes(routes)
+    app.cleanup_ctx.append(background_tasks)
+    app.on_shutdown.append(close_event_streams)
+    return app
+
+
+gossip = GossipBuffer(announce_transactions, consts.gossip_max_delay, consts.gossip_max_batch)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,247 @@
+"""
+Benchmark suite of core node operations, results are written as JSON so runs can be compared.
+
+Every case runs a fixed amount of work per round, the median of the rounds is reported:
+  compute_hash            hash of block header, Merkle root of transactions included
+  proof_of_work           mining blocks at consts.difficulty
+  add_block               validating and appending blocks to an in-memory chain
+  create_chain_from_dump  rebuilding a chain from the JSON dump received from a peer
+  sign, verify            signing and verifying peer messages with consts.signature_scheme
+  peers                   serializing the peer list sent to registering nodes
+
+Usage: python bench.py [--rounds R] [--scale X] [--case NAME ...] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import consts
+from bench_pow import make_transactions
+from block import Block
+from blockchain import BlockChain
+from crypto import SignatureVerifier, load_public_key
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def node_blockchain() -> BlockChain:
+    """Empty chain with target and block size rules of nodes"""
+    return BlockChain(consts.difficulty, block_interval=consts.block_interval,
+                      retarget_interval=consts.retarget_interval, max_block_size=consts.max_block_size)
+
+
+def make_chain(count: int, transactions_per_block: int) -> list:
+    """
+    Valid chain of count blocks mined at consts.difficulty, blocks are consts.block_interval apart and the
+    last one is dated now, so nodes do not reject the chain for timestamps ahead of their clock
+    """
+    genesis = Block(0, [], time.time() - (count - 1) * consts.block_interval, BlockChain.genesis_block_previous_hash)
+    genesis.hash = genesis.compute_hash()
+    blockchain = node_blockchain()
+    blockchain.replace_suffix(0, [genesis])
+    transactions = make_transactions((count - 1) * transactions_per_block)
+    for i in range(1, count):
+        block = Block(i, transactions[(i - 1) * transactions_per_block:i * transactions_per_block],
+                      blockchain.chain[0].timestamp + i * consts.block_interval, blockchain.last_block().hash)
+        block.hash = blockchain.proof_of_work(block)
+        assert blockchain.add_block(block)
+    return list(blockchain.chain)
+
+
+def unsealed(block: Block) -> Block:
+    return Block(block.id, block.transactions, block.timestamp, block.previous_hash, block.nonce, block.hash,
+                 target=block.target)
+
+
+class Suite:
+    """
+    Benchmark cases sharing expensive fixtures, e.g. the mined chain and the node with its keys
+    """
+
+    def __init__(self, scale: float) -> None:
+        self.scale = scale
+        self._chain = None
+        self._node = None
+
+    def size(self, n: int) -> int:
+        return max(1, int(n * self.scale))
+
+    @property
+    def chain(self) -> list:
+        if self._chain is None:
+            self._chain = make_chain(self.size(1000), 10)
+        return self._chain
+
+    @property
+    def node(self):
+        if self._node is None:
+            consts.block_store_dir = None
+            from node import Node
+            self._node = Node()
+        return self._node
+
+    # Every case returns (params, number of operations, function doing them), cases are set up again
+    # for every round since blocks are sealed when added, setup is not timed
+
+    def case_compute_hash(self):
+        block = unsealed(make_chain(2, 100)[1])
+        count = self.size(5000)
+
+        def run():
+            for _ in range(count):
+                block.compute_hash()
+        return {"transactions": len(block.transactions)}, count, run
+
+    def case_proof_of_work(self):
+        blockchain = BlockChain(consts.difficulty)
+        transactions = make_transactions(10)
+        count = self.size(20)
+
+        def run():
+            for i in range(count):
+                assert blockchain.proof_of_work(Block(1, transactions, time.time() + i, '0' * 64)) is not None
+        return {"difficulty": consts.difficulty, "transactions": len(transactions)}, count, run
+
+    def case_add_block(self):
+        chain = self.chain
+        blocks = [unsealed(block) for block in chain[1:]]
+        blockchain = node_blockchain()
+        blockchain.replace_suffix(0, [chain[0]])
+
+        def run():
+            for block in blocks:
+                assert blockchain.add_block(block)
+        return {"difficulty": consts.difficulty, "transactions": 10}, len(blocks), run
+
+    def case_create_chain_from_dump(self):
+        dump = [json.loads(block.encoded()) for block in self.chain]
+        node = self.node
+
+        def run():
+            assert len(node.create_chain_from_dump(dump).chain) == len(dump)
+        return {"blocks": len(dump), "transactions": 10}, len(dump), run
+
+    def case_sign(self):
+        node = self.node
+        message = json.dumps({"node_address": "http://127.0.0.1:8000/", "time": time.time()}, sort_keys=True)
+        count = self.size(500)
+
+        def run():
+            for _ in range(count):
+                node.sign(message)
+        return {"scheme": node.scheme.name}, count, run
+
+    def case_verify(self):
+        node = self.node
+        message = json.dumps({"node_address": "http://127.0.0.1:8000/", "time": time.time()}, sort_keys=True)
+        signature = node.sign_bytes(message.encode())
+        key = load_public_key(node.public_key, node.scheme.name)
+        verifier = SignatureVerifier(cache_size=0)  # every call verifies, nothing is cached
+        count = self.size(500)
+
+        def run():
+            for _ in range(count):
+                assert verifier.verify(message.encode(), signature, key)
+        return {"scheme": node.scheme.name}, count, run
+
+    def case_peers(self):
+        node = self.node
+        peer_count = self.size(100)
+        node.peer_management([{"node_address": f"http://10.0.{i // 256}.{i % 256}:8000/",
+                               "public_key": node.public_key, "scheme": node.scheme.name,
+                               "formats": node.formats} for i in range(peer_count)])
+        count = self.size(200)
+
+        def run():
+            for _ in range(count):
+                json.dumps(node.peers)
+        return {"peers": peer_count}, count, run
+
+    def cases(self) -> dict:
+        return {name[len('case_'):]: getattr(self, name) for name in dir(self) if name.startswith('case_')}
+
+    def run(self, name: str, rounds: int) -> dict:
+        seconds = []
+        params = count = None
+        for _ in range(rounds):
+            params, count, run = self.cases()[name]()
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+        median = statistics.median(seconds)
+        return {"params": params, "operations": count, "rounds": seconds,
+                "median_seconds": median, "ops_per_second": count / median, "us_per_op": median / count * 1e6}
+
+    def close(self) -> None:
+        if self._node is not None:
+            self._node.close()
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"compared with {baseline['meta'].get('commit')} from {baseline['meta'].get('date')}")
+    print(f"{'case':>23} {'baseline us/op':>15} {'us/op':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        change = (result["us_per_op"] / before["us_per_op"] - 1) * 100
+        print(f"{name:>23} {before['us_per_op']:>15.2f} {result['us_per_op']:>10.2f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies amount of work per round")
+    parser.add_argument('--case', action='append', help="run only named cases")
+    parser.add_argument('--output', help="write results to JSON file, printed to stdout if not given")
+    parser.add_argument('--compare', help="JSON file of earlier run to compare with")
+    args = parser.parse_args()
+
+    suite = Suite(args.scale)
+    names = args.case or list(suite.cases())
+    unknown = set(names) - set(suite.cases())
+    if unknown:
+        parser.error(f"unknown cases {', '.join(sorted(unknown))}, available: {', '.join(suite.cases())}")
+
+    results = {}
+    try:
+        for name in names:
+            results[name] = suite.run(name, args.rounds)
+            print(f"{name:>23}: {results[name]['us_per_op']:>10.2f} us/op, {results[name]['ops_per_second']:>10.0f} ops/s",
+                  file=sys.stderr)
+    finally:
+        suite.close()
+
+    report = {"meta": {"commit": git_commit(),
+                       "date": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "cpus": os.cpu_count(),
+                       "rounds": args.rounds,
+                       "scale": args.scale,
+                       "difficulty": consts.difficulty,
+                       "signature_scheme": consts.signature_scheme},
+              "results": results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Memory per block and /chain serialization throughput of Block against the previous __dict__ based block.
+
+Usage: python bench_block.py [number of blocks for memory benchmark] [blocks per /chain response]
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from hashlib import sha256
+
+from block import Block
+
+
+class LegacyBlock:
+    """Block implementation before __slots__ and cached encodings"""
+
+    def __init__(self, id: int, transactions: list, timestamp: float, previous_hash: str, nonce: int = 0):
+        self.id = id
+        self.transactions = transactions
+        self.nonce = nonce
+        self.previous_hash = previous_hash
+        self.timestamp = timestamp
+        self.hash = self.compute_hash()
+
+    def compute_hash(self) -> str:
+        block_dict = self.__dict__.copy()
+        block_dict.pop('hash', None)
+        return sha256(json.dumps(block_dict, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def make_transaction(i: int) -> dict:
+    return {"author": f"author{i % 100}", "content": f"message {i}", "time": float(i), "hash": f"{i:064x}"}
+
+
+def bytes_per_block(factory, count: int, with_transactions: bool = False) -> float:
+    """
+    Return bytes allocated per block, transactions are allocated before measurement unless with_transactions,
+    then transactions only the block refers to are counted as well
+    """
+    transactions = None if with_transactions else [[make_transaction(i)] for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    if with_transactions:
+        blocks = [factory(i, [make_transaction(i)]) for i in range(count)]
+    else:
+        blocks = [factory(i, transactions[i]) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(blocks) == count
+    return (after - before) / count
+
+
+def sealed_block(i: int, transactions: list) -> Block:
+    block = Block(i, transactions, float(i), '0' * 64)
+    block.seal()
+    return block
+
+
+def old_sealed_block(i: int, transactions: list) -> Block:
+    """Sealed block below the last encoded_blocks blocks of a chain"""
+    block = sealed_block(i, transactions)
+    block.release_encoding()
+    return block
+
+
+def legacy_chain_response(chain: list) -> bytes:
+    """/chain response as built before, every block dict is encoded per request"""
+    chain_data = [block.__dict__ for block in chain]
+    return json.dumps({"length": len(chain_data), "from": 0, "chain": chain_data}).encode()
+
+
+def chain_response(chain: list) -> bytes:
+    chain_data = b', '.join(block.encoded() for block in chain)
+    return b'{"length": %d, "from": %d, "chain": [' % (len(chain), 0) + chain_data + b']}'
+
+
+def throughput(func, chain: list, seconds: float = 1.0) -> float:
+    """Return serialized blocks per second"""
+    responses = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func(chain)
+        responses += 1
+    return responses * len(chain) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    chain_length = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    print(f"memory, {count} blocks with one transaction each")
+    print(f"  legacy block:          {bytes_per_block(lambda i, txs: LegacyBlock(i, txs, float(i), '0' * 64), count):8.0f} B/block")
+    print(f"  slots block:           {bytes_per_block(lambda i, txs: Block(i, txs, float(i), '0' * 64), count):8.0f} B/block")
+    print(f"  sealed slots block:    {bytes_per_block(sealed_block, count):8.0f} B/block (includes cached encoding)")
+    print(f"  with transactions, {count} blocks owning their transaction")
+    print(f"  legacy block:          "
+          f"{bytes_per_block(lambda i, txs: LegacyBlock(i, txs, float(i), '0' * 64), count, True):8.0f} B/block")
+    print(f"  slots block:           "
+          f"{bytes_per_block(lambda i, txs: Block(i, txs, float(i), '0' * 64), count, True):8.0f} B/block")
+    print(f"  sealed slots block:    {bytes_per_block(sealed_block, count, True):8.0f} B/block")
+    print(f"  old sealed slots block:{bytes_per_block(old_sealed_block, count, True):8.0f} B/block "
+          f"(encoding released)")
+
+    legacy_chain = [LegacyBlock(i, [make_transaction(i)], float(i), '0' * 64) for i in range(chain_length)]
+    chain = [sealed_block(i, [make_transaction(i)]) for i in range(chain_length)]
+    # block hashes differ since blocks commit to a Merkle root, the transactions are the same
+    assert ([b["transactions"] for b in json.loads(legacy_chain_response(legacy_chain))["chain"]] ==
+            [b["transactions"] for b in json.loads(chain_response(chain))["chain"]])
+    print(f"/chain serialization, {chain_length} blocks per response")
+    print(f"  legacy:        {throughput(legacy_chain_response, legacy_chain):10.0f} blocks/s")
+    print(f"  cached bytes:  {throughput(chain_response, chain):10.0f} blocks/s")
+    old_chain = [old_sealed_block(i, [make_transaction(i)]) for i in range(chain_length)]
+    print(f"  released:      {throughput(chain_response, old_chain):10.0f} blocks/s (blocks below encoded_blocks)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Startup time of a node chain backed by BlockStore for chains of different length.
+
+Usage: python bench_blockstore.py [chain lengths...]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+from block import Block
+from blockchain import BlockChain
+from blockstore import BlockStore
+
+CHAIN_LENGTHS = [10000, 100000, 1000000]
+
+
+def build_store(path: str, length: int) -> None:
+    store = BlockStore(path, fsync_batch=10000)
+    previous_hash = BlockChain.genesis_block_previous_hash
+    for i in range(length):
+        tx = {"author": "bench", "content": f"message {i}", "time": float(i), "hash": f"{i:064x}"}
+        block = Block(i, [tx], float(i), previous_hash)
+        store.append(block, i + 1)  # work of blocks at difficulty 0
+        previous_hash = block.hash
+    store.close()
+
+
+def main():
+    lengths = [int(a) for a in sys.argv[1:]] or CHAIN_LENGTHS
+    print(f"{'blocks':>8} {'build s':>8} {'open ms':>8} {'tip ms':>7} {'random ms':>10} {'hash lookup ms':>15}")
+    for length in lengths:
+        path = tempfile.mkdtemp(prefix='blockstore-bench-')
+        try:
+            start = time.perf_counter()
+            build_store(path, length)
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = BlockStore(path)
+            blockchain = BlockChain(0, chain=store)
+            opened = time.perf_counter() - start
+
+            start = time.perf_counter()
+            tip = blockchain.last_block()
+            tip_time = time.perf_counter() - start
+            assert tip.id == length - 1
+
+            start = time.perf_counter()
+            middle = store[length // 2]
+            random_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            assert store.index_of(middle.hash) == length // 2
+            lookup = time.perf_counter() - start
+            store.close()
+
+            print(f"{length:>8} {build:>8.1f} {opened * 1000:>8.2f} {tip_time * 1000:>7.2f} "
+                  f"{random_time * 1000:>10.2f} {lookup * 1000:>15.1f}")
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Microbenchmarks of signing, verification, public key handling and peers serialization.
+
+Usage: python bench_crypto.py [iterations]
+"""
+import base64
+import json
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+
+import consts
+import wire
+from crypto import load_public_key
+from node import Node
+
+PEER_COUNT = 200
+
+
+def timed(func, iterations: int) -> float:
+    """Return microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def legacy_peers(node: Node) -> dict:
+    """Peers property before PEM encodings were cached"""
+    encoded_peers = {}
+    for p in node._peers:
+        encoded_peers[p] = {"timeout": node._peers[p]["timeout"],
+                            "public_key": node._peers[p]["public_key"].key.public_bytes(
+                                encoding=serialization.Encoding.PEM,
+                                format=serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')}
+    return encoded_peers
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    consts.block_store_dir = None
+    node = Node()
+    others = [Node() for _ in range(4)]
+    for i in range(PEER_COUNT):
+        node.peer_management([{"node_address": f"http://127.0.0.1:{9000 + i}/",
+                               "public_key": others[i % len(others)].public_key}])
+    node.peer_management([{"node_address": others[0].host, "public_key": others[0].public_key}])
+
+    data = {"node_address": others[0].host, "time": time.time()}
+    msg = others[0].create_message(data)
+    message = json.dumps(data, sort_keys=True).encode()
+    signature = base64.b64decode(msg["signature"])
+    key = node._peers[others[0].host]["public_key"]
+
+    def verify_uncached():
+        node.verifier._verified.clear()
+        node.verify(message, signature, key)
+
+    def load_pem_uncached():
+        serialization.load_pem_public_key(others[1].public_key.encode())
+
+    msgs = [others[0].create_message({"node_address": others[0].host, "time": float(i)}) for i in range(64)]
+    bodies = [json.dumps(m).encode() for m in msgs]
+
+    def verify_sequential_uncached():
+        node.verifier._verified.clear()
+        for body in bodies:
+            assert node.open_message(body) is not None
+
+    def verify_batch_uncached():
+        node.verifier._verified.clear()
+        assert all(node.open_messages([(body, wire.JSON) for body in bodies]))
+
+    results = {
+        "sign": timed(lambda: node.sign(message.decode()), iterations),
+        "verify": timed(verify_uncached, iterations),
+        "verify replayed (cached)": timed(lambda: node.verify(message, signature, key), iterations),
+        "load_pem_public_key": timed(load_pem_uncached, iterations),
+        "load_public_key (cached)": timed(lambda: load_public_key(others[1].public_key), iterations),
+        f"peers, {PEER_COUNT} peers (legacy)": timed(lambda: legacy_peers(node), max(iterations // 10, 1)),
+        f"peers, {PEER_COUNT} peers": timed(lambda: node.peers, iterations),
+        "verify 64 messages sequentially": timed(verify_sequential_uncached, max(iterations // 20, 1)),
+        "verify 64 messages batch": timed(verify_batch_uncached, max(iterations // 20, 1)),
+    }
+    for name, us in results.items():
+        print(f"{name:>36}: {us:>10.1f} us")
+    node.close()
+
+
+if __name__ == '__main__':
+    main()
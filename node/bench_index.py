@@ -0,0 +1,98 @@
+"""
+Benchmark transaction lookups on a chain, walking all blocks vs ChainIndex.
+
+Usage: python bench_index.py [transactions] [transactions per block]
+"""
+import random
+import sys
+import time
+
+from bench_pow import make_transactions
+from block import Block
+from index import ChainIndex
+
+QUERIES = 200
+
+
+def build_chain(count: int, block_size: int) -> list:
+    transactions = make_transactions(count)
+    chain = []
+    for i, start in enumerate(range(0, count, block_size)):
+        block = Block(i, transactions[start:start + block_size], float(i), '0' * 64)
+        block.seal()
+        chain.append(block)
+    return chain
+
+
+def legacy_lookup(chain: list, tx_hash: str):
+    """Finding a transaction by walking the chain like chain_messages() of the client"""
+    for block in chain:
+        for tx in block.transactions:
+            if tx["hash"] == tx_hash:
+                return tx
+    return None
+
+
+def indexed_lookup(chain: list, index: ChainIndex, tx_hash: str):
+    block_id, position = index.locate(tx_hash)
+    return chain[block_id].transactions[position]
+
+
+def legacy_by_author(chain: list, author: str) -> list:
+    return [tx for block in chain for tx in block.transactions if tx["author"] == author]
+
+
+def legacy_by_time(chain: list, start: float, end: float) -> list:
+    return sorted((tx for block in chain for tx in block.transactions if start <= tx["time"] < end),
+                  key=lambda tx: tx["time"])
+
+
+def latency(func, args: list) -> tuple:
+    """Return median and 99th percentile latency in microseconds"""
+    samples = []
+    for arg in args:
+        start = time.perf_counter()
+        func(*arg)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, len(samples) * 99 // 100)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    chain = build_chain(count, block_size)
+    all_transactions = [tx for block in chain for tx in block.transactions]
+
+    start = time.perf_counter()
+    index = ChainIndex(chain)
+    index.build()
+    print(f"{count} transactions in {len(chain)} blocks, index built in {time.perf_counter() - start:.2f} s")
+
+    rng = random.Random(1)
+    hashes = [(rng.choice(all_transactions)["hash"],) for _ in range(QUERIES)]
+    authors = [(f"author{rng.randrange(100)}",) for _ in range(QUERIES)]
+    windows = []
+    for _ in range(QUERIES):
+        begin = 1600000000.0 + rng.randrange(count)
+        windows.append((begin, begin + 100))
+
+    for tx_hash, in hashes[:3]:
+        assert indexed_lookup(chain, index, tx_hash) == legacy_lookup(chain, tx_hash)
+    assert index.by_author(authors[0][0])[1] == legacy_by_author(chain, authors[0][0])
+    assert index.by_time(*windows[0])[1] == legacy_by_time(chain, *windows[0])
+
+    legacy_queries = max(QUERIES // 20, 3)
+    cases = [("tx by hash", lambda h: legacy_lookup(chain, h), lambda h: indexed_lookup(chain, index, h), hashes),
+             ("author, first 100", lambda a: legacy_by_author(chain, a)[:100],
+              lambda a: index.by_author(a, 0, 100), authors),
+             ("time range of 100", lambda s, e: legacy_by_time(chain, s, e), index.by_time, windows)]
+    print(f"{'query':>18} {'legacy p50 us':>14} {'index p50 us':>13} {'index p99 us':>13}")
+    for name, legacy, indexed, args in cases:
+        legacy_p50, _ = latency(legacy, args[:legacy_queries])
+        p50, p99 = latency(indexed, args)
+        print(f"{name:>18} {legacy_p50:>14.0f} {p50:>13.1f} {p99:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
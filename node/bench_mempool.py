@@ -0,0 +1,54 @@
+"""
+Benchmark add_block latency against mempool size, list based mempool vs Mempool.
+
+Usage: python bench_mempool.py [transactions per block]
+"""
+import sys
+import time
+
+from bench_pow import make_transactions
+from block import Block
+from blockchain import BlockChain
+
+MEMPOOL_SIZES = [1000, 10000, 50000]
+
+
+def legacy_remove(unconfirmed_transactions: list, block: Block) -> list:
+    """Transaction removal of add_block before Mempool was introduced"""
+    tx_to_del = []
+    for tx in block.transactions:
+        if tx in unconfirmed_transactions:
+            tx_to_del.append(tx)
+    return [tx for tx in unconfirmed_transactions if tx not in tx_to_del]
+
+
+def main():
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(f"{block_size} transactions per block")
+    print(f"{'mempool':>8} {'legacy ms':>10} {'mempool ms':>11}")
+    for size in MEMPOOL_SIZES:
+        transactions = make_transactions(size)
+        # mined transactions are the newest ones, worst case for the list scan
+        mined = [dict(tx) for tx in transactions[-block_size:]]
+
+        blockchain = BlockChain(0)
+        blockchain.create_genesis_block()
+        block = Block(1, mined, time.time(), blockchain.last_block().hash)
+
+        start = time.perf_counter()
+        remaining = legacy_remove(list(transactions), block)
+        legacy = time.perf_counter() - start
+        assert len(remaining) == size - block_size
+
+        for tx in transactions:
+            blockchain.add_new_transaction(tx)
+        start = time.perf_counter()
+        assert blockchain.add_block(block)
+        indexed = time.perf_counter() - start
+        assert len(blockchain.mempool) == size - block_size
+
+        print(f"{size:>8} {legacy * 1000:>10.2f} {indexed * 1000:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
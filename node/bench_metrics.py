@@ -0,0 +1,89 @@
+"""
+Overhead of instrumentation: cost of a single observation and of adding blocks to a chain
+with metrics disabled, enabled, and enabled while the sampling profiler runs.
+
+Usage: python bench_metrics.py [blocks] [rounds]
+"""
+import sys
+import time
+
+import metrics
+from bench_pow import make_transactions
+from block import Block
+from blockchain import BlockChain
+
+OBSERVATIONS = 200000
+
+
+def observation_cost(histogram) -> float:
+    """Nanoseconds per timed empty block"""
+    start = time.perf_counter()
+    for _ in range(OBSERVATIONS):
+        with histogram.time():
+            pass
+    return (time.perf_counter() - start) / OBSERVATIONS * 1e9
+
+
+def baseline_cost() -> float:
+    """Nanoseconds per iteration of the same loop without instrumentation"""
+    start = time.perf_counter()
+    for _ in range(OBSERVATIONS):
+        pass
+    return (time.perf_counter() - start) / OBSERVATIONS * 1e9
+
+
+def make_blocks(count: int) -> tuple:
+    """Genesis block and count blocks following it with one transaction each, difficulty 0"""
+    blockchain = BlockChain(0)
+    blockchain.create_genesis_block()
+    genesis = blockchain.last_block()
+    blocks = []
+    previous_hash = genesis.hash
+    for i, tx in enumerate(make_transactions(count), 1):
+        block = Block(i, [tx], float(i), previous_hash)
+        block.hash = block.compute_hash()
+        previous_hash = block.hash
+        blocks.append(block)
+    return genesis, blocks
+
+
+def add_blocks_time(genesis: Block, blocks: list) -> float:
+    blockchain = BlockChain(0)
+    blockchain.replace_suffix(0, [genesis])
+    start = time.perf_counter()
+    for block in blocks:
+        blockchain.add_block(Block(block.id, block.transactions, block.timestamp, block.previous_hash,
+                                   block.nonce, block.hash, target=block.target))
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    histogram = metrics.Histogram("bench_seconds", "benchmark")
+
+    print(f"single observation, {OBSERVATIONS} timed empty blocks")
+    print(f"  {'no instrumentation':>20}: {baseline_cost():>6.0f} ns")
+    metrics.enabled = False
+    print(f"  {'metrics disabled':>20}: {observation_cost(histogram):>6.0f} ns")
+    metrics.enabled = True
+    print(f"  {'metrics enabled':>20}: {observation_cost(histogram):>6.0f} ns")
+
+    genesis, blocks = make_blocks(count)
+    print(f"add_block of {count} blocks, best of {rounds} rounds")
+    cases = {"metrics disabled": (False, False), "metrics enabled": (True, False), "enabled + profiler": (True, True)}
+    results = {}
+    for name, (enabled, profile) in cases.items():
+        metrics.enabled = enabled
+        if profile:
+            metrics.profiler.start()
+        results[name] = min(add_blocks_time(genesis, blocks) for _ in range(rounds))
+        if profile:
+            metrics.profiler.stop()
+    base = results["metrics disabled"]
+    for name, seconds in results.items():
+        print(f"  {name:>20}: {seconds / count * 1e6:>6.2f} us/block, {(seconds / base - 1) * 100:>+6.1f} %")
+
+
+if __name__ == '__main__':
+    main()
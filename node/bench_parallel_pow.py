@@ -0,0 +1,45 @@
+"""
+Scaling benchmark of parallel mining over 1..N worker processes.
+
+Usage: python bench_parallel_pow.py [max workers] [difficulty] [blocks per case]
+"""
+import os
+import sys
+import time
+
+from bench_pow import make_transactions
+from block import Block
+from difficulty import difficulty_target
+from mining import Miner
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    difficulty = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    blocks = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    transactions = make_transactions(100)
+
+    print(f"difficulty {difficulty}, {blocks} blocks per case, {os.cpu_count()} cpus")
+    print(f"{'workers':>7} {'s/block':>9} {'total H/s':>11} {'per worker H/s':>30}")
+    for workers in range(1, max_workers + 1):
+        miner = Miner(workers)
+        # Warm up worker processes so process start up is not measured
+        miner.mine(Block(0, [], 0.0, '0'), difficulty_target(1))
+
+        elapsed = 0.0
+        rates = []
+        for i in range(blocks):
+            block = Block(i + 1, transactions, time.time(), '0' * 64)
+            start = time.perf_counter()
+            nonce, hash = miner.mine(block, difficulty_target(difficulty))
+            elapsed += time.perf_counter() - start
+            block.nonce = nonce
+            assert block.compute_hash() == hash
+            rates.append(miner.hash_rate())
+        per_worker = ' '.join(f"{s['hash_rate']:.0f}" for s in miner.last_stats)
+        print(f"{workers:>7} {elapsed / blocks:>9.3f} {sum(rates) / len(rates):>11.0f} {per_worker:>30}")
+        miner.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare hash rate of the proof of work loop against the midstate mining engine.
+
+Usage: python bench_pow.py [seconds per case]
+"""
+import json
+import sys
+import time
+
+from hashlib import sha256
+
+from block import Block
+from difficulty import difficulty_target
+from mining import MiningJob
+
+DIFFICULTIES = [2, 3, 4, 5, 6]
+BLOCK_SIZES = [10, 1000, 10000]
+
+
+def make_transactions(count: int) -> list:
+    transactions = []
+    for i in range(count):
+        tx = {"author": f"author{i % 100}",
+              "content": f"message number {i} " + "x" * 64,
+              "time": 1600000000.0 + i}
+        tx["hash"] = sha256(json.dumps(tx, sort_keys=True).encode('utf-8')).hexdigest()
+        transactions.append(tx)
+    return transactions
+
+
+def legacy_rate(block: Block, difficulty: int, seconds: float) -> float:
+    """Hashes per second of the original loop hashing the whole block with its transactions"""
+    zeroes = '0' * difficulty
+    block_dict = block.to_dict(include_hash=False)
+    tried = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(16):
+            block_dict["nonce"] += 1
+            sha256(json.dumps(block_dict, sort_keys=True).encode('utf-8')).hexdigest().startswith(zeroes)
+        tried += 16
+    return tried / (time.perf_counter() - start)
+
+
+def engine_rate(block: Block, difficulty: int, seconds: float) -> float:
+    """Hashes per second of MiningJob, including one time serialization of block"""
+    batch = 256
+    tried = 0
+    start = time.perf_counter()
+    job = MiningJob.from_block(block)
+    nonce = 0
+    while time.perf_counter() - start < seconds:
+        found = job.search(difficulty_target(difficulty), start=nonce, attempts=batch)
+        next_nonce = found[0] + 1 if found else nonce + batch
+        tried += next_nonce - nonce
+        nonce = next_nonce
+    return tried / (time.perf_counter() - start)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print(f"{'txs':>6} {'difficulty':>10} {'legacy H/s':>12} {'engine H/s':>12} {'speedup':>8}")
+    for size in BLOCK_SIZES:
+        block = Block(1, make_transactions(size), time.time(), '0' * 64)
+        job = MiningJob.from_block(block)
+        for nonce in (0, 1, 12345):
+            block.nonce = nonce
+            assert job.hash_for(nonce) == block.compute_hash()
+        for difficulty in DIFFICULTIES:
+            legacy = legacy_rate(block, difficulty, seconds)
+            engine = engine_rate(block, difficulty, seconds)
+            print(f"{size:>6} {difficulty:>10} {legacy:>12.0f} {engine:>12.0f} {engine / legacy:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark switching to a competing branch against chain length and reorg depth,
+revalidating the whole candidate chain vs applying only the divergent suffix.
+
+Usage: python bench_reorg.py [transactions per block]
+"""
+import sys
+import time
+
+from bench_pow import make_transactions
+from block import Block
+from blockchain import BlockChain
+
+CHAIN_LENGTHS = [1000, 10000, 50000]
+DEPTHS = [1, 10, 100]
+
+
+def extend(previous: Block, transactions: list, count: int, block_size: int, timestamp: float) -> list:
+    """Build count blocks on top of previous, difficulty 0 needs no proof of work"""
+    blocks = []
+    for i in range(count):
+        block = Block(previous.id + 1, transactions[i * block_size:(i + 1) * block_size], timestamp,
+                      previous.hash)
+        blocks.append(block)
+        previous = block
+    return blocks
+
+
+def main():
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"{block_size} transactions per block")
+    print(f"{'length':>7} {'depth':>6} {'full revalidation ms':>21} {'suffix reorg ms':>16}")
+    for length in CHAIN_LENGTHS:
+        blockchain = BlockChain(0)
+        blockchain.create_genesis_block()
+        transactions = make_transactions(length * block_size)
+        for block in extend(blockchain.last_block(), transactions, length, block_size, 1.0):
+            assert blockchain.add_block(block)
+
+        for depth in DEPTHS:
+            fork = blockchain.chain[-depth - 1]
+            branch = extend(fork, transactions[-(depth + 1) * block_size:], depth + 1, block_size,
+                            2.0 + depth)
+            candidate = list(blockchain.chain[:fork.id + 1]) + branch
+
+            start = time.perf_counter()
+            assert blockchain.check_chain_validity(candidate)
+            full = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for block in branch:
+                assert blockchain.add_block(block)
+            suffix = time.perf_counter() - start
+            assert blockchain.last_block() is branch[-1]
+
+            print(f"{length:>7} {depth:>6} {full * 1000:>21.1f} {suffix * 1000:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Load test of a node: requests/sec and latency of /new_transaction and /chain while the node keeps mining.
+
+Starts a node with an in-memory chain unless --url is given, then runs concurrent
+clients against both endpoints while another client calls /mine in a loop.
+
+Usage: python bench_server.py [--url URL] [--seconds S] [--concurrency C] [--difficulty D]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+# Runs app.py with chosen difficulty and without block store
+SERVER = ("import runpy, sys, consts; consts.difficulty = int(sys.argv.pop(1)); consts.block_store_dir = None; "
+          "runpy.run_path('app.py', run_name='__main__')")
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str) -> None:
+    for _ in range(100):
+        try:
+            async with session.get(url + 'tip') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"node {url} did not start")
+
+
+async def client(session: aiohttp.ClientSession, request, deadline: float, latencies: list, errors: list) -> None:
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with request(session, i) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+        except aiohttp.ClientError as e:
+            errors.append(e)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+
+
+async def miner(session: aiohttp.ClientSession, url: str, deadline: float) -> int:
+    mined = 0
+    while time.perf_counter() < deadline:
+        async with session.get(url + 'mine') as response:
+            if 'is mined' in await response.text():
+                mined += 1
+            else:
+                await asyncio.sleep(0.01)
+    return mined
+
+
+def percentile(samples: list, fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+
+async def run(url: str, seconds: float, concurrency: int) -> None:
+    prefix = f"{os.getpid()}-{time.time()}"
+
+    def new_transaction(session, i):
+        tx = {"author": f"author{i % 100}", "content": f"load {prefix} {id(session)} {i}", "time": time.time()}
+        return session.post(url + 'new_transaction', json=tx)
+
+    def chain(session, i):
+        return session.get(url + 'chain', params={"from": 0, "limit": 100})
+
+    connector = aiohttp.TCPConnector(limit=2 * concurrency + 1)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, url)
+        deadline = time.perf_counter() + seconds
+        results = {name: ([], []) for name in ("/new_transaction", "/chain")}
+        tasks = [miner(session, url, deadline)]
+        for name, request in (("/new_transaction", new_transaction), ("/chain", chain)):
+            tasks += [client(session, request, deadline, *results[name]) for _ in range(concurrency)]
+        started = time.perf_counter()
+        mined = (await asyncio.gather(*tasks))[0]
+        elapsed = time.perf_counter() - started
+
+    print(f"{seconds:.0f} s, {concurrency} clients per endpoint, {mined} blocks mined during the run")
+    print(f"{'endpoint':>17} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, (latencies, errors) in results.items():
+        latencies.sort()
+        print(f"{name:>17} {len(latencies):>9} {len(latencies) / elapsed:>8.0f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.1f} {len(errors):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="address of running node, a node is started if not given")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--difficulty', type=int, default=4, help="difficulty of started node")
+    parser.add_argument('--port', type=int, default=8050, help="port of started node")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}/"
+        process = subprocess.Popen([sys.executable, '-c', SERVER, str(args.difficulty), '--port', str(args.port)],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+    try:
+        asyncio.run(run(url.rstrip('/') + '/', args.seconds, args.concurrency))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
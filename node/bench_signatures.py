@@ -0,0 +1,59 @@
+"""
+Compare node start up time and signing throughput of RSA-PSS and Ed25519.
+
+Usage: python bench_signatures.py [seconds per case]
+"""
+import base64
+import json
+import sys
+import time
+
+import consts
+from crypto import schemes
+from node import Node
+
+
+def rate(func, seconds: float) -> float:
+    """Return calls per second"""
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    consts.block_store_dir = None
+    data = {"node_address": "http://127.0.0.1:8000/", "time": time.time()}
+    dump = json.dumps(data, sort_keys=True)
+
+    print(f"{'scheme':>8} {'startup ms':>11} {'signed/s':>9} {'verified/s':>11} {'signature B64':>14} {'key PEM':>8}")
+    for name in schemes:
+        consts.signature_scheme = name
+        start = time.perf_counter()
+        for _ in range(5):
+            node = Node()
+            node.close()
+        startup = (time.perf_counter() - start) / 5
+
+        signer = Node()
+        verifier = Node()
+        verifier.peer_management([{"node_address": data["node_address"], "public_key": signer.public_key,
+                                   "scheme": signer.scheme.name}])
+        key = verifier._peers[data["node_address"]]["public_key"]
+        signature = signer.sign(dump)
+        raw_signature = base64.b64decode(signature)
+
+        signed = rate(lambda: signer.sign(dump), seconds)
+        # verification without cache of verified signatures
+        verified = rate(lambda: key.scheme.verify(key.key, dump.encode(), raw_signature), seconds)
+        print(f"{name:>8} {startup * 1000:>11.1f} {signed:>9.0f} {verified:>11.0f} "
+              f"{len(signature):>14} {len(signer.public_key):>8}")
+        signer.close()
+        verifier.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Joining a long chain with and without snapshot, and memory of a node keeping the chain with and without pruning.
+
+The chain is built once and written to a temporary directory as NDJSON blocks, headers and a signed snapshot
+at the last checkpoint. Every mode runs in a fresh process, so resident memory is that of the mode only:
+  full      validate and add every block, as a node syncing from genesis
+  snapshot  verify signature of snapshot, validate headers up to it and add the blocks after it
+  pruned    like full, bodies below the previous checkpoint are pruned at every checkpoint like a node
+            with prune_depth does, freed memory is reused for later blocks
+Reported are seconds to join, bytes read and resident memory in MB after the join and at its peak.
+The chain is built in a process of its own as well, peak memory of a process includes that of its parent.
+
+Usage: python bench_snapshot.py [blocks] [transactions per block] [snapshot interval]
+"""
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import consts
+from bench_pow import make_transactions
+from block import Block
+from blockchain import BlockChain
+from crypto import SignatureVerifier, get_scheme, load_public_key, public_key_pem
+from snapshot import checkpoint, create_snapshot, validate_snapshot
+
+MODES = ["full", "snapshot", "pruned"]
+
+
+def resident_mb() -> float:
+    """Current resident memory, peak resident memory where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_mb()
+
+
+def peak_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def build(directory: str, count: int, block_size: int, interval: int) -> None:
+    """Write blocks, headers and signed snapshot of a chain of count blocks at difficulty 0"""
+    blockchain = BlockChain(0)
+    blockchain.create_genesis_block()
+    transactions = make_transactions((count - 1) * block_size)
+    for i in range(1, count):
+        block = Block(i, transactions[(i - 1) * block_size:i * block_size], blockchain.chain[0].timestamp + i,
+                      blockchain.last_block().hash)
+        assert blockchain.add_block(block)
+
+    with open(os.path.join(directory, 'blocks.ndjson'), 'wb') as f:
+        for block in blockchain.chain:
+            f.write(block.encoded() + b'\n')
+    with open(os.path.join(directory, 'headers.ndjson'), 'w') as f:
+        for block in blockchain.chain:
+            f.write(json.dumps(dict(block.header(), hash=block.hash)) + '\n')
+
+    scheme = get_scheme(consts.signature_scheme)
+    private_key = scheme.generate_private_key()
+    data = {"node_address": "http://127.0.0.1:8000/",
+            "snapshot": create_snapshot(blockchain, checkpoint(count - 1, interval))}
+    payload = json.dumps(data, sort_keys=True)
+    with open(os.path.join(directory, 'snapshot.json'), 'w') as f:
+        json.dump({"msg": data, "signature": scheme.sign(private_key, payload.encode()).hex(),
+                   "public_key": public_key_pem(private_key.public_key()), "scheme": scheme.name}, f)
+
+
+def bootstrap(blockchain: BlockChain, directory: str) -> tuple:
+    """
+    Verify signed snapshot and headers and bootstrap chain from them, the snapshot is released afterwards
+    :return: (id of first block to download, bytes read)
+    """
+    with open(os.path.join(directory, 'snapshot.json'), 'rb') as f:
+        body = f.read()
+    read = len(body)
+    message = json.loads(body)
+    key = load_public_key(message["public_key"], message["scheme"])
+    payload = json.dumps(message["msg"], sort_keys=True).encode()
+    assert SignatureVerifier(cache_size=0).verify(payload, bytes.fromhex(message["signature"]), key)
+    snapshot = message["msg"]["snapshot"]
+
+    def headers():
+        nonlocal read
+        with open(os.path.join(directory, 'headers.ndjson'), 'rb') as f:
+            for line in f:
+                read += len(line)
+                yield Block.from_header(json.loads(line))
+    blockchain.bootstrap(*validate_snapshot(blockchain, headers(), snapshot))
+    return snapshot["height"] + 1, read
+
+
+def join(directory: str, mode: str, interval: int) -> dict:
+    """Join chain in directory as a new node would, return measurements"""
+    gc.collect()
+    before = resident_mb()
+    start = time.perf_counter()
+    read = 0
+    blockchain = BlockChain(0)
+    blockchain.create_genesis_block()
+    after_height = 0
+    if mode == "snapshot":
+        after_height, read = bootstrap(blockchain, directory)
+
+    with open(os.path.join(directory, 'blocks.ndjson'), 'rb') as f:
+        for line in f:
+            block_data = json.loads(line)
+            if block_data["id"] < after_height:
+                continue
+            read += len(line)
+            if block_data["id"] == 0:
+                blockchain.replace_suffix(0, [Block.from_dict(block_data)])  # genesis block of peer, see adopt_genesis
+            else:
+                assert blockchain.add_block(Block.from_dict(block_data))
+            if mode == "pruned" and block_data["id"] % interval == 0:
+                blockchain.prune(checkpoint(block_data["id"] - interval, interval))
+    seconds = time.perf_counter() - start
+    gc.collect()
+    return {"mode": mode, "seconds": seconds, "read_mb": read / 2 ** 20, "height": len(blockchain.chain) - 1,
+            "resident_mb": resident_mb() - before, "peak_mb": peak_mb() - before}
+
+
+def main():
+    if sys.argv[1:2] == ['--build']:
+        build(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]))
+        return
+    if sys.argv[1:2] == ['--join']:
+        print(json.dumps(join(sys.argv[3], sys.argv[2], int(sys.argv[4]))))
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    interval = int(sys.argv[3]) if len(sys.argv) > 3 else consts.snapshot_interval
+    script = os.path.abspath(__file__)
+
+    with tempfile.TemporaryDirectory() as directory:
+        subprocess.run([sys.executable, script, '--build', directory, str(count), str(block_size), str(interval)],
+                       check=True)
+        print(f"chain of {count} blocks with {block_size} transactions each, snapshot at the last multiple of {interval}")
+        print(f"{'mode':>10} {'join s':>8} {'read MB':>8} {'resident MB':>12} {'peak MB':>8}")
+        for mode in MODES:
+            result = json.loads(subprocess.run([sys.executable, script, '--join', mode, directory, str(interval)],
+                                               capture_output=True, text=True, check=True).stdout)
+            print(f"{mode:>10} {result['seconds']:>8.2f} {result['read_mb']:>8.1f} {result['resident_mb']:>12.1f} "
+                  f"{result['peak_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
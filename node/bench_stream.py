@@ -0,0 +1,116 @@
+"""
+Peak memory of syncing a long chain from a node: whole /chain response vs streamed import.
+
+Builds a block store with one transaction per block (kept in a temporary directory between
+runs), serves it from a node and imports it in fresh processes:
+  legacy          response.json() of whole chain, blocks rebuilt and validated in memory
+  stream memory   streamed NDJSON imported block by block into an in-memory chain
+  stream store    streamed NDJSON imported block by block into a block store
+
+Usage: python bench_stream.py [blocks] [port]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import consts
+from block import Block
+from blockchain import BlockChain
+from blockstore import BlockStore
+from sync import sync_with_peer
+from transport import PeerTransport
+
+# Runs app.py with difficulty 0, the served block store is given by --data-dir
+SERVER = "import runpy, consts; consts.difficulty = 0; runpy.run_path('app.py', run_name='__main__')"
+
+
+def peak_rss_mb(pid: str = 'self') -> float:
+    """Peak resident memory of process, VmHWM is reset by exec unlike ru_maxrss"""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build_source(path: str, count: int) -> None:
+    store = BlockStore(path, consts.block_store_segment_size, 1024)
+    if len(store) != count:
+        store.truncate(0)
+        blockchain = BlockChain(0, chain=store)
+        blockchain.create_genesis_block()
+        for i in range(1, count):
+            tx = {"author": f"author{i % 100}", "content": f"message {i}", "time": float(i)}
+            assert blockchain.add_block(Block(i, [tx], float(i), blockchain.last_block().hash))
+    store.close()
+
+
+def import_chain(mode: str, url: str, path: str) -> dict:
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'legacy':
+        chain_dump = requests.get(url + 'chain').json()['chain']
+        chain = [Block.from_dict(block_data) for block_data in chain_dump]
+        blockchain = BlockChain(0)
+        assert blockchain.check_chain_validity(chain)
+        blockchain.replace_suffix(0, chain)
+    else:
+        store = BlockStore(path, consts.block_store_segment_size, 1024) if mode == 'stream store' else None
+        blockchain = BlockChain(0, chain=store)
+        blockchain.create_genesis_block()
+        transport = PeerTransport(timeout=(2, 60))
+        assert sync_with_peer(blockchain, transport, url)
+        transport.close()
+    seconds = time.perf_counter() - start
+    return {"blocks": len(blockchain.chain), "seconds": seconds, "baseline_mb": baseline, "peak_mb": peak_rss_mb()}
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--import':
+        print(json.dumps(import_chain(*sys.argv[2:5])))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8070
+    source = os.path.join(tempfile.gettempdir(), f"bench_stream_{count}")
+    start = time.perf_counter()
+    build_source(source, count)
+    print(f"source chain of {count} blocks ready in {time.perf_counter() - start:.1f} s")
+
+    url = f"http://127.0.0.1:{port}/"
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, '-c', SERVER, '--data-dir', source, '--port', str(port)], cwd=here,
+                              stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(600):
+            try:
+                requests.get(url + 'tip', timeout=1)
+                break
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        print(f"node serving chain, peak RSS {peak_rss_mb(server.pid):.0f} MB")
+
+        print(f"{'importer':>13} {'blocks':>8} {'seconds':>8} {'baseline MB':>12} {'peak MB':>8} {'node peak MB':>13}")
+        for mode in ('legacy', 'stream memory', 'stream store'):
+            destination = tempfile.mkdtemp(prefix='bench_stream_import_')
+            try:
+                output = subprocess.run([sys.executable, __file__, '--import', mode, url, destination], cwd=here,
+                                        check=True, capture_output=True, text=True).stdout
+            finally:
+                shutil.rmtree(destination)
+            result = json.loads(output.splitlines()[-1])
+            print(f"{mode:>13} {result['blocks']:>8} {result['seconds']:>8.1f} {result['baseline_mb']:>12.0f} "
+                  f"{result['peak_mb']:>8.0f} {peak_rss_mb(server.pid):>13.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
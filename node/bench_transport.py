@@ -0,0 +1,87 @@
+"""
+Broadcast latency to local stand-in peers, sequential requests.post vs PeerTransport.
+
+Every stand-in peer answers POST requests after a fixed delay.
+Usage: python bench_transport.py [peer delay ms]
+"""
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import consts
+from transport import PeerTransport
+
+PEER_COUNTS = [5, 50, 200]
+
+
+class StandInPeer(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive connections
+    disable_nagle_algorithm = True
+    delay = 0.005
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(StandInPeer.delay)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'OK')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_peers(count: int) -> list:
+    servers = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandInPeer)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def sequential_broadcast(peers: list, payload: str) -> None:
+    """Broadcast as done before PeerTransport, one new connection per peer"""
+    for peer in peers:
+        requests.post(peer + "announce_transaction", data=payload, headers=consts.json_headers)
+
+
+def main():
+    StandInPeer.delay = (float(sys.argv[1]) if len(sys.argv) > 1 else 5) / 1000
+    payload = '{"author": "bench", "content": "message", "time": 0.0, "hash": "' + '0' * 64 + '"}'
+    transport = PeerTransport(consts.peer_request_timeout, consts.peer_fanout_workers, consts.peer_pool_size)
+    servers = start_peers(max(PEER_COUNTS))
+
+    print(f"peer delay {StandInPeer.delay * 1000:.0f} ms, {consts.peer_fanout_workers} fan-out workers")
+    print(f"{'peers':>6} {'sequential ms':>14} {'transport ms':>13} {'warm transport ms':>18}")
+    for count in PEER_COUNTS:
+        peers = [f"http://127.0.0.1:{s.server_address[1]}/" for s in servers[:count]]
+
+        start = time.perf_counter()
+        sequential_broadcast(peers, payload)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, failures = transport.broadcast(peers, "announce_transaction", payload)
+        cold = time.perf_counter() - start
+        assert not failures, failures
+
+        # second broadcast reuses kept alive connections
+        start = time.perf_counter()
+        transport.broadcast(peers, "announce_transaction", payload)
+        warm = time.perf_counter() - start
+
+        print(f"{count:>6} {sequential * 1000:>14.1f} {cold * 1000:>13.1f} {warm * 1000:>18.1f}")
+
+    transport.close()
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare JSON and msgpack wire formats: bytes on the wire and encode/decode throughput
+of blocks, transaction gossip batches and signed peer messages.
+
+Usage: python bench_wire.py [seconds per case]
+"""
+import json
+import sys
+import time
+
+import consts
+import wire
+from bench_pow import make_transactions
+from block import Block
+
+BLOCK_SIZES = [1, 10, 100]
+
+
+def throughput(func, seconds: float) -> float:
+    """Calls per second"""
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(10):
+            func()
+        calls += 10
+    return calls / (time.perf_counter() - start)
+
+
+def make_block(size: int) -> Block:
+    block = Block(1, make_transactions(size), time.time(), '0' * 64, nonce=123456)
+    block.seal()
+    return block
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    if wire.msgpack is None:
+        print("msgpack is not installed")
+        return
+
+    print("blocks")
+    print(f"{'txs':>5} {'JSON B':>8} {'msgpack B':>10} {'JSON enc/s':>11} {'msgpack enc/s':>14} "
+          f"{'JSON dec/s':>11} {'msgpack dec/s':>14}")
+    for size in BLOCK_SIZES:
+        block = make_block(size)
+        encoded = {fmt: wire.encode_block(block, fmt) for fmt in (wire.JSON, wire.MSGPACK)}
+        for fmt in encoded:
+            assert wire.decode_block(encoded[fmt], fmt).hash == block.hash
+        # JSON encoding of sealed blocks is cached, an unsealed copy measures the encoding itself
+        unsealed = Block(block.id, block.transactions, block.timestamp, block.previous_hash, block.nonce, block.hash,
+                         target=block.target)
+        rates = [throughput(lambda: unsealed._encode(), seconds),
+                 throughput(lambda: wire.encode_block(block, wire.MSGPACK), seconds),
+                 throughput(lambda: wire.decode_block(encoded[wire.JSON], wire.JSON), seconds),
+                 throughput(lambda: wire.decode_block(encoded[wire.MSGPACK], wire.MSGPACK), seconds)]
+        print(f"{size:>5} {len(encoded[wire.JSON]):>8} {len(encoded[wire.MSGPACK]):>10} {rates[0]:>11.0f} "
+              f"{rates[1]:>14.0f} {rates[2]:>11.0f} {rates[3]:>14.0f}")
+
+    transactions = make_transactions(consts.gossip_max_batch)
+    print(f"gossip batch of {len(transactions)} transactions")
+    for fmt in (wire.JSON, wire.MSGPACK):
+        data = wire.dumps(transactions, fmt)
+        print(f"  {fmt:>8}: {len(data):>7} B, {throughput(lambda: wire.dumps(transactions, fmt), seconds):>7.0f} enc/s, "
+              f"{throughput(lambda: wire.loads(data, fmt), seconds):>7.0f} dec/s")
+
+    # Ed25519 keeps signing from dominating the encoding costs, without cache every message is verified
+    consts.signature_scheme = "ed25519"
+    consts.signature_cache_size = 0
+    consts.block_store_dir = None
+    from node import Node
+    sender, receiver = Node(), Node()
+    sender.host = "http://127.0.0.1:8001/"
+    receiver.peer_management([{"node_address": sender.host, "public_key": sender.public_key,
+                               "scheme": sender.scheme.name, "formats": sender.formats}])
+    peers = [{"node_address": f"http://10.0.0.{i}:8000/", "public_key": sender.public_key,
+              "scheme": sender.scheme.name, "formats": sender.formats} for i in range(20)]
+    messages = {"keep_alive": {"node_address": sender.host, "time": time.time()},
+                "update_peers, 20 peers": {"node_address": sender.host, "peers": peers}}
+
+    def send(data, fmt):
+        msg = sender.create_message(data, fmt)
+        return msg if fmt == wire.MSGPACK else json.dumps(msg).encode()
+
+    print("signed messages, sign + encode and decode + verify, Ed25519")
+    for name, data in messages.items():
+        print(f"  {name}")
+        for fmt in (wire.JSON, wire.MSGPACK):
+            body = send(data, fmt)
+            assert receiver.open_message(body, fmt) == data
+            print(f"    {fmt:>8}: {len(body):>6} B, {throughput(lambda: send(data, fmt), seconds):>7.0f} send/s, "
+                  f"{throughput(lambda: receiver.open_message(body, fmt), seconds):>7.0f} receive/s")
+    sender.close()
+    receiver.close()
+
+
+if __name__ == '__main__':
+    main()
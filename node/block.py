@@ -2,30 +2,261 @@ import json
 
 from hashlib import sha256
 
+from merkle import merkle_proof, merkle_root
+
+
+def transaction_hash(transaction: dict) -> str:
+    """
+    Return hash identifying transaction, client supplied hash field if present
+    :param transaction: transaction dict
+    :return: sha256 hash
+    """
+    if transaction.get('hash'):
+        return transaction['hash']
+    return sha256(json.dumps(transaction, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def transaction_valid(transaction) -> bool:
+    """
+    Check transaction received from a client or peer, author and content have to be non-empty strings,
+    the author is a key of the author index
+    :param transaction: decoded transaction
+    :return: True if transaction is a dict with valid fields and hash, False otherwise
+    """
+    return (isinstance(transaction, dict)
+            and all(isinstance(transaction.get(field), str) and transaction[field] for field in ("author", "content"))
+            and transaction_hash_valid(transaction))
+
+
+def transaction_hash_valid(transaction: dict) -> bool:
+    """
+    Check client supplied hash field, it has to be the hash of the other fields so it can not be
+    chosen to collide with the hash of another transaction
+    :param transaction: transaction dict
+    :return: True if transaction has no hash field or a correct one, False if its content can not be encoded
+    """
+    if 'hash' not in transaction:
+        return True
+    content = {key: value for key, value in transaction.items() if key != 'hash'}
+    try:
+        return transaction['hash'] == sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+    except (TypeError, ValueError):
+        return False  # e.g. binary values or keys of other types received in msgpack
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check_fields(id, transactions, timestamp, previous_hash, nonce, hash) -> None:
+    """
+    Check types of block fields received from a peer before a Block is created from them, the Merkle root
+    is computed from the transactions when the block is created
+    Raises ValueError if a field has the wrong type
+    """
+    if not (_is_int(id) and _is_int(nonce) and isinstance(previous_hash, str) and isinstance(hash, str)
+            and (_is_int(timestamp) or isinstance(timestamp, float))):
+        raise ValueError("block header fields have wrong types")
+    if not isinstance(transactions, list) or not all(isinstance(tx, dict) and isinstance(tx.get('hash', ''), str)
+                                                     for tx in transactions):
+        raise ValueError("block transactions have to be a list of objects")
+
+
+def _parse_target(block_data: dict):
+    target = block_data.get("target")
+    if target is None:
+        return None
+    if not isinstance(target, str):
+        raise ValueError("block target has to be a hex string")
+    return int(target, 16)
+
+
+def _required(block_data: dict, names: tuple) -> list:
+    if not isinstance(block_data, dict):
+        raise ValueError("block has to be an object")
+    missing = [name for name in names if name not in block_data]
+    if missing:
+        raise ValueError(f"block fields {', '.join(missing)} are missing")
+    return [block_data[name] for name in names]
+
 
 class Block:
-    def __init__(self, id: int, transactions: list, timestamp: float, previous_hash: str, nonce: int = 0):
+    """
+    Block of the chain.
+
+    The block hash covers only the header: id, nonce, previous hash, timestamp,
+    the Merkle root of the transaction hashes and the target the hash has to
+    meet. Blocks without target, like the genesis block and blocks mined before
+    targets were introduced, have the initial target. A block is mutable while it
+    is mined. Once it is accepted to the chain it is sealed: its fields can no
+    longer be assigned and its canonical JSON encoding is computed once and
+    reused for storage and chain responses. The encoding of old blocks, which are
+    rarely sent, can be released to save memory and is computed again when needed.
+    """
+    __slots__ = ('id', 'transactions', 'merkle_root', 'nonce', 'previous_hash', 'timestamp', 'target', 'hash',
+                 '_encoded', '_sealed')
+
+    def __init__(self, id: int, transactions: list, timestamp: float, previous_hash: str, nonce: int = 0,
+                 hash: str = None, merkle_root: str = None, target: int = None):
         """
         Constructor for Block class
         :param previous_hash: Hash of the previous block
         :param id: Unique ID of block
         :param transactions: List of transactions
         :param timestamp: Time of block generation
+        :param nonce: PoW nonce
+        :param hash: Hash of block, computed if not given
+        :param merkle_root: Merkle root of transactions, computed if not given
+        :param target: highest valid value of hash, initial target of chain if None
         """
+        object.__setattr__(self, '_sealed', False)
+        object.__setattr__(self, '_encoded', None)  # canonical encoding including hash, set when sealed
         self.id = id
         self.transactions = transactions
+        if merkle_root is not None:
+            self.merkle_root = merkle_root
         self.nonce = nonce
         self.previous_hash = previous_hash
         self.timestamp = timestamp
-        self.hash = self.compute_hash()
+        self.target = target
+        self.hash = hash if hash is not None else self.compute_hash()
+
+    def __setattr__(self, name, value):
+        if self._sealed:
+            raise AttributeError(f"block #{self.id} is sealed and can not be modified")
+        object.__setattr__(self, name, value)
+        if name == 'transactions':
+            object.__setattr__(self, 'merkle_root', merkle_root([transaction_hash(tx) for tx in value]))
+
+    @classmethod
+    def from_dict(cls, block_data: dict):
+        """
+        Create block from its dict representation, e.g. received from peer
+        :param block_data: dict with block fields including hash
+        :return: Block object, raises ValueError if fields are missing or have wrong types
+        """
+        fields = _required(block_data, ("id", "transactions", "timestamp", "previous_hash", "nonce", "hash"))
+        check_fields(*fields)
+        return cls(*fields, target=_parse_target(block_data))
+
+    @classmethod
+    def from_header(cls, header: dict):
+        """
+        Create block without transactions from header including hash, e.g. received from /headers
+        The Merkle root of the header is kept, so the hash can be checked without transactions
+        :param header: dict with header fields and hash
+        :return: Block object, raises ValueError if fields are missing or have wrong types
+        """
+        id, timestamp, previous_hash, nonce, hash, root = _required(
+            header, ("id", "timestamp", "previous_hash", "nonce", "hash", "merkle_root"))
+        check_fields(id, [], timestamp, previous_hash, nonce, hash)
+        if not isinstance(root, str):
+            raise ValueError("block Merkle root has to be a string")
+        return cls(id, [], timestamp, previous_hash, nonce, hash, root, _parse_target(header))
+
+    @classmethod
+    def from_encoded(cls, encoded: bytes):
+        """
+        Create sealed block from trusted canonical encoding, e.g. read from block store
+        :param encoded: bytes returned by encoded()
+        :return: sealed Block object
+        """
+        block_data = json.loads(encoded)
+        block = cls(block_data["id"],
+                    block_data["transactions"],
+                    block_data["timestamp"],
+                    block_data["previous_hash"],
+                    block_data["nonce"],
+                    block_data["hash"],
+                    block_data.get("merkle_root"),
+                    _parse_target(block_data))
+        block.seal(encoded)
+        return block
+
+    @property
+    def sealed(self) -> bool:
+        return self._sealed
+
+    def seal(self, encoded: bytes = None) -> None:
+        """
+        Make block immutable and cache its canonical encoding
+        :param encoded: already known canonical encoding, computed if not given
+        """
+        if self._sealed:
+            return
+        object.__setattr__(self, 'transactions', tuple(self.transactions))
+        object.__setattr__(self, '_encoded', encoded if encoded is not None else self._encode())
+        object.__setattr__(self, '_sealed', True)
+
+    def release_encoding(self) -> None:
+        """
+        Drop cached encoding of sealed block, it is computed again by encoded() when needed
+        """
+        object.__setattr__(self, '_encoded', None)
+
+    def pruned(self):
+        """
+        Return sealed copy of block without transactions, hash and Merkle root are kept
+        :return: Block object
+        """
+        block = Block(self.id, [], self.timestamp, self.previous_hash, self.nonce, self.hash, self.merkle_root,
+                      self.target)
+        block.seal()
+        return block
+
+    def header(self) -> dict:
+        """
+        Return fields covered by block hash
+        :return: dict with header fields
+        """
+        header = {"id": self.id,
+                  "merkle_root": self.merkle_root,
+                  "nonce": self.nonce,
+                  "previous_hash": self.previous_hash,
+                  "timestamp": self.timestamp}
+        if self.target is not None:
+            header["target"] = format(self.target, '064x')
+        return header
+
+    def to_dict(self, include_hash: bool = True) -> dict:
+        """
+        Return dict representation of block
+        :param include_hash: include hash field
+        :return: dict with header fields and transactions
+        """
+        block_dict = self.header()
+        block_dict["transactions"] = list(self.transactions)
+        if include_hash:
+            block_dict["hash"] = self.hash
+        return block_dict
+
+    def transaction_proof(self, tx_hash: str):
+        """
+        Return Merkle inclusion proof of transaction
+        :param tx_hash: transaction hash
+        :return: (position of transaction, proof) or None if transaction is not in block
+        """
+        tx_hashes = [transaction_hash(tx) for tx in self.transactions]
+        if tx_hash not in tx_hashes:
+            return None
+        index = tx_hashes.index(tx_hash)
+        return index, merkle_proof(tx_hashes, index)
+
+    def encoded(self) -> bytes:
+        """
+        Return canonical JSON encoding of block including hash, cached once block is sealed until released
+        :return: UTF-8 encoded JSON with sorted keys
+        """
+        if self._encoded is not None:
+            return self._encoded
+        return self._encode()
+
+    def _encode(self) -> bytes:
+        return json.dumps(self.to_dict(), sort_keys=True).encode('utf-8')
 
     def compute_hash(self) -> str:
         """
-        Return hash of whole block instance after converting to JSON
+        Return hash of block header after converting to JSON, transactions are committed to by the Merkle root
         :return: sha256 hash
         """
-        #block_dict = self.__dict__.pop('hash', None)  # Remove hash field value before calculating hash
-        block_dict = self.__dict__.copy()
-        block_dict.pop('hash', None) # Remove hash field value before calculating hash
-        block_string = json.dumps(block_dict, sort_keys=True).encode('utf-8')
-        return sha256(block_string).hexdigest()
+        return sha256(json.dumps(self.header(), sort_keys=True).encode('utf-8')).hexdigest()
@@ -1,20 +1,75 @@
 from time import time
 
-from block import Block
+import metrics
+from block import Block, transaction_hash, transaction_valid
+from blockstore import BlockStore
+from blocktree import BlockTree
+from difficulty import difficulty_target, retarget, target_work
+from index import ChainIndex
+from mempool import Mempool
+from mining import Miner
+
+add_block_seconds = metrics.histogram("blockchain_add_block_seconds", "Time of validating and adding a received block")
+check_chain_seconds = metrics.histogram("blockchain_check_chain_validity_seconds", "Time of validating a whole chain")
+pow_seconds = metrics.histogram("mining_proof_of_work_seconds", "Time of proof of work per mined block")
+pow_hashes = metrics.counter("mining_hashes_total", "Hashes computed by proof of work")
+pow_cancelled = metrics.counter("mining_cancelled_total", "Proofs of work cancelled by a new block")
 
 
 class BlockChain:
     """Blockchain Class"""
     genesis_block_previous_hash = '0'  # previous hash of genesis block
 
-    def __init__(self, difficulty: int) -> None:
+    def __init__(self, difficulty: int, miner: Miner = None, mempool: Mempool = None, chain=None,
+                 tree: BlockTree = None, block_interval: float = None, retarget_interval: int = None,
+                 max_block_size: int = None, archive=None, median_time_blocks: int = None,
+                 max_future_drift: float = None, encoded_blocks: int = None) -> None:
         """
         Class initialization
-        :param difficulty: Specifies difficulty of PoW algorithm, defines number zeroes at the start
+        :param difficulty: initial difficulty of PoW algorithm, number of zeroes at the start of hash, defines
+                           the target of blocks until the first retarget
+        :param miner: Miner used for PoW, mines on single core if not given
+        :param mempool: Mempool for unconfirmed transactions, unbounded if not given
+        :param chain: list like storage of blocks, e.g. BlockStore, chain is kept in memory if not given
+        :param tree: BlockTree keeping competing branches, default depth if not given
+        :param block_interval: seconds between blocks the target is adjusted to
+        :param retarget_interval: blocks between target adjustments, at least 2, target is fixed if None
+        :param max_block_size: maximum number of transactions per block, unlimited if None
+        :param archive: BlockStore receiving bodies of pruned blocks, bodies are dropped if None
+        :param median_time_blocks: blocks whose median timestamp a new block has to exceed, unchecked if None
+        :param max_future_drift: seconds a block timestamp may be ahead of local time, unchecked if None
+        :param encoded_blocks: last blocks of an in-memory chain keeping their cached encoding, all if None
         """
-        self.unconfirmed_transactions = []  # transactions waiting for adding to the chain
-        self.chain = []
+        if retarget_interval is not None and retarget_interval < 2:
+            # the timespan of a window is measured from its first to its last block
+            raise ValueError("retarget interval has to be at least 2 blocks")
+        self.mempool = mempool if mempool is not None else Mempool()  # transactions waiting for adding to the chain
+        self.chain = chain if chain is not None else []
+        self.index = ChainIndex(self.chain)  # transaction, author and time indexes, see ChainIndex.build
+        self.tree = tree if tree is not None else BlockTree()  # side branches competing with chain
         self.difficulty = difficulty
+        self.initial_target = difficulty_target(difficulty)
+        self.block_interval = block_interval
+        self.retarget_interval = retarget_interval if block_interval else None
+        self.max_block_size = max_block_size
+        self.median_time_blocks = median_time_blocks
+        self.max_future_drift = max_future_drift
+        self.encoded_blocks = encoded_blocks
+        self.archive = archive
+        if archive is not None and len(archive) and (len(archive) > len(self.chain)
+                                                     or archive[-1].hash != self.chain[len(archive) - 1].hash):
+            archive.truncate(0)  # archived bodies of another chain, e.g. of an earlier in-memory chain
+        self.pruned_height = 0  # blocks below this id are kept as headers, bodies were pruned or never downloaded
+        self.miner = miner or Miner()
+        self.tip_listeners = []  # functions called with the new last block whenever a block is appended to chain
+        self.chain_work = None  # cumulative work of chain up to each block, kept in the index of a BlockStore chain
+        if not isinstance(self.chain, BlockStore):
+            self.chain_work = []
+            work = 0
+            for block in self.chain:
+                work += self.block_work(block)
+                self.chain_work.append(work)
+            self.index.build()  # blocks are in memory already, a stored chain is indexed in steps by the node
 
     def create_genesis_block(self) -> None:
         """
@@ -22,7 +77,119 @@ class BlockChain:
         """
         genesis_block = Block(0, [], time(), BlockChain.genesis_block_previous_hash)
         genesis_block.hash = genesis_block.compute_hash()
-        self.chain.append(genesis_block)
+        self._append(genesis_block)
+
+    def block_work(self, block: Block) -> int:
+        """
+        Return work of block, the expected number of hashes needed to mine it
+        :param block: Block object
+        :return: work
+        """
+        return target_work(self.block_target(block))
+
+    def block_target(self, block: Block) -> int:
+        """
+        Return target of block, blocks without target have the initial target
+        :param block: Block object
+        :return: highest valid hash value
+        """
+        return block.target if block.target is not None else self.initial_target
+
+    def next_target(self, parent: Block, chain=None) -> int:
+        """
+        Return target required of block following parent
+        Every retarget_interval blocks the target is scaled by how long the last window of blocks on the
+        branch of parent took compared to block_interval, otherwise the target of parent is kept
+        :param parent: Block object, last block of chain or of a side branch
+        :param chain: list of blocks parent belongs to, chain and side blocks of this BlockChain if None
+        :return: highest valid hash value
+        """
+        target = self.block_target(parent)
+        height = parent.id + 1
+        if not self.retarget_interval or height % self.retarget_interval or height < self.retarget_interval:
+            return target
+        first = self._ancestor(parent, height - self.retarget_interval, chain)
+        if first is None:
+            return target
+        return retarget(target, parent.timestamp - first.timestamp, (self.retarget_interval - 1) * self.block_interval)
+
+    def _ancestor(self, block: Block, height: int, chain=None):
+        """
+        Return block at height on the branch of block, None if the branch is not known down to height
+        """
+        if chain is not None:
+            return chain[height] if height < len(chain) else None
+        while block.id > height:
+            if block.id < len(self.chain) and self.chain[block.id].hash == block.hash:
+                return self.chain[height]
+            parent = self.tree.get(block.previous_hash)
+            if parent is None and self._follows_chain(block):
+                parent = self.chain[block.id - 1]
+            if parent is None:
+                return None
+            block = parent
+        return block
+
+    def median_time_past(self, block: Block, chain=None) -> float:
+        """
+        Return median timestamp of the last median_time_blocks blocks on the branch of block up to it
+        :param block: Block object, last block of chain or of a side branch
+        :param chain: list of blocks block belongs to, chain and side blocks of this BlockChain if None
+        :return: timestamp
+        """
+        start = max(0, block.id - self.median_time_blocks + 1)
+        if chain is not None:
+            timestamps = [b.timestamp for b in chain[start:block.id + 1]]
+        else:
+            timestamps = []
+            while block is not None and block.id >= start:
+                if block.id < len(self.chain) and self.chain[block.id].hash == block.hash:
+                    timestamps.extend(self._timestamps(start, block.id + 1))
+                    break
+                timestamps.append(block.timestamp)
+                parent = self.tree.get(block.previous_hash)
+                if parent is None and block.id > 0 and self._follows_chain(block):
+                    parent = self.chain[block.id - 1]
+                block = parent
+        timestamps.sort()
+        return timestamps[len(timestamps) // 2]
+
+    def _timestamps(self, start: int, stop: int) -> list:
+        if self.chain_work is None:
+            return self.chain.timestamps(start, stop)
+        return [block.timestamp for block in self.chain[start:stop]]
+
+    def work_at(self, block_id: int) -> int:
+        """
+        Return cumulative work of chain up to block
+        :param block_id: block id, negative ids count from the last block
+        :return: work
+        """
+        if self.chain_work is None:
+            return self.chain.work(block_id)
+        return self.chain_work[block_id]
+
+    def timestamp_valid(self, block: Block, previous: Block, chain=None) -> bool:
+        """
+        Checks that timestamp of block is above the median timestamp of the blocks before it and not
+        too far ahead of local time, timestamps steer retargeting so they can not be chosen freely
+        :param block: Block object to check
+        :param previous: preceding Block object
+        :param chain: list of blocks previous belongs to, chain and side blocks of this BlockChain if None
+        :return: True if correct, False if incorrect
+        """
+        if not isinstance(block.timestamp, (int, float)):
+            return False
+        if self.max_future_drift is not None and block.timestamp > time() + self.max_future_drift:
+            return False
+        return not self.median_time_blocks or block.timestamp > self.median_time_past(previous, chain)
+
+    def total_work(self) -> int:
+        """
+        Return cumulative work of chain, branch with most work is the valid one
+        :return: work
+        """
+        return self.work_at(-1) if len(self.chain) else 0
 
     def last_block(self) -> Block:
         """
@@ -34,14 +201,19 @@ class BlockChain:
     def proof_of_work(self, block: Block) -> str:
         """
         Finds nonce to fulfill difficulty requirements
+        Blocks without target get the target required after the last block of the chain
         :param block: Block object
-        :return: hash
+        :return: hash or None if mining was cancelled
         """
-        block.nonce = 0
-        hash = block.compute_hash()
-        while not hash.startswith('0' * self.difficulty):
-            block.nonce += 1
-            hash = block.compute_hash()
+        if block.target is None:
+            block.target = self.next_target(self.last_block()) if self.chain else self.initial_target
+        with pow_seconds.time():
+            result = self.miner.mine(block, block.target)
+        pow_hashes.inc(sum(s["attempts"] for s in self.miner.last_stats))
+        if result is None:
+            pow_cancelled.inc()
+            return None
+        block.nonce, hash = result
         return hash
 
     def add_block(self, block: Block):
@@ -51,45 +223,285 @@ class BlockChain:
             - proof hash equals hash of block
             - block previous_hash equals hash of previous block
         Delete transactions in unconfirmed transaction list which have been mined in this block
+        Mining in progress is cancelled, since it builds on previous last block
+        Valid blocks not following the last block are kept as side blocks, see add_side_block
         :param block: Block object
-        :return:
+        :return: True if block was added to chain or as side block
         """
-        if self.last_block().hash == block.previous_hash and self.hash_valid_proof(block):
-            self.chain.append(block)
+        with add_block_seconds.time():
+            return self._add_block(block)
 
-            tx_to_del = []
-            for tx in block.transactions:
-                if tx in self.unconfirmed_transactions:
-                    tx_to_del.append(tx)
-            self.unconfirmed_transactions = [tx for tx in self.unconfirmed_transactions if tx not in tx_to_del]
+    def _add_block(self, block: Block) -> bool:
+        if self.check_block_validity(block, self.last_block()):
+            self._append(block)
+            self.miner.cancel()
+            self.mempool.remove(block.transactions)
+            self.tree.prune(block.id)
             return True
-        return False
+        return self.add_side_block(block)
+
+    def add_side_block(self, block: Block) -> bool:
+        """
+        Keep valid block of competing branch, chain switches to the branch once it has more work
+        :param block: Block object following a block of the chain or a side block
+        :return: True if block was added
+        """
+        if block.hash in self.tree or (block.id < len(self.chain) and self.chain[block.id].hash == block.hash):
+            return False  # already known
+        if block.id < self.index.pruned_height:
+            # blocks without bodies can not be replaced, their transactions are unknown, blocks of a
+            # BlockStore chain keep their bodies but their index entries were pruned
+            return False
+
+        parent = self.tree.get(block.previous_hash)
+        if parent is not None:
+            parent_work = self.tree.work(parent.hash)
+        elif block.id == 0:
+            return False  # genesis block of another chain, see replace_foreign_chain
+        elif self._follows_chain(block):
+            parent = self.chain[block.id - 1]
+            parent_work = self.work_at(block.id - 1)
+        else:
+            return False  # parent unknown, peer chain has to be synchronized
+        if not self.check_block_validity(block, parent):
+            return False
+
+        block.seal()
+        self.tree.add(block, parent_work + self.block_work(block))
+        self.switch_branch(block.hash)
+        return True
+
+    def add_blocks(self, blocks: list) -> int:
+        """
+        Add blocks in order, see add_block
+        :param blocks: list of Block objects
+        :return: number of blocks added before the first rejected one
+        """
+        for added, block in enumerate(blocks):
+            if not self.add_block(block):
+                return added
+        return len(blocks)
+
+    def switch_branch(self, tip_hash: str) -> bool:
+        """
+        Make branch of side blocks ending with tip the chain if it has more work than the chain
+        Only blocks after the common ancestor are replaced
+        :param tip_hash: hash of last side block of branch
+        :return: True if chain was switched
+        """
+        if tip_hash not in self.tree or self.tree.work(tip_hash) <= self.total_work():
+            return False
+        blocks = self.side_branch(tip_hash)
+        if not blocks or blocks[0].id < self.index.pruned_height:
+            return False  # branch forks below pruned blocks, e.g. its first blocks were kept before pruning
+        self.replace_suffix(blocks[0].id, blocks)
+        return True
+
+    def side_branch(self, tip_hash: str) -> list:
+        """
+        Return side blocks after the common ancestor with the chain up to tip
+        :param tip_hash: hash of last side block of branch
+        :return: list of Block objects in chain order, empty if tip is not a side block
+        """
+        return self.tree.branch(tip_hash, self._follows_chain)
+
+    def _follows_chain(self, block: Block) -> bool:
+        if block.id == 0:
+            return True  # a genesis block replaces the whole chain
+        return block.id <= len(self.chain) and self.chain[block.id - 1].hash == block.previous_hash
+
+    def _append(self, block: Block) -> None:
+        block.seal()
+        work = self.total_work() + self.block_work(block)
+        if self.chain_work is None:
+            self.chain.append(block, work)
+        else:
+            self.chain.append(block)
+            self.chain_work.append(work)
+            if self.encoded_blocks is not None and len(self.chain) > self.encoded_blocks:
+                # old blocks are rarely sent, their encoding would double the memory of their transactions
+                self.chain[-1 - self.encoded_blocks].release_encoding()
+        self.index.add_block(block)
+        for listener in self.tip_listeners:
+            listener(block)
 
     def hash_valid_proof(self, block: Block):
-        return block.hash.startswith('0' * self.difficulty) and block.hash == block.compute_hash()
+        return block.hash == block.compute_hash() and int(block.hash, 16) <= self.block_target(block)
 
-    def add_new_transaction(self, transaction):
-        self.unconfirmed_transactions.append(transaction)
+    def add_new_transaction(self, transaction) -> bool:
+        """
+        Add transaction to mempool, transactions already in the chain are rejected
+        :param transaction: transaction dict
+        :return: True if added, False if transaction is already pending or mined
+        """
+        if self.index.locate(transaction_hash(transaction)) is not None:
+            return False
+        return self.mempool.add(transaction)
+
+    def new_block(self):
+        """
+        Return block of pending transactions following last block, transactions are a snapshot of mempool
+        Block size follows the backlog of the mempool up to max_block_size, oldest transactions first
+        :return: Block object to mine or None if there are no pending transactions
+        """
+        if not len(self.mempool):
+            return None
+        last_block = self.last_block()
+        timestamp = time()
+        if self.median_time_blocks:
+            timestamp = max(timestamp, self.median_time_past(last_block) + 0.001)  # clock behind other nodes
+        return Block(last_block.id + 1, self.mempool.take(self.max_block_size), timestamp, last_block.hash,
+                     target=self.next_target(last_block))
 
     def mine(self):
-        if not self.unconfirmed_transactions:
+        block = self.new_block()
+        if block is None:
             return False
-        block = Block(self.last_block().id + 1, self.unconfirmed_transactions, time(), self.last_block().hash)
         block.hash = self.proof_of_work(block)
-        self.add_block(block)
-        self.unconfirmed_transactions = []
+        if block.hash is None or not self.add_block(block) or self.last_block() is not block:
+            return False
         return block.id
 
+    def replace_foreign_chain(self, chain: list) -> bool:
+        """
+        Replace chain by a chain starting with another genesis block if it has more work, chain has to be
+        validated by caller, see check_chain_validity. Single blocks of such a chain are not kept as side blocks,
+        a lone genesis block could otherwise replace the chain.
+        :param chain: list of Block objects from genesis block on
+        :return: True if chain was replaced
+        """
+        if not chain or (self.chain and chain[0].hash == self.chain[0].hash):
+            return False
+        if sum(self.block_work(block) for block in chain) <= self.total_work():
+            return False
+        self.replace_suffix(0, chain)
+        return True
+
+    def replace_suffix(self, start: int, blocks: list) -> None:
+        """
+        Replace blocks from id start onwards, blocks have to be validated by caller
+        Transactions mined in the new blocks are removed from mempool, transactions of replaced blocks
+        not mined in the new ones return to mempool. Replaced blocks are kept as side blocks.
+        Cost depends only on number of replaced and new blocks.
+        :param start: id of first replaced block
+        :param blocks: list of Block objects continuing chain at start
+        """
+        removed = self.chain[start:]
+        removed_work = [self.work_at(block_id) for block_id in range(start, len(self.chain))]
+        self.index.remove_blocks(removed)
+        del self.chain[start:]
+        if self.chain_work is not None:
+            del self.chain_work[start:]
+        for block in blocks:
+            self.tree.remove(block.hash)
+            self._append(block)
+            self.mempool.remove(block.transactions)
+
+        for block, work in zip(removed, removed_work):
+            self.tree.add(block, work)
+            for tx in block.transactions:
+                self.add_new_transaction(tx)
+        self.tree.prune(self.last_block().id)
+        self.miner.cancel()
+
+    def prune(self, height: int) -> int:
+        """
+        Drop bodies of blocks below height, the blocks are kept as headers so the chain can still be
+        validated and extended. Bodies are appended to archive while it continues the archived blocks.
+        Bodies of a BlockStore chain stay on disk, only the indexes of their transactions are pruned.
+        Transactions of pruned blocks can still be located by hash, branches forking below height are rejected.
+        :param height: id of first block keeping its body, the last block always keeps it
+        :return: number of pruned blocks
+        """
+        height = min(height, len(self.chain) - 1)
+        start = self.index.pruned_height  # bodies of a BlockStore chain are kept, progress is that of the index
+        if height <= start:
+            return 0
+        for block_id in range(start, height):
+            block = self.chain[block_id]
+            if self.archive is not None and len(self.archive) == block_id:
+                self.archive.append(block)
+            if isinstance(self.chain, list):
+                self.chain[block_id] = block.pruned()
+        if self.archive is not None:
+            self.archive.flush()
+        self.index.prune(height)
+        if isinstance(self.chain, list):
+            self.pruned_height = height
+        return height - start
+
+    def available_from(self) -> int:
+        """
+        Return id of first block whose body is in the chain or in the archive
+        """
+        if self.archive is not None and len(self.archive) >= self.pruned_height:
+            return 0
+        return self.pruned_height
+
+    def bodies(self, start: int, stop: int) -> list:
+        """
+        Return blocks with transactions, pruned blocks are read from archive
+        :param start: id of first block, not below available_from()
+        :param stop: id after last block
+        :return: list of Block objects
+        """
+        if start >= self.pruned_height:
+            return self.chain[start:stop]
+        if start < self.available_from():
+            raise LookupError(f"bodies of blocks below #{self.pruned_height} were pruned")
+        return self.archive[start:min(stop, self.pruned_height)] + self.chain[max(start, self.pruned_height):stop]
+
+    def bootstrap(self, headers: list, entries) -> None:
+        """
+        Replace chain by validated headers of a snapshot, blocks following the last header are added
+        with their bodies as usual
+        :param headers: list of Block objects without transactions from genesis block to snapshot height
+        :param entries: locations of transactions in the headers' blocks, (tx hash, block id, position)
+        """
+        self.replace_suffix(0, headers)
+        self.index.add_pruned(entries)
+        self.index.pruned_height = len(headers)
+        self.pruned_height = len(headers)
+
+    def check_block_validity(self, block: Block, previous: Block, chain=None) -> bool:
+        """
+        Checks if block correctly continues previous block
+        :param block: Block object to check
+        :param previous: preceding Block object, None if block is genesis block
+        :param chain: list of blocks previous belongs to, chain and side blocks of this BlockChain if None
+        :return: True if correct, False if incorrect
+        """
+        if previous is None:
+            # a genesis block with its own target could claim any work, it has the initial target
+            return (block.id == 0 and block.previous_hash == BlockChain.genesis_block_previous_hash
+                    and block.target in (None, self.initial_target) and isinstance(block.timestamp, (int, float))
+                    and block.hash == block.compute_hash()
+                    and self.transactions_valid(block))
+        return (block.id == previous.id + 1 and block.previous_hash == previous.hash
+                and (self.max_block_size is None or len(block.transactions) <= self.max_block_size)
+                and self.timestamp_valid(block, previous, chain)
+                and self.block_target(block) == self.next_target(previous, chain)
+                and self.hash_valid_proof(block) and self.transactions_valid(block))
+
+    @staticmethod
+    def transactions_valid(block: Block) -> bool:
+        """
+        Checks that transactions of block are valid, see transaction_valid
+        :param block: Block object
+        :return: True if correct, False if incorrect
+        """
+        return all(transaction_valid(tx) for tx in block.transactions)
+
     def check_chain_validity(self, chain):
         """
         Checks if entire chain is valid
         :param chain: chain to check
         :return: True if correct, False if incorrect
         """
-        previous_hash = BlockChain.genesis_block_previous_hash
-
-        for block in chain:
-            if block.previous_hash != previous_hash or block.hash != block.compute_hash():
-                return False
-            previous_hash = block.previous_hash
-        return True
+        with check_chain_seconds.time():
+            previous = None
+            for block in chain:
+                if not self.check_block_validity(block, previous, chain):
+                    return False
+                previous = block
+            return True
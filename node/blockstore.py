@@ -0,0 +1,294 @@
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, stores are not locked there
+    fcntl = None
+
+from block import Block
+
+
+class BlockStore:
+    """
+    Append-only on-disk block storage, usable in place of the chain list of BlockChain.
+
+    Blocks are stored as JSON records in segment files, each record prefixed by
+    a header with magic, payload length and crc32 of the payload. A separate
+    index file holds one fixed size record per block id with segment number,
+    offset, length, hash and timestamp of the block and the cumulative work of
+    the chain up to it. Both are read through mmap, so opening a store only checks
+    the tail for torn writes and does not read the chain.
+    A store is locked while it is open, a second process opening it fails.
+    """
+    record_header = struct.Struct('<4sII')  # magic, payload length, crc32 of payload
+    record_magic = b'BLK1'
+    # block id, segment, offset, record length, hash, cumulative work, timestamp
+    index_record = struct.Struct('<QIQI32s32sd')
+    index_name = 'index-v2.dat'
+    legacy_index_name = 'index.dat'  # index without work and timestamp, such stores have to be synced again
+    lock_name = 'lock'
+    segment_name = 'segment-{:05d}.dat'
+
+    def __init__(self, path: str, segment_size: int = 64 * 1024 * 1024, fsync_batch: int = 64) -> None:
+        """
+        Open block store in directory, creating it if it does not exist
+        :param path: directory of store
+        :param segment_size: size in bytes after which new segment file is started
+        :param fsync_batch: number of appended blocks between fsync calls
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync_batch = fsync_batch
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, BlockStore.lock_name), 'a+b')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"block store {path} is used by another process") from None
+        if os.path.exists(os.path.join(path, BlockStore.legacy_index_name)):
+            self._lock_file.close()
+            raise RuntimeError(f"block store {path} has an index of an older version, remove it to sync the chain again")
+
+        self._index_file = open(os.path.join(path, BlockStore.index_name), 'a+b')
+        self._index_map = None
+        self._segment_maps = {}
+        self._segment_file = None  # segment file appended to, opened after recovery
+        self._segment = 0
+        self._unsynced = 0
+        self._hashes = None  # hash -> block id, built on first lookup by hash
+        self._tip = None  # cached last block
+
+        self._recover()
+        self._open_segment(self._segment)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._read(i)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._read(i) for i in range(*item.indices(self._length))]
+        if item < 0:
+            item += self._length
+        if not 0 <= item < self._length:
+            raise IndexError("block store index out of range")
+        return self._read(item)
+
+    def __delitem__(self, item) -> None:
+        """
+        Remove blocks from the end of the store, only `del store[n:]` is supported
+        """
+        if not isinstance(item, slice) or item.stop is not None or item.step is not None:
+            raise ValueError("only tail of block store can be deleted")
+        self.truncate(item.indices(self._length)[0])
+
+    def append(self, block: Block, work: int = 0) -> None:
+        """
+        Write block at the end of the store, fsync every fsync_batch blocks
+        :param block: Block object, its id has to equal the length of the store
+        :param work: cumulative work of the chain up to block
+        """
+        payload = block.encoded()
+        record = BlockStore.record_header.pack(BlockStore.record_magic, len(payload), zlib.crc32(payload)) + payload
+        if self._segment_file.tell() > 0 and self._segment_file.tell() + len(record) > self.segment_size:
+            self.flush()
+            self._open_segment(self._segment + 1)
+
+        offset = self._segment_file.tell()
+        self._segment_file.write(record)
+        self._segment_file.flush()
+        self._index_file.write(BlockStore.index_record.pack(self._length, self._segment, offset, len(record),
+                                                            bytes.fromhex(block.hash), work.to_bytes(32, 'big'),
+                                                            block.timestamp))
+        self._index_file.flush()
+
+        if self._hashes is not None:
+            self._hashes[block.hash] = self._length
+        self._length += 1
+        self._tip = block
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch:
+            self.flush()
+
+    def truncate(self, length: int) -> None:
+        """
+        Remove all blocks with id greater or equal to length
+        :param length: new number of blocks in store
+        """
+        if length >= self._length:
+            return
+        if length == 0:
+            segment, end = 0, 0
+        else:
+            _, segment, offset, size = self._index_entry(length - 1)[:4]
+            end = offset + size
+        # Mapped regions must not outlive truncation of the files
+        self._close_maps()
+        self._segment_file.close()
+        for s in range(segment + 1, self._segment + 1):
+            os.remove(self._segment_path(s))
+        with open(self._segment_path(segment), 'a+b') as f:
+            f.truncate(end)
+        self._index_file.truncate(length * BlockStore.index_record.size)
+        self._index_file.seek(0, os.SEEK_END)
+
+        self._length = length
+        self._hashes = None
+        self._tip = None
+        self._open_segment(segment)
+        self.flush()
+
+    def index_of(self, hash: str):
+        """
+        Return id of block with given hash
+        :param hash: block hash
+        :return: block id or None if block is not in store
+        """
+        if self._hashes is None:
+            self._hashes = {self._index_entry(i)[4].hex(): i for i in range(self._length)}
+        return self._hashes.get(hash)
+
+    def work(self, block_id: int) -> int:
+        """
+        Return cumulative work of the chain up to block, as given when it was appended
+        :param block_id: block id, negative ids count from the end
+        """
+        if block_id < 0:
+            block_id += self._length
+        if not 0 <= block_id < self._length:
+            raise IndexError("block store index out of range")
+        return int.from_bytes(self._index_entry(block_id)[5], 'big')
+
+    def timestamps(self, start: int, stop: int) -> list:
+        """
+        Return timestamps of blocks from start up to stop without reading the blocks
+        :param start: id of first block
+        :param stop: id after last block
+        """
+        return [self._index_entry(i)[6] for i in range(*slice(start, stop).indices(self._length))]
+
+    def flush(self) -> None:
+        """
+        Write appended blocks to disk
+        """
+        for f in (self._segment_file, self._index_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._close_maps()
+        self._segment_file.close()
+        self._index_file.close()
+        self._lock_file.close()  # releases lock
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, BlockStore.segment_name.format(segment))
+
+    def _open_segment(self, segment: int) -> None:
+        self._segment = segment
+        self._segment_file = open(self._segment_path(segment), 'a+b')
+        self._segment_file.seek(0, os.SEEK_END)
+
+    def _map(self, f, current):
+        """
+        Return read only mmap of file covering its current size, reusing current map if still large enough
+        """
+        size = os.fstat(f.fileno()).st_size
+        if current is not None and len(current) >= size:
+            return current
+        if current is not None:
+            current.close()
+        return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+    def _close_maps(self) -> None:
+        for m in [self._index_map] + list(self._segment_maps.values()):
+            if m is not None:
+                m.close()
+        self._index_map = None
+        self._segment_maps = {}
+
+    def _index_entry(self, block_id: int) -> tuple:
+        offset = block_id * BlockStore.index_record.size
+        if self._index_map is None or len(self._index_map) < offset + BlockStore.index_record.size:
+            self._index_map = self._map(self._index_file, self._index_map)
+        return BlockStore.index_record.unpack_from(self._index_map, offset)
+
+    def _segment_map(self, segment: int, end: int):
+        m = self._segment_maps.get(segment)
+        if m is None or len(m) < end:
+            if segment == self._segment and self._segment_file is not None:
+                m = self._map(self._segment_file, m)
+            elif os.path.exists(self._segment_path(segment)):
+                with open(self._segment_path(segment), 'rb') as f:
+                    m = self._map(f, m)
+            self._segment_maps[segment] = m
+        return m
+
+    def _read_payload(self, segment: int, offset: int, size: int):
+        """
+        Return payload of record or None if record is torn or corrupted
+        """
+        m = self._segment_map(segment, offset + size)
+        if m is None or len(m) < offset + size:
+            return None
+        magic, length, crc = BlockStore.record_header.unpack_from(m, offset)
+        payload = m[offset + BlockStore.record_header.size:offset + size]
+        if magic != BlockStore.record_magic or length != len(payload) or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def _read(self, block_id: int) -> Block:
+        if block_id == self._length - 1 and self._tip is not None:
+            return self._tip
+        _, segment, offset, size = self._index_entry(block_id)[:4]
+        payload = self._read_payload(segment, offset, size)
+        if payload is None:
+            raise IOError(f"block {block_id} is corrupted in store {self.path}")
+        block = Block.from_encoded(payload)
+        if block_id == self._length - 1:
+            self._tip = block
+        return block
+
+    def _recover(self) -> None:
+        """
+        Drop torn writes at the end of index and segment files left by an interrupted append
+        """
+        index_size = os.fstat(self._index_file.fileno()).st_size
+        self._length = index_size // BlockStore.index_record.size
+        if index_size % BlockStore.index_record.size:
+            self._index_file.truncate(self._length * BlockStore.index_record.size)
+
+        # Index record is written after segment record, drop index entries whose record did not make it to disk
+        while self._length > 0:
+            _, segment, offset, size = self._index_entry(self._length - 1)[:4]
+            if self._read_payload(segment, offset, size) is not None:
+                break
+            self._length -= 1
+        self._close_maps()
+        self._index_file.truncate(self._length * BlockStore.index_record.size)
+        self._index_file.seek(0, os.SEEK_END)
+
+        # Segment records without index entry are dropped as well
+        if self._length == 0:
+            segment, end = 0, 0
+        else:
+            _, segment, offset, size = self._index_entry(self._length - 1)[:4]
+            end = offset + size
+            self._close_maps()
+        s = segment + 1
+        while os.path.exists(self._segment_path(s)):
+            os.remove(self._segment_path(s))
+            s += 1
+        with open(self._segment_path(segment), 'a+b') as f:
+            f.truncate(end)
+        self._segment = segment
@@ -0,0 +1,71 @@
+from block import Block
+
+
+class BlockTree:
+    """
+    Blocks of branches competing with the main chain.
+
+    Side blocks are kept by hash together with the cumulative work of the
+    branch up to them, so a branch can be compared with the main chain and
+    switched to without downloading or validating its blocks again. Blocks
+    forking off deeper than max_depth below the tip are dropped.
+    """
+
+    def __init__(self, max_depth: int = 100) -> None:
+        """
+        Constructor for BlockTree class
+        :param max_depth: number of blocks below the tip side blocks are kept for
+        """
+        self.max_depth = max_depth
+        self._blocks = {}  # hash -> Block
+        self._work = {}  # hash -> cumulative work of branch ending with block
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self._blocks
+
+    def get(self, block_hash: str) -> Block:
+        return self._blocks.get(block_hash)
+
+    def work(self, block_hash: str) -> int:
+        return self._work[block_hash]
+
+    def add(self, block: Block, work: int) -> None:
+        """
+        Add side block
+        :param block: validated Block object
+        :param work: cumulative work of branch ending with block
+        """
+        self._blocks[block.hash] = block
+        self._work[block.hash] = work
+
+    def remove(self, block_hash: str) -> None:
+        self._blocks.pop(block_hash, None)
+        self._work.pop(block_hash, None)
+
+    def branch(self, tip_hash: str, is_main: callable) -> list:
+        """
+        Return side blocks from the main chain up to tip
+        :param tip_hash: hash of last block of branch
+        :param is_main: function taking block, True if block follows a block of the main chain
+        :return: list of Block objects in chain order, empty if branch does not reach the main chain
+        """
+        blocks = []
+        block = self._blocks.get(tip_hash)
+        while block is not None:
+            blocks.append(block)
+            if is_main(block):
+                blocks.reverse()
+                return blocks
+            block = self._blocks.get(block.previous_hash)
+        return []
+
+    def prune(self, tip_height: int) -> None:
+        """
+        Drop side blocks too deep below the tip of the main chain
+        :param tip_height: id of last block of the main chain
+        """
+        for block_hash in [h for h, b in self._blocks.items() if b.id < tip_height - self.max_depth]:
+            self.remove(block_hash)
@@ -0,0 +1,39 @@
+"""Chain builders shared by the tests of the node"""
+import json
+from hashlib import sha256
+
+from block import Block
+from blockchain import BlockChain
+
+
+def make_transaction(content: str, author: str = "alice", time: float = 1.0) -> dict:
+    transaction = {"author": author, "content": content, "time": time}
+    transaction["hash"] = sha256(json.dumps(transaction, sort_keys=True).encode('utf-8')).hexdigest()
+    return transaction
+
+
+def extend(previous: Block, transactions_per_block: list, timestamp: float) -> list:
+    """Build blocks on top of previous, difficulty 0 needs no proof of work"""
+    blocks = []
+    for transactions in transactions_per_block:
+        block = Block(previous.id + 1, transactions, timestamp, previous.hash)
+        blocks.append(block)
+        previous = block
+    return blocks
+
+
+def new_chain(difficulty: int = 0, **kwargs) -> BlockChain:
+    blockchain = BlockChain(difficulty, **kwargs)
+    blockchain.create_genesis_block()
+    return blockchain
+
+
+def grow(blockchain: BlockChain, count: int, content: str) -> list:
+    """Add count blocks with one transaction each, a second apart"""
+    blocks = []
+    for i in range(count):
+        last = blockchain.last_block()
+        block = Block(last.id + 1, [make_transaction(f"{content} {i}")], last.timestamp + 1, last.hash)
+        assert blockchain.add_block(block)
+        blocks.append(block)
+    return blocks
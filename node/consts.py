@@ -1,14 +1,76 @@
 # Node settings
 rsa_public_exponent = 65537
 rsa_key_size = 2048
+signature_scheme = "rsa-pss"  # "rsa-pss" or "ed25519", peers are verified with the scheme they advertise
 peer_timeout = 5
-block_timeout = 30 
+peer_request_timeout = (2, 10)  # (connect, read) seconds of requests to peers
+peer_fanout_workers = 32  # maximum number of concurrent requests to peers
+peer_pool_size = 256  # number of peers whose connections are kept alive
+peer_rtt_alpha = 0.2  # weight of newest request in moving averages of peer round trip time and failure rate
+peer_base_backoff = 1  # seconds a peer is skipped after a failed request, doubled with every further failure
+peer_max_backoff = 300  # maximum seconds a failing peer is skipped
+signature_cache_size = 4096  # recently verified signatures skipped when replayed
+signature_verify_workers = 4  # threads verifying batches of signatures
+signature_batch_delay = 0.005  # seconds signed messages of peers are collected to be verified as one batch
+signature_max_batch = 64  # collected signed messages are verified at once when this many are waiting
 
 # Blockchain settings
 keep_alive_timeout = 180
-difficulty = 2
+difficulty = 2  # initial difficulty, leading hex zeroes of block hash, sets the target until the first retarget
+block_interval = 30  # seconds between blocks the target is adjusted to
+retarget_interval = 20  # blocks between target adjustments
+retarget_max_factor = 4  # maximum factor the target changes by in one adjustment
+median_time_blocks = 11  # a block timestamp has to be above the median timestamp of this many previous blocks
+max_future_drift = 120  # seconds a block timestamp may be ahead of local time
+max_block_size = 5000  # maximum number of transactions per block
+encoded_blocks = 1000  # last blocks of an in-memory chain keeping their JSON encoding cached for /chain and gossip
+mining_idle_interval = 1  # seconds between checks for pending transactions while there is nothing to mine
+mining_workers = 1  # number of processes used for PoW, 1 mines in the proof of work thread of the node
+mining_check_interval = 4096  # nonces tried between checks for cancelled mining
+mempool_max_size = 50000  # oldest unconfirmed transactions are evicted above this size
+index_build_batch = 500  # stored blocks indexed per step while the transaction index is built after start
 
-# flask
+# Block store settings
+block_store_dir = "chain_data"  # directory of per-port block stores when --data-dir is not given, chain is kept in memory if None
+block_store_segment_size = 64 * 1024 * 1024  # bytes per segment file
+block_store_fsync_batch = 64  # appended blocks between fsync calls
+
+# Gossip settings
+gossip_max_delay = 0.05  # seconds new transactions are buffered before they are announced to peers
+gossip_max_batch = 500  # buffered transactions are announced at once when this many are pending
+gossip_fanout = 8  # random peers new blocks and transactions are announced to, all peers if None
+
+# Synchronization settings
+sync_page_size = 500  # headers requested per /headers page
+sync_peers = 4  # fastest peers asked for their tip by consensus, besides peers that reported more work
+sync_interval = 5  # seconds between asking sync peers for their tips while announcements reach only some peers
+sync_import_batch = 100  # streamed blocks validated and added at once
+foreign_chain_max_blocks = 10000  # blocks of a chain with another genesis block buffered until it has more work
+chain_stream_batch = 100  # blocks written per chunk of streamed /chain response
+
+# Snapshot and pruning settings
+snapshot_interval = 1000  # blocks between checkpoint heights snapshots are taken at
+snapshot_depth = 100  # blocks a checkpoint has to be below the last block before its snapshot is served
+snapshot_bootstrap = False  # joining nodes start from the snapshot of the peer, they serve /chain only after it
+prune_depth = None  # blocks below the checkpoint this far behind the last block lose bodies, >= snapshot_depth
+prune_interval = 60  # seconds between checks for prunable blocks
+archive_dir = None  # directory of block store receiving pruned bodies, bodies are discarded if None
+
+# Wire format settings
+wire_formats = ["msgpack", "json"]  # formats offered to peers in order of preference, msgpack needs msgpack package
+
+# Event stream settings
+events_keep_alive = 15  # seconds between comments keeping idle /events streams open
+
+# Query settings
+query_page_size = 100  # default number of messages returned by query endpoints
+query_max_page_size = 1000  # maximum number of messages returned by query endpoints
+
+# Metrics settings
+metrics_enabled = True  # collect metrics exposed on /metrics, instrumented code paths skip collection if False
+profiler_interval = 0.005  # default seconds between stack samples of the sampling profiler
+
+# Request settings
 register_node_fields = ["node_address", "public_key"]
 
 json_headers = {'Content-Type': "application/json"}
@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import sha256
+from threading import Lock
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import consts
+import metrics
+
+verify_seconds = metrics.histogram("signature_verify_seconds", "Time of verifying a signature not found in cache",
+                                   ("scheme",))
+verify_cache_hits = metrics.counter("signature_verify_cache_hits_total", "Signatures found in verified cache")
+
+
+class SignatureScheme:
+    """
+    Base class of signature schemes used to sign messages between nodes
+    """
+    name = None
+    public_key_type = None
+
+    def generate_private_key(self):
+        raise NotImplementedError
+
+    def sign(self, private_key, message: bytes) -> bytes:
+        raise NotImplementedError
+
+    def verify(self, public_key, message: bytes, signature: bytes) -> bool:
+        raise NotImplementedError
+
+
+class RSAPSSScheme(SignatureScheme):
+    """
+    RSA signatures with PSS padding and SHA256, the scheme of nodes not advertising one
+    """
+    name = "rsa-pss"
+    public_key_type = rsa.RSAPublicKey
+
+    def __init__(self, public_exponent: int = 65537, key_size: int = 2048) -> None:
+        self.public_exponent = public_exponent
+        self.key_size = key_size
+
+    def generate_private_key(self):
+        return rsa.generate_private_key(public_exponent=self.public_exponent, key_size=self.key_size,
+                                        backend=default_backend())
+
+    def sign(self, private_key, message: bytes) -> bytes:
+        return private_key.sign(message,
+                                padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+                                hashes.SHA256())
+
+    def verify(self, public_key, message: bytes, signature: bytes) -> bool:
+        try:
+            public_key.verify(signature, message,
+                              padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
+                              hashes.SHA256())
+            return True
+        except InvalidSignature:
+            return False
+
+
+class Ed25519Scheme(SignatureScheme):
+    """
+    Ed25519 signatures, fast key generation and signing, 64 byte signatures
+    """
+    name = "ed25519"
+    public_key_type = ed25519.Ed25519PublicKey
+
+    def generate_private_key(self):
+        return ed25519.Ed25519PrivateKey.generate()
+
+    def sign(self, private_key, message: bytes) -> bytes:
+        return private_key.sign(message)
+
+    def verify(self, public_key, message: bytes, signature: bytes) -> bool:
+        try:
+            public_key.verify(signature, message)
+            return True
+        except InvalidSignature:
+            return False
+
+
+default_scheme = RSAPSSScheme.name
+schemes = {RSAPSSScheme.name: RSAPSSScheme(consts.rsa_public_exponent, consts.rsa_key_size),
+           Ed25519Scheme.name: Ed25519Scheme()}
+
+
+def get_scheme(name: str = None) -> SignatureScheme:
+    """
+    Return signature scheme by name
+    :param name: name of scheme, default scheme if None
+    :return: SignatureScheme object
+    """
+    if name is None:
+        name = default_scheme
+    if name not in schemes:
+        raise ValueError(f"unsupported signature scheme: {name}")
+    return schemes[name]
+
+
+class PublicKey:
+    """
+    Parsed public key together with its signature scheme, PEM encoding and fingerprint
+    """
+
+    def __init__(self, pem: str, scheme: str = None) -> None:
+        """
+        Constructor for PublicKey class
+        :param pem: PEM encoded public key
+        :param scheme: name of signature scheme of key owner, default scheme if None
+        """
+        self.pem = pem
+        self.scheme = get_scheme(scheme)
+        self.key = serialization.load_pem_public_key(pem.encode(), backend=default_backend())
+        if not isinstance(self.key, self.scheme.public_key_type):
+            raise ValueError(f"public key does not match signature scheme {self.scheme.name}")
+        self.fingerprint = sha256(pem.encode()).digest()
+
+
+@lru_cache(maxsize=1024)
+def load_public_key(pem: str, scheme: str = None) -> PublicKey:
+    """
+    Parse PEM encoded public key, parsed keys are cached
+    :param pem: PEM encoded public key
+    :param scheme: name of signature scheme of key owner, default scheme if None
+    :return: PublicKey object
+    """
+    return PublicKey(pem, scheme)
+
+
+def public_key_pem(key) -> str:
+    """
+    Return PEM encoding of public key
+    :param key: public key object of cryptography
+    :return: PEM encoded public key
+    """
+    return key.public_bytes(encoding=serialization.Encoding.PEM,
+                            format=serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')
+
+
+class SignatureVerifier:
+    """
+    Signature verification with a cache of recently verified signatures.
+
+    Successful verifications are remembered in a bounded LRU keyed by the digest
+    of key fingerprint and message together with the signature, so gossip replayed by
+    several peers is only verified once. Batches are verified on a thread pool,
+    cryptography releases the GIL while verifying.
+    """
+
+    def __init__(self, cache_size: int = 4096, max_workers: int = 4) -> None:
+        """
+        Constructor for SignatureVerifier class
+        :param cache_size: number of remembered verified signatures
+        :param max_workers: number of threads verifying batches
+        """
+        self.cache_size = cache_size
+        self._verified = OrderedDict()
+        self._lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='signature-verifier')
+
+    def verify(self, message: bytes, signature: bytes, key: PublicKey) -> bool:
+        """
+        Verify signature of message
+        :param message: signed message
+        :param signature: signature bytes
+        :param key: PublicKey of signer
+        :return: True if signature is valid
+        """
+        entry = (sha256(key.fingerprint + message).digest(), signature)
+        with self._lock:
+            if entry in self._verified:
+                self._verified.move_to_end(entry)
+                verify_cache_hits.inc()
+                return True
+
+        with verify_seconds.time((key.scheme.name,)):
+            valid = key.scheme.verify(key.key, message, signature)
+        if not valid:
+            return False
+
+        with self._lock:
+            self._verified[entry] = True
+            if len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return True
+
+    def verify_batch(self, items: list) -> list:
+        """
+        Verify several signatures concurrently
+        :param items: list of (message, signature, key) tuples
+        :return: list of results in order of items
+        """
+        if len(items) == 1:
+            return [self.verify(*items[0])]
+        return list(self.executor.map(lambda item: self.verify(*item), items))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
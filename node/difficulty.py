@@ -0,0 +1,37 @@
+import consts
+
+max_target = 2 ** 256 - 1  # easiest target, every hash is valid
+
+
+def difficulty_target(difficulty: int) -> int:
+    """
+    Return target of hashes with given number of leading hex zeroes
+    :param difficulty: number of leading zeroes
+    :return: highest valid hash value
+    """
+    return 16 ** (64 - difficulty) - 1
+
+
+def target_work(target: int) -> int:
+    """
+    Return expected number of hashes needed to find one not above target
+    :param target: highest valid hash value
+    :return: work
+    """
+    return 2 ** 256 // (target + 1)
+
+
+def retarget(target: int, timespan: float, expected: float, max_factor: int = None) -> int:
+    """
+    Scale target by ratio of observed and expected time of a retarget window, blocks found faster than
+    expected make the target lower and mining harder
+    :param target: target of the window
+    :param timespan: seconds the window took according to block timestamps
+    :param expected: seconds the window should have taken
+    :param max_factor: maximum change of target in either direction, consts.retarget_max_factor if None
+    :return: new target
+    """
+    max_factor = max_factor or consts.retarget_max_factor
+    # milliseconds keep the computation in integers, every node gets the same target
+    actual = min(max(int(timespan * 1000), int(expected * 1000) // max_factor), int(expected * 1000) * max_factor)
+    return max(1, min(max_target, target * actual // int(expected * 1000)))
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+send_failures = metrics.counter("gossip_send_failures_total", "Batches of announcements whose sending raised")
+
+
+class GossipBuffer:
+    """
+    Coalesces outgoing transaction announcements into batches.
+
+    Transactions are handed over without blocking the caller. A background
+    thread sends them as one batch once max_batch transactions are pending or
+    max_delay seconds passed since the oldest pending transaction was added.
+    A batch whose sending fails is dropped, later batches are still sent.
+    """
+
+    def __init__(self, send, max_delay: float = 0.05, max_batch: int = 500) -> None:
+        """
+        Constructor for GossipBuffer class
+        :param send: function called with list of transactions to announce
+        :param max_delay: seconds a transaction waits at most before it is sent
+        :param max_batch: maximum number of transactions sent in one batch
+        """
+        self.send = send
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending = []
+        self._oldest = 0.0  # time when oldest pending transaction was added
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='gossip-buffer', daemon=True)
+        self._thread.start()
+
+    def add(self, transactions: list) -> None:
+        """
+        Queue transactions for announcement
+        :param transactions: list of transaction dicts
+        """
+        if not transactions:
+            return
+        with self._condition:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(transactions)
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """
+        Send all pending transactions in the calling thread
+        """
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            self._send(batch)
+
+    def _take(self) -> list:
+        with self._condition:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            self._oldest = time.monotonic()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                while len(self._pending) < self.max_batch:
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            batch = self._take()
+            if batch:
+                self._send(batch)
+
+    def _send(self, batch: list) -> None:
+        try:
+            self.send(batch)
+        except Exception:
+            send_failures.inc()
+            logger.exception("announcing %d transactions failed", len(batch))
@@ -0,0 +1,200 @@
+from bisect import bisect_left, insort
+from heapq import merge
+
+from block import Block, transaction_hash
+
+
+def transaction_time(tx: dict) -> float:
+    """Time of transaction used by the time index, transactions without numeric time sort first"""
+    value = tx.get("time")
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+def _remove_sorted(entries: list, entry) -> None:
+    position = bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+class ChainIndex:
+    """
+    Secondary indexes over transactions of the chain.
+
+    Transactions are located by (block id, position) so the index stays small
+    and works on top of any chain storage. Blocks are indexed when they are
+    appended and unindexed before they are removed by a chain replacement,
+    the indexes therefore always describe the current chain. Blocks below
+    pruned_height are only located by transaction hash, their author and
+    time entries are dropped with their bodies. Blocks already in the chain
+    when the index is created are indexed in steps by build, so opening a long
+    stored chain does not read it and no single call reads all of it. Until
+    the index is ready lookups only find transactions of blocks indexed so far,
+    blocks appended meanwhile are indexed at once.
+    """
+
+    def __init__(self, chain) -> None:
+        """
+        Constructor for ChainIndex class, blocks already in the chain are indexed by build
+        :param chain: list like storage of blocks the index refers to
+        """
+        self.chain = chain
+        self._transactions = {}  # tx hash -> (block id, position)
+        self._authors = {}  # author -> sorted list of (block id, position)
+        self._times = []  # sorted list of (time, block id, position)
+        self.pruned_height = 0  # author and time entries exist only for blocks from this id on
+        self._next = 0  # id of next block indexed by build
+        self._stop = len(chain)  # blocks from this id on are indexed when they are appended
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    @property
+    def ready(self) -> bool:
+        """
+        True once all blocks of the chain are indexed
+        """
+        return self._next >= self._stop
+
+    def build(self, count: int = None) -> bool:
+        """
+        Index next blocks of those already in the chain when the index was created
+        :param count: maximum number of indexed blocks, all remaining if None
+        :return: True if the index is ready
+        """
+        stop = self._stop if count is None else min(self._stop, self._next + count)
+        times = []
+        for block in self.chain[self._next:stop]:
+            self._add(block, times)
+        if times:
+            times.sort()
+            self._times = list(merge(self._times, times))  # one pass instead of inserting every entry
+        self._next = max(self._next, stop)
+        return self.ready
+
+    def add_block(self, block: Block) -> None:
+        """
+        Index transactions of block appended to the chain
+        :param block: Block object
+        """
+        self._add(block)
+
+    def _indexed(self, block_id: int) -> bool:
+        return block_id < self._next or block_id >= self._stop
+
+    def _add(self, block: Block, times: list = None) -> None:
+        # author and time entries only for blocks with body, the latest block of a transaction is located,
+        # time entries are collected in times if given and inserted by the caller
+        body = block.id >= self.pruned_height
+        for position, tx in enumerate(block.transactions):
+            location = (block.id, position)
+            tx_hash = transaction_hash(tx)
+            if self._transactions.get(tx_hash, location) <= location:
+                self._transactions[tx_hash] = location
+            if body:
+                insort(self._authors.setdefault(tx.get("author"), []), location)
+                entry = (transaction_time(tx), block.id, position)
+                if times is not None:
+                    times.append(entry)
+                else:
+                    insort(self._times, entry)
+
+    def remove_blocks(self, blocks: list) -> None:
+        """
+        Remove transactions of blocks from indexes, blocks have to be the last blocks of the chain
+        :param blocks: list of Block objects about to be removed from the chain
+        """
+        for block in reversed(blocks):
+            if not self._indexed(block.id):
+                continue
+            body = block.id >= self.pruned_height
+            for position in range(len(block.transactions) - 1, -1, -1):
+                tx = block.transactions[position]
+                location = (block.id, position)
+                if self._transactions.get(transaction_hash(tx)) == location:
+                    del self._transactions[transaction_hash(tx)]
+                if not body:
+                    continue  # author and time entries were pruned
+
+                locations = self._authors.get(tx.get("author"), [])
+                _remove_sorted(locations, location)
+                if not locations:
+                    self._authors.pop(tx.get("author"), None)
+                _remove_sorted(self._times, (transaction_time(tx), block.id, position))
+        if blocks:
+            self._stop = min(self._stop, blocks[0].id)  # blocks appended instead are indexed at once
+            self._next = min(self._next, self._stop)
+
+    def prune(self, height: int) -> None:
+        """
+        Drop author and time entries of blocks below height, transactions can still be located by hash
+        :param height: id of first block keeping its entries
+        """
+        if height <= self.pruned_height:
+            return
+        for author in list(self._authors):
+            locations = self._authors[author]
+            del locations[:bisect_left(locations, (height,))]
+            if not locations:
+                del self._authors[author]
+        self._times = [entry for entry in self._times if entry[1] >= height]
+        self.pruned_height = height
+
+    def add_pruned(self, entries) -> None:
+        """
+        Add locations of transactions of blocks whose bodies are not in the chain, e.g. taken from a snapshot
+        :param entries: iterable of (tx hash, block id, position)
+        """
+        for tx_hash, block_id, position in entries:
+            self._transactions[tx_hash] = (block_id, position)
+
+    def locations(self) -> list:
+        """
+        Return copy of the transaction hash index, complete once the index is ready
+        :return: list of (tx hash, (block id, position))
+        """
+        return list(self._transactions.items())
+
+    def locate(self, tx_hash: str):
+        """
+        Return location of transaction
+        :param tx_hash: transaction hash
+        :return: (block id, position) or None if transaction is not in the indexed blocks of the chain
+        """
+        return self._transactions.get(tx_hash)
+
+    def by_author(self, author: str, offset: int = 0, limit: int = None) -> tuple:
+        """
+        Return transactions of author in chain order
+        :param author: author name
+        :param offset: number of skipped transactions
+        :param limit: maximum number of returned transactions, all if None
+        :return: (total number of transactions of author, list of transaction dicts)
+        """
+        locations = self._authors.get(author, [])
+        stop = None if limit is None else offset + limit
+        return len(locations), self._resolve(locations[offset:stop])
+
+    def by_time(self, start: float = None, end: float = None, offset: int = 0, limit: int = None) -> tuple:
+        """
+        Return transactions with start <= time < end ordered by time
+        :param start: lower bound of time, unbounded if None
+        :param end: upper bound of time, unbounded if None
+        :param offset: number of skipped transactions
+        :param limit: maximum number of returned transactions, all if None
+        :return: (total number of transactions in range, list of transaction dicts)
+        """
+        low = 0 if start is None else bisect_left(self._times, (start,))
+        high = len(self._times) if end is None else bisect_left(self._times, (end,))
+        high = max(low, high)
+        stop = high if limit is None else min(high, low + offset + limit)
+        return high - low, self._resolve([entry[1:] for entry in self._times[low + offset:stop]])
+
+    def _resolve(self, locations: list) -> list:
+        # Consecutive locations mostly share blocks, each block is read once per run
+        transactions = []
+        block = None
+        for block_id, position in locations:
+            if block is None or block.id != block_id:
+                block = self.chain[block_id]
+            transactions.append(block.transactions[position])
+        return transactions
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+from block import transaction_hash
+
+
+class Mempool:
+    """
+    Unconfirmed transactions keyed by transaction hash.
+
+    Insert, remove and duplicate check are O(1), iteration follows insertion order
+    so blocks are built from the oldest transactions first. When max_size is
+    reached the oldest transactions are evicted.
+    """
+
+    def __init__(self, max_size: int = None) -> None:
+        """
+        Constructor for Mempool class
+        :param max_size: maximum number of held transactions, unbounded if None
+        """
+        self.max_size = max_size
+        self._transactions = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def __iter__(self):
+        return iter(self._transactions.values())
+
+    def __contains__(self, transaction: dict) -> bool:
+        return transaction_hash(transaction) in self._transactions
+
+    def add(self, transaction: dict) -> bool:
+        """
+        Add transaction unless already present, evict oldest transactions over size limit
+        :param transaction: transaction dict
+        :return: True if added, False if duplicate
+        """
+        key = transaction_hash(transaction)
+        if key in self._transactions:
+            return False
+        self._transactions[key] = transaction
+        if self.max_size is not None:
+            while len(self._transactions) > self.max_size:
+                self._transactions.popitem(last=False)
+        return True
+
+    def remove(self, transactions: list) -> int:
+        """
+        Remove transactions, e.g. after they have been mined in a block
+        :param transactions: list of transaction dicts
+        :return: number of removed transactions
+        """
+        removed = 0
+        for tx in transactions:
+            if self._transactions.pop(transaction_hash(tx), None) is not None:
+                removed += 1
+        return removed
+
+    def take(self, count: int = None) -> list:
+        """
+        Return oldest transactions without removing them
+        :param count: maximum number of returned transactions, all if None
+        :return: list of transaction dicts
+        """
+        if count is None:
+            return list(self._transactions.values())
+        return [tx for tx, _ in zip(self._transactions.values(), range(count))]
+
+    def clear(self) -> None:
+        self._transactions.clear()
@@ -0,0 +1,73 @@
+from hashlib import sha256
+
+# Leaves and inner nodes are hashed with different prefixes, so an inner node can not pass as a leaf
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+def leaf_hash(tx_hash: str) -> bytes:
+    return sha256(LEAF_PREFIX + tx_hash.encode('utf-8')).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return sha256(NODE_PREFIX + left + right).digest()
+
+
+def merkle_levels(tx_hashes: list) -> list:
+    """
+    Build all levels of Merkle tree, a node without sibling is carried to the next level unchanged
+    :param tx_hashes: list of transaction hashes
+    :return: list of levels from leaves to root, each a list of digests
+    """
+    levels = [[leaf_hash(h) for h in tx_hashes]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        next_level = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        levels.append(next_level)
+    return levels
+
+
+def merkle_root(tx_hashes: list) -> str:
+    """
+    Return Merkle root of transaction hashes
+    :param tx_hashes: list of transaction hashes
+    :return: hex encoded root, sha256 of empty string if there are no transactions
+    """
+    if not tx_hashes:
+        return sha256(b'').hexdigest()
+    return merkle_levels(tx_hashes)[-1][0].hex()
+
+
+def merkle_proof(tx_hashes: list, index: int) -> list:
+    """
+    Return inclusion proof of transaction at index
+    :param tx_hashes: list of transaction hashes of block
+    :param index: position of transaction in block
+    :return: list of [sibling hash, "l" or "r"] pairs from leaf to root, side tells where the sibling is
+    """
+    proof = []
+    for level in merkle_levels(tx_hashes)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append([level[sibling].hex(), 'l' if sibling < index else 'r'])
+        index //= 2
+    return proof
+
+
+def verify_proof(tx_hash: str, proof: list, root: str) -> bool:
+    """
+    Check that transaction hash is included in Merkle tree with given root
+    :param tx_hash: transaction hash
+    :param proof: proof returned by merkle_proof
+    :param root: hex encoded Merkle root
+    :return: True if proof is valid
+    """
+    digest = leaf_hash(tx_hash)
+    for sibling, side in proof:
+        if side == 'l':
+            digest = node_hash(bytes.fromhex(sibling), digest)
+        else:
+            digest = node_hash(digest, bytes.fromhex(sibling))
+    return digest.hex() == root
@@ -0,0 +1,301 @@
+import os
+import sys
+import threading
+
+from bisect import bisect_left
+from collections import Counter as _Counter
+from time import perf_counter
+
+import consts
+
+enabled = consts.metrics_enabled  # instrumentation is skipped when False, checked on every observation
+default_buckets = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0)
+_registry = {}  # name -> metric, in order of registration
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+             for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class of metrics, values are kept per tuple of label values
+    """
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        """
+        Constructor for Metric class
+        :param name: metric name
+        :param help: description shown in exposition
+        :param labels: names of labels, values are passed in the same order when observing
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> list:
+        """
+        Return lines of Prometheus text exposition
+        """
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        if not enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        with self._lock:
+            values = list(self._values.items())
+        return super().render() + [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+                                   for k, v in values]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down, either set or read from a function when rendered
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func=None) -> None:
+        super().__init__(name, help)
+        self.func = func
+        self._value = 0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        return self.func() if self.func is not None else self._value
+
+    def render(self) -> list:
+        return super().render() + [f"{self.name} {_format_value(self.value())}"]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels: tuple) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_noop_timer = _NoopTimer()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets, typically durations in seconds
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = default_buckets) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        if not enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, labels: tuple = ()):
+        """
+        Return context manager observing duration of its block, shared no-op one when disabled
+        """
+        if not enabled:
+            return _noop_timer
+        return _Timer(self, labels)
+
+    def count(self, labels: tuple = ()) -> int:
+        counts = self._values.get(labels)
+        return counts[-1] if counts else 0
+
+    def render(self) -> list:
+        lines = super().render()
+        with self._lock:
+            values = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(counts[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {counts[-1]}")
+        return lines
+
+
+def _register(cls, name: str, *args, **kwargs):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, *args, **kwargs)
+        return _registry[name]
+
+
+def counter(name: str, help: str, labels: tuple = ()) -> Counter:
+    """
+    Return registered counter, created on first use
+    """
+    return _register(Counter, name, help, labels)
+
+
+def histogram(name: str, help: str, labels: tuple = (), buckets: tuple = default_buckets) -> Histogram:
+    """
+    Return registered histogram, created on first use
+    """
+    return _register(Histogram, name, help, labels, buckets)
+
+
+def gauge(name: str, help: str, func=None) -> Gauge:
+    """
+    Return registered gauge, created on first use, func replaces function of an existing gauge
+    """
+    metric = _register(Gauge, name, help, func)
+    if func is not None:
+        metric.func = func
+    return metric
+
+
+def render() -> str:
+    """
+    Return all registered metrics in Prometheus text exposition format
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling stacks of all threads from a background thread.
+
+    Stacks are aggregated as collapsed stacks, one line of semicolon separated
+    frames and a sample count, the input format of flame graph tools. Nothing
+    runs while the profiler is stopped.
+    """
+    min_interval = 0.001  # seconds, shorter intervals would keep the sampling thread holding the GIL
+
+    def __init__(self) -> None:
+        self.stacks = _Counter()
+        self.samples = 0
+        self.interval = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005) -> bool:
+        """
+        Start sampling, samples collected before are kept
+        :param interval: seconds between samples, at least min_interval
+        :return: False if profiler was running already, raises ValueError if interval is invalid
+        """
+        if not self.min_interval <= interval < float('inf'):
+            raise ValueError(f"interval has to be at least {self.min_interval} seconds")
+        if self.running:
+            return False
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> bool:
+        """
+        Stop sampling
+        :return: False if profiler was not running
+        """
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def reset(self) -> None:
+        self.stacks.clear()
+        self.samples = 0
+
+    def collapsed(self) -> str:
+        """
+        Return collapsed stacks ordered by sample count
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(frames))] += 1
+            self.samples += 1
+
+
+profiler = SamplingProfiler()
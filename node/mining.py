@@ -0,0 +1,213 @@
+import json
+import multiprocessing
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from hashlib import sha256
+
+
+class MiningJob:
+    """
+    Proof of work search over a single block.
+
+    The block is serialized once and split into the bytes before and after the
+    nonce value. The sha256 state of the prefix is computed up front and copied
+    for every attempt, so only the nonce and the suffix are fed to the hash
+    function per nonce. Produced hashes are identical to Block.compute_hash.
+    """
+
+    def __init__(self, prefix: bytes, suffix: bytes) -> None:
+        """
+        Constructor for MiningJob class
+        :param prefix: serialized block up to nonce value
+        :param suffix: serialized block after nonce value
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+        self.midstate = sha256(prefix)
+
+    @classmethod
+    def from_block(cls, block):
+        """
+        Create mining job for block
+        :param block: Block object to mine
+        :return: MiningJob object
+        """
+        return cls(*cls.split_block(block))
+
+    @staticmethod
+    def split_block(block) -> tuple:
+        """
+        Serialize block header the same way as Block.compute_hash, split around nonce value
+        :param block: Block object
+        :return: (prefix bytes, suffix bytes)
+        """
+        block_dict = block.header()
+        block_dict.pop('nonce', None)
+
+        # json.dumps(sort_keys=True) with default separators joins sorted members as '"key": value'
+        keys = sorted(block_dict)
+        parts = [json.dumps(key) + ': ' + json.dumps(block_dict[key], sort_keys=True) for key in keys]
+        nonce_pos = len([key for key in keys if key < 'nonce'])
+        prefix = '{' + ', '.join(parts[:nonce_pos] + ['"nonce": '])
+        suffix = ''.join(', ' + part for part in parts[nonce_pos:]) + '}'
+        return prefix.encode('utf-8'), suffix.encode('utf-8')
+
+    def hash_for(self, nonce: int) -> str:
+        """
+        Return hash of block with given nonce
+        :param nonce: nonce value
+        :return: sha256 hash
+        """
+        h = self.midstate.copy()
+        h.update(str(nonce).encode() + self.suffix)
+        return h.hexdigest()
+
+    def search(self, target: int, start: int = 0, step: int = 1, attempts: int = None):
+        """
+        Try nonces start, start + step, ... until hash is not above target
+        :param target: highest valid hash value
+        :param start: first nonce to try
+        :param step: distance between tried nonces
+        :param attempts: maximum number of tried nonces, unlimited if None
+        :return: (nonce, hash) or None if no nonce was found within attempts
+        """
+        # hex digests of equal length compare like the numbers they encode
+        bound = format(target, '064x')
+        midstate = self.midstate
+        suffix = self.suffix
+        nonce = start
+        tried = 0
+        while attempts is None or tried < attempts:
+            h = midstate.copy()
+            h.update(str(nonce).encode() + suffix)
+            hash = h.hexdigest()
+            if hash <= bound:
+                return nonce, hash
+            nonce += step
+            tried += 1
+        return None
+
+
+# Set in worker processes by _init_worker, shared with Miner.cancel_event
+_cancel_event = None
+
+
+def _init_worker(cancel_event) -> None:
+    global _cancel_event
+    _cancel_event = cancel_event
+
+
+def _search(job: MiningJob, target: int, offset: int, stride: int, check_interval: int, cancel_event) -> dict:
+    """
+    Search nonces offset, offset + stride, ... until a valid hash is found or mining is cancelled
+    :return: dict with found nonce and hash (None if cancelled), tried attempts and elapsed seconds
+    """
+    start = time.perf_counter()
+    nonce = offset
+    tried = 0
+    found = None
+    while not cancel_event.is_set():
+        found = job.search(target, start=nonce, step=stride, attempts=check_interval)
+        if found:
+            tried += (found[0] - nonce) // stride + 1
+            break
+        nonce += stride * check_interval
+        tried += check_interval
+    return {"nonce": found[0] if found else None,
+            "hash": found[1] if found else None,
+            "attempts": tried,
+            "seconds": time.perf_counter() - start}
+
+
+def _search_worker(prefix: bytes, suffix: bytes, target: int, offset: int, stride: int,
+                   check_interval: int) -> dict:
+    return _search(MiningJob(prefix, suffix), target, offset, stride, check_interval, _cancel_event)
+
+
+class Miner:
+    """
+    Runs proof of work on one or more cores.
+
+    With more than one worker the nonce space is interleaved across persistent
+    worker processes: worker i tries nonces i, i + workers, i + 2 * workers, ...
+    All workers stop as soon as one of them finds a valid hash or cancel() is called.
+    """
+
+    def __init__(self, workers: int = 1, check_interval: int = 4096) -> None:
+        """
+        Constructor for Miner class
+        :param workers: number of worker processes, 1 mines in the calling thread
+        :param check_interval: attempts between checks of cancellation flag
+        """
+        self.workers = workers
+        self.check_interval = check_interval
+        self.cancel_event = multiprocessing.Event()
+        self.executor = None
+        self.mining = False
+        self.last_stats = []  # per-worker statistics of last mining run
+
+    def mine(self, block, target: int):
+        """
+        Finds nonce giving a hash not above target
+        :param block: Block object
+        :param target: highest valid hash value
+        :return: (nonce, hash) or None if mining was cancelled
+        """
+        prefix, suffix = MiningJob.split_block(block)
+        self.cancel_event.clear()
+        self.mining = True
+        try:
+            if self.workers <= 1:
+                results = [_search(MiningJob(prefix, suffix), target, 0, 1, self.check_interval,
+                                   self.cancel_event)]
+            else:
+                results = self._mine_parallel(prefix, suffix, target)
+        finally:
+            self.mining = False
+
+        self.last_stats = [{"worker": i,
+                            "attempts": r["attempts"],
+                            "seconds": r["seconds"],
+                            "hash_rate": r["attempts"] / r["seconds"] if r["seconds"] else 0.0}
+                           for i, r in enumerate(results)]
+        found = [r for r in results if r["nonce"] is not None]
+        if not found:
+            return None
+        best = min(found, key=lambda r: r["nonce"])
+        return best["nonce"], best["hash"]
+
+    def _mine_parallel(self, prefix: bytes, suffix: bytes, target: int) -> list:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                initargs=(self.cancel_event,))
+        futures = [self.executor.submit(_search_worker, prefix, suffix, target, i, self.workers,
+                                        self.check_interval)
+                   for i in range(self.workers)]
+        wait(futures, return_when=FIRST_COMPLETED)
+        # First finished worker either found a hash or mining was cancelled, stop the rest
+        self.cancel_event.set()
+        return [f.result() for f in futures]
+
+    def cancel(self) -> None:
+        """
+        Abort mining in progress, e.g. when a competing block at the same height was accepted
+        """
+        if self.mining:
+            self.cancel_event.set()
+
+    def hash_rate(self) -> float:
+        """
+        Return combined hash rate of last mining run
+        :return: hashes per second
+        """
+        seconds = max((s["seconds"] for s in self.last_stats), default=0.0)
+        if not seconds:
+            return 0.0
+        return sum(s["attempts"] for s in self.last_stats) / seconds
+
+    def shutdown(self) -> None:
+        self.cancel_event.set()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
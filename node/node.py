@@ -1,31 +1,62 @@
 import base64
 import json
-
-from cryptography.exceptions import InvalidSignature
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives.asymmetric import rsa
+import logging
+import os
 
 import consts
+import metrics
 from blockchain import BlockChain
 from block import Block
+from blockstore import BlockStore
+from crypto import PublicKey, SignatureVerifier, get_scheme, load_public_key, public_key_pem
+from mempool import Mempool
+import wire
+from mining import Miner
+from peers import PeerTable, tip_valid
+from snapshot import checkpoint, snapshot_from_locations
+from transport import PeerTransport
+
+logger = logging.getLogger(__name__)
+sign_seconds = metrics.histogram("signature_sign_seconds", "Time of signing a message to peers", ("scheme",))
 
 
 class Node:
-    def __init__(self):
-        self.blockchain = BlockChain(consts.difficulty)
-        self.blockchain.create_genesis_block()
+    bootstrap_name = 'snapshot.json'  # snapshot a block store was bootstrapped from, kept next to the store
+
+    def __init__(self, data_dir: str = None):
+        """
+        Constructor for Node class
+        :param data_dir: directory of persistent block store, chain is kept in memory if None
+        """
+        self.data_dir = data_dir
+        store = None
+        if data_dir:
+            store = BlockStore(data_dir, consts.block_store_segment_size, consts.block_store_fsync_batch)
+        archive = None
+        if consts.archive_dir:
+            archive = BlockStore(consts.archive_dir, consts.block_store_segment_size, consts.block_store_fsync_batch)
+        self.blockchain = BlockChain(consts.difficulty, Miner(consts.mining_workers, consts.mining_check_interval),
+                                     Mempool(consts.mempool_max_size), store, block_interval=consts.block_interval,
+                                     retarget_interval=consts.retarget_interval,
+                                     max_block_size=consts.max_block_size, archive=archive,
+                                     median_time_blocks=consts.median_time_blocks,
+                                     max_future_drift=consts.max_future_drift, encoded_blocks=consts.encoded_blocks)
+        if not self.blockchain.chain:
+            self.blockchain.create_genesis_block()
+        self._restore_bootstrap()
+        self._snapshot = None  # (checkpoint, {node address: signed snapshot message}), built when first requested
 
-        self.private_key = rsa.generate_private_key(public_exponent=consts.rsa_public_exponent,
-                                                    key_size=consts.rsa_key_size, backend=default_backend())
+        self.scheme = get_scheme(consts.signature_scheme)
+        self.private_key = self.scheme.generate_private_key()
         # Storing public key as serialized string
-        self.public_key = self.private_key.public_key().public_bytes(encoding=serialization.Encoding.PEM,
-                                                                     format=serialization.PublicFormat.SubjectPublicKeyInfo).decode(
-            'ascii')
+        self.public_key = public_key_pem(self.private_key.public_key())
+        self.verifier = SignatureVerifier(consts.signature_cache_size, consts.signature_verify_workers)
         self._peers = {}
+        self.peer_table = PeerTable(consts.peer_rtt_alpha, consts.peer_base_backoff, consts.peer_max_backoff)
         self.host = ''
+        self.transport = PeerTransport(consts.peer_request_timeout, consts.peer_fanout_workers, consts.peer_pool_size,
+                                       self.peer_table)
+        self.formats = wire.available_formats(consts.wire_formats)  # wire formats advertised to peers
 
     @property
     def peers(self):
@@ -34,29 +65,22 @@ class Node:
             encoded_peers[p] = {}
             for key in self._peers[p]:
                 if key == "public_key":
-                    pk = self._peers[p]["public_key"]
-                    pk_serialized = pk.public_bytes(encoding=serialization.Encoding.PEM,
-                                                    format=serialization.PublicFormat.SubjectPublicKeyInfo)
-                    ascii_pk = pk_serialized.decode('ascii')
-                    encoded_peers[p]["public_key"] = ascii_pk
+                    # PEM encoding is kept next to the parsed key, no re-serialization needed
+                    encoded_peers[p]["public_key"] = self._peers[p]["public_key"].pem
+                    encoded_peers[p]["scheme"] = self._peers[p]["public_key"].scheme.name
                 else:
                     encoded_peers[p][key] = self._peers[p][key]
         return encoded_peers
 
     def sign(self, message: str):
-        return base64.b64encode(self.private_key.sign(message.encode(),
-                                     padding.PSS(mgf=padding.MGF1(hashes.SHA256()),
-                                                 salt_length=padding.PSS.MAX_LENGTH),
-                                     hashes.SHA256())).decode('ascii')
-
-    def verify(self, message: bytes, signature: bytes, key: rsa.RSAPublicKey):
-        try:
-            key.verify(signature, message,
-                       padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH),
-                       hashes.SHA256())
-            return True
-        except InvalidSignature:
-            return False
+        return base64.b64encode(self.sign_bytes(message.encode())).decode('ascii')
+
+    def sign_bytes(self, message: bytes) -> bytes:
+        with sign_seconds.time((self.scheme.name,)):
+            return self.scheme.sign(self.private_key, message)
+
+    def verify(self, message: bytes, signature: bytes, key: PublicKey):
+        return self.verifier.verify(message, signature, key)
 
     def peer_timeout_update(self):
         to_del = []
@@ -67,52 +91,243 @@ class Node:
 
         for peer in to_del:
             self._peers.pop(peer, None)
+            self.peer_table.remove(peer)
 
     def peer_keep_alive_update(self, msg):
         if "node_address" in msg and msg["node_address"] in self._peers:
             peer_addr = msg["node_address"]
             self._peers[peer_addr]["timeout"] = consts.peer_timeout
-            print(f"received keep alive from: {peer_addr}")
+            if "height" in msg and "work" in msg:
+                if tip_valid(msg["height"], msg["work"]):
+                    self.peer_table.record_tip(peer_addr, msg["height"], msg["work"])
+                else:
+                    self.peer_table.record_failure(peer_addr)
+            logger.debug("received keep alive from %s", peer_addr)
 
-    def peer_management(self, peer_list):
+    def peer_management(self, peer_list) -> list:
+        """
+        Add peers or refresh their timeout, peers not advertising a signature scheme use RSA-PSS,
+        peers not advertising wire formats use JSON. Invalid entries are skipped, e.g. with a key that
+        can not be parsed or of an unsupported scheme, so one bad entry does not fail the others.
+        :param peer_list: list of dicts with node_address, public_key and optional scheme and formats
+        :return: list of skipped entries
+        """
+        skipped = []
         for p in peer_list:
-            if p["node_address"] not in self._peers:
+            if (not isinstance(p, dict) or not isinstance(p.get("node_address"), str)
+                    or not isinstance(p.get("public_key"), str)):
+                skipped.append(p)
+            elif p["node_address"] not in self._peers:
+                try:
+                    public_key = load_public_key(p["public_key"], p.get("scheme"))
+                    formats = [f for f in p.get("formats") or [wire.JSON] if isinstance(f, str)]
+                except (ValueError, TypeError):
+                    skipped.append(p)
+                    continue
                 self._peers[p["node_address"]] = {}
                 self._peers[p["node_address"]]["timeout"] = consts.peer_timeout
 
-                pk_bytes = p["public_key"].encode()
-                pk = serialization.load_pem_public_key(pk_bytes, backend=default_backend())
-                self._peers[p["node_address"]]["public_key"] = pk
+                self._peers[p["node_address"]]["public_key"] = public_key
+                self._peers[p["node_address"]]["formats"] = formats
+                self.peer_table.add(p["node_address"])
             else:
                 self._peers[p["node_address"]]["timeout"] = consts.peer_timeout
+        return skipped
+
+    def peer_format(self, peer: str) -> str:
+        """
+        Return wire format used with peer, first of our formats the peer advertised
+        :param peer: peer address
+        :return: format name
+        """
+        if peer not in self._peers:
+            return wire.JSON
+        return wire.choose_format(self.formats, self._peers[peer]["formats"])
+
+    def gossip_peers(self) -> list:
+        """
+        Return random healthy peers new blocks and transactions are announced to, consts.gossip_fanout of them
+        """
+        return self.peer_table.sample(consts.gossip_fanout)
+
+    @property
+    def relays_gossip(self) -> bool:
+        """
+        True if announcements are sent to only some peers, then announcements new to this node are relayed,
+        so they reach the peers the sender skipped
+        """
+        return consts.gossip_fanout is not None and len(self._peers) > consts.gossip_fanout
+
+    def sync_peers(self, work: int) -> list:
+        """
+        Return peers asked for their tip when looking for a chain with more work: the consts.sync_peers
+        fastest healthy peers and healthy peers which reported more work than given
+        :param work: cumulative work of local chain
+        :return: list of peer addresses
+        """
+        peers = self.peer_table.ahead(work)
+        return peers + [peer for peer in self.peer_table.fastest(consts.sync_peers) if peer not in peers]
 
-    def create_message(self, data: dict):
+    def broadcast(self, path: str, encode, peers=None) -> tuple:
+        """
+        Send payload to peers, encoded once per wire format in use
+        :param path: endpoint path
+        :param encode: function taking format name and returning encoded payload
+        :param peers: peer addresses, all peers not backed off if None
+        :return: (dict peer -> response, dict peer -> exception)
+        """
+        by_format = {}
+        for peer in (self.peer_table.healthy() if peers is None else peers):
+            by_format.setdefault(self.peer_format(peer), []).append(peer)
+
+        responses = {}
+        failures = {}
+        for fmt, fmt_peers in by_format.items():
+            sent, failed = self.transport.broadcast(fmt_peers, path, encode(fmt), wire.content_types[fmt])
+            responses.update(sent)
+            failures.update(failed)
+        return responses, failures
+
+    def create_message(self, data: dict, fmt: str = wire.JSON):
+        """
+        Sign data, JSON messages sign sorted JSON dump of data, msgpack messages sign the encoded payload itself
+        :param data: dict with node_address of this node
+        :param fmt: wire format
+        :return: dict for JSON, encoded bytes for msgpack
+        """
+        if fmt == wire.MSGPACK:
+            payload = wire.dumps(data, fmt)
+            return wire.encode_signed(payload, self.sign_bytes(payload))
         msg = {"msg": data, "signature": self.sign(json.dumps(data, sort_keys=True))}
         return msg
 
-    def verify_message(self, msg):
-        signature = base64.b64decode(msg.pop("signature").encode())
-        peer = msg["msg"]["node_address"]
-        dump = json.dumps(msg["msg"], sort_keys=True)
-        if self.verify(dump.encode(), signature, self._peers[peer]["public_key"]):
-            return True
-        return False
+    def open_message(self, body: bytes, fmt: str = wire.JSON):
+        """
+        Decode signed message and verify it was signed by the peer it names
+        :param body: message created by create_message, JSON encoded for JSON
+        :param fmt: wire format
+        :return: data of message or None if message is malformed, signer is unknown or signature is invalid
+        """
+        return self.open_messages([(body, fmt)])[0]
+
+    def open_messages(self, messages: list) -> list:
+        """
+        Decode signed messages and verify their signatures as one batch on the thread pool of the verifier
+        :param messages: list of (body, wire format) of messages created by create_message
+        :return: list of data of messages in order, None for malformed messages, messages of unknown signers
+                 and invalid signatures
+        """
+        items = []
+        decoded = []
+        for body, fmt in messages:
+            try:
+                if fmt == wire.MSGPACK:
+                    payload, signature, data = wire.decode_signed(body)
+                else:
+                    msg = json.loads(body)
+                    data = msg["msg"]
+                    payload = json.dumps(data, sort_keys=True).encode()
+                    signature = base64.b64decode(msg["signature"].encode())
+                known = data.get("node_address") in self._peers and isinstance(signature, bytes)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                decoded.append(None)  # one malformed message does not fail the others of the batch
+                continue
+            decoded.append(data if known else None)
+            if known:
+                items.append((payload, signature, self._peers[data["node_address"]]["public_key"]))
+        results = iter(self.verifier.verify_batch(items))
+        return [data if data is not None and next(results) else None for data in decoded]
+
+    def snapshot_checkpoint(self):
+        """
+        Return checkpoint snapshots are served for, the latest one at least consts.snapshot_depth blocks below
+        the last block, checkpoints are consts.snapshot_interval blocks apart
+        :return: (height, block hash) or None if chain has no checkpoint yet
+        """
+        chain = self.blockchain.chain
+        height = checkpoint(len(chain) - 1 - consts.snapshot_depth, consts.snapshot_interval)
+        return (height, chain[height].hash) if height else None
+
+    def cached_snapshot(self, point: tuple, address: str):
+        """
+        Return signed snapshot message of checkpoint for node address as JSON bytes
+        :param point: (height, block hash) returned by snapshot_checkpoint
+        :param address: node address of this node the message names
+        :return: bytes or None if it was not built yet, see sign_snapshot
+        """
+        if self._snapshot is None or self._snapshot[0] != point:
+            return None
+        return self._snapshot[1].get(address)
+
+    def sign_snapshot(self, source: tuple, address: str) -> bytes:
+        """
+        Build snapshot from state copied by snapshot.snapshot_source, sign it and keep the encoded message
+        until the next checkpoint. Does not access the chain, so it runs outside of the state owner.
+        :param source: state returned by snapshot_source
+        :param address: node address of this node the message names
+        :return: signed snapshot message as JSON bytes
+        """
+        snapshot = snapshot_from_locations(*source)
+        body = json.dumps(self.create_message({"node_address": address, "snapshot": snapshot})).encode()
+        point = (snapshot["height"], snapshot["hash"])
+        if self._snapshot is None or self._snapshot[0] != point:
+            self._snapshot = (point, {})
+        self._snapshot[1][address] = body
+        return body
+
+    def save_bootstrap(self, snapshot: dict) -> None:
+        """
+        Keep snapshot the chain was bootstrapped from next to the block store, the transaction index of its
+        blocks is restored from it on restart
+        :param snapshot: snapshot dict
+        """
+        if self.data_dir:
+            path = os.path.join(self.data_dir, Node.bootstrap_name)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(path + '.tmp', path)
+
+    def _restore_bootstrap(self) -> None:
+        if not self.data_dir:
+            return
+        path = os.path.join(self.data_dir, Node.bootstrap_name)
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            snapshot = json.load(f)
+        chain = self.blockchain.chain
+        if len(chain) <= snapshot["height"] or chain[snapshot["height"]].hash != snapshot["hash"]:
+            os.remove(path)  # chain was replaced since, e.g. store deleted
+            return
+        self.blockchain.index.add_pruned(tuple(entry) for entry in snapshot["transactions"])
+        self.blockchain.index.pruned_height = snapshot["height"] + 1
+        self.blockchain.pruned_height = snapshot["height"] + 1
+
+    def close(self):
+        """
+        Stop mining and write pending blocks of block store and archive to disk
+        """
+        self.blockchain.miner.shutdown()
+        self.transport.close()
+        self.verifier.close()
+        if isinstance(self.blockchain.chain, BlockStore):
+            self.blockchain.chain.close()
+        if self.blockchain.archive is not None:
+            self.blockchain.archive.close()
 
     def create_chain_from_dump(self,chain_dump):
-        new_blockchain = BlockChain(consts.difficulty)
+        new_blockchain = BlockChain(consts.difficulty, block_interval=consts.block_interval,
+                                    retarget_interval=consts.retarget_interval, max_block_size=consts.max_block_size,
+                                    median_time_blocks=consts.median_time_blocks,
+                                    max_future_drift=consts.max_future_drift)
         for idx, block_data in enumerate(chain_dump):
-            block = Block(block_data["id"],
-                        block_data["transactions"],
-                        block_data["timestamp"],
-                        block_data["previous_hash"],
-                        block_data["nonce"])
-            block.hash = block_data['hash']
+            block = Block.from_dict(block_data)
 
             if idx > 0:
                 added = new_blockchain.add_block(block)
                 if not added:
                     raise Exception("The chain dump is tampered!!")
             else:  # the block is a genesis block, no verification needed
-                new_blockchain.chain.append(block)
+                new_blockchain.replace_suffix(0, [block])
 
         return new_blockchain
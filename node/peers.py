@@ -0,0 +1,174 @@
+import random
+import threading
+import time
+
+
+def tip_valid(height, work) -> bool:
+    """
+    Check height and cumulative work reported by a peer, both have to be non-negative integers
+    """
+    return all(isinstance(value, int) and not isinstance(value, bool) and value >= 0 for value in (height, work))
+
+
+class PeerStats:
+    """
+    Health of one peer as observed by requests to it
+    """
+    __slots__ = ("rtt", "failure_rate", "failures", "backoff_until", "height", "work", "last_success")
+
+    def __init__(self) -> None:
+        self.rtt = None  # moving average of seconds until response, None until first success
+        self.failure_rate = 0.0  # moving average of failed requests
+        self.failures = 0  # consecutive failures
+        self.backoff_until = 0.0  # monotonic time until peer is skipped
+        self.height = None  # height of last tip reported by peer
+        self.work = None  # cumulative work of last tip reported by peer
+        self.last_success = None  # monotonic time of last successful request
+
+    def to_dict(self, now: float) -> dict:
+        return {"rtt": self.rtt, "failure_rate": self.failure_rate, "failures": self.failures,
+                "backoff": max(0.0, self.backoff_until - now), "height": self.height, "work": self.work}
+
+
+class PeerTable:
+    """
+    Round trip time, failure rate and chain height per peer, used to choose which peers are asked.
+
+    Every request to a peer is recorded as success with its round trip time or as failure.
+    Consecutive failures back the peer off for an exponentially growing time, up to max_backoff,
+    during which selection skips it. The first success after the backoff resets it.
+    Methods are thread safe, requests are recorded from the transport threads.
+    """
+
+    def __init__(self, alpha: float = 0.2, base_backoff: float = 1.0, max_backoff: float = 300.0,
+                 clock=time.monotonic) -> None:
+        """
+        Constructor for PeerTable class
+        :param alpha: weight of newest observation in moving averages of round trip time and failure rate
+        :param base_backoff: seconds a peer is skipped after its first failure, doubled with every further failure
+        :param max_backoff: maximum seconds a peer is skipped
+        :param clock: function returning current time in seconds
+        """
+        self.alpha = alpha
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def __contains__(self, peer: str) -> bool:
+        return peer in self._stats
+
+    def add(self, peer: str) -> None:
+        with self._lock:
+            self._stats.setdefault(peer, PeerStats())
+
+    def remove(self, peer: str) -> None:
+        with self._lock:
+            self._stats.pop(peer, None)
+
+    def record_success(self, peer: str, rtt: float) -> None:
+        """
+        Record answered request, peers not in table are ignored
+        :param peer: peer address
+        :param rtt: seconds until response
+        """
+        with self._lock:
+            stats = self._stats.get(peer)
+            if stats is None:
+                return
+            stats.rtt = rtt if stats.rtt is None else stats.rtt + self.alpha * (rtt - stats.rtt)
+            stats.failure_rate -= self.alpha * stats.failure_rate
+            stats.failures = 0
+            stats.backoff_until = 0.0
+            stats.last_success = self.clock()
+
+    def record_failure(self, peer: str) -> None:
+        """
+        Record failed request and back peer off, peers not in table are ignored
+        :param peer: peer address
+        """
+        with self._lock:
+            stats = self._stats.get(peer)
+            if stats is None:
+                return
+            stats.failure_rate += self.alpha * (1.0 - stats.failure_rate)
+            stats.failures += 1
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (stats.failures - 1))
+            stats.backoff_until = self.clock() + backoff
+
+    def record_tip(self, peer: str, height: int, work: int) -> None:
+        """
+        Record last block reported by peer, values have to be checked by caller, see tip_valid
+        :param peer: peer address
+        :param height: id of last block
+        :param work: cumulative work of chain
+        """
+        with self._lock:
+            stats = self._stats.get(peer)
+            if stats is not None:
+                stats.height = height
+                stats.work = work
+
+    def healthy(self) -> list:
+        """
+        Return peers not backed off
+        """
+        now = self.clock()
+        with self._lock:
+            return [peer for peer, stats in self._stats.items() if stats.backoff_until <= now]
+
+    def score(self, peer: str) -> float:
+        """
+        Expected seconds until a request to peer succeeds, round trip time scaled by failure rate
+        Peers without measured round trip time score 0, so they are tried and measured
+        """
+        stats = self._stats[peer]
+        if stats.rtt is None:
+            return 0.0
+        return stats.rtt / max(1.0 - stats.failure_rate, 0.01)
+
+    def fastest(self, k: int) -> list:
+        """
+        Return up to k healthy peers with lowest score, e.g. to ask for blocks
+        :param k: number of peers
+        :return: list of peer addresses, fastest first
+        """
+        peers = self.healthy()
+        with self._lock:
+            peers = [peer for peer in peers if peer in self._stats]
+            return sorted(peers, key=self.score)[:k]
+
+    def sample(self, k: int) -> list:
+        """
+        Return up to k healthy peers chosen at random, fan-out of gossip
+        Every node sends to k peers whatever the size of the network, receivers relay what is new to them
+        :param k: number of peers, all healthy peers if None
+        :return: list of peer addresses
+        """
+        peers = self.healthy()
+        if k is None or len(peers) <= k:
+            return peers
+        return random.sample(peers, k)
+
+    def ahead(self, work: int) -> list:
+        """
+        Return healthy peers which last reported more work than given
+        :param work: cumulative work of local chain
+        :return: list of peer addresses, most work first
+        """
+        peers = self.healthy()
+        with self._lock:
+            peers = [peer for peer in peers if peer in self._stats and (self._stats[peer].work or 0) > work]
+            return sorted(peers, key=lambda peer: self._stats[peer].work, reverse=True)
+
+    def snapshot(self) -> dict:
+        """
+        Return stats of all peers as dict peer -> dict, backoff in remaining seconds
+        """
+        now = self.clock()
+        with self._lock:
+            return {peer: stats.to_dict(now) for peer, stats in self._stats.items()}
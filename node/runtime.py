@@ -0,0 +1,195 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StateOwner:
+    """
+    Single owner of node state on the event loop.
+
+    Functions reading or mutating blockchain and mempool are queued and run
+    one at a time by one task, so no mutation interleaves with another and
+    readers never see a half applied change. Functions run on the event loop
+    and must not block, long work like proof of work is done outside and only
+    its result is applied through the owner.
+    """
+
+    def __init__(self) -> None:
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def start(self) -> None:
+        """
+        Start processing queued functions, has to be called from the running event loop
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def call(self, func, *args):
+        """
+        Run function after all previously queued ones
+        :param func: function to run
+        :param args: arguments of function
+        :return: result of function, exceptions are raised to the caller
+        """
+        future = self._loop.create_future()
+        await self._queue.put((func, args, future))
+        return await future
+
+    def call_threadsafe(self, func, *args):
+        """
+        Run function from another thread and wait for the result, e.g. to read chain from an executor
+        :param func: function to run
+        :param args: arguments of function
+        :return: result of function
+        """
+        return asyncio.run_coroutine_threadsafe(self.call(func, *args), self._loop).result()
+
+    async def _run(self) -> None:
+        while True:
+            func, args, future = await self._queue.get()
+            if future.cancelled():
+                continue
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class Batcher:
+    """
+    Collects items submitted by concurrent coroutines and processes them with one call.
+
+    The first submitted item opens a batch, items submitted within max_delay
+    seconds join it. The batch is handed to func on the default executor once
+    the delay passed or max_batch items are waiting, so func may block, e.g.
+    verify signatures. Every caller gets the result of its own item.
+    """
+
+    def __init__(self, func, max_delay: float = 0.005, max_batch: int = 64) -> None:
+        """
+        Constructor for Batcher class
+        :param func: function taking list of items and returning list of results in the same order
+        :param max_delay: seconds an item waits at most for others to join its batch
+        :param max_batch: maximum number of items processed in one call
+        """
+        self.func = func
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending = []  # (item, future) of the open batch
+        self._timer = None
+        self._running = set()  # references keep tasks processing batches alive
+
+    async def submit(self, item):
+        """
+        Add item to the open batch and wait for its result
+        :param item: item passed to func as part of a list
+        :return: result of item, exceptions of func are raised to every caller of the batch
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._dispatch)
+        return await future
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._process(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _process(self, batch: list) -> None:
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.func, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # caller may have gone away
+                future.set_result(result)
+
+
+class Notifier:
+    """
+    Wakes coroutines waiting for a change, e.g. of the chain tip.
+
+    Changes are counted. A waiter passes the count it has seen and returns at
+    once if it missed changes, so slow consumers skip to the latest state
+    instead of queueing every change. notify() has to be called on the event loop.
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.closed = False
+        self._waiters = set()
+
+    def notify(self, *args) -> None:
+        """
+        Count change and wake all waiters, arguments are ignored so it can be used as listener of any event
+        """
+        self.version += 1
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    def close(self) -> None:
+        """
+        Wake all waiters for good, e.g. to end long running responses on shutdown
+        """
+        self.closed = True
+        self.notify()
+
+    async def wait(self, seen: int, timeout: float = None) -> int:
+        """
+        Wait until count of changes differs from seen
+        :param seen: count returned by the previous call, None returns at once
+        :param timeout: seconds to wait at most
+        :return: current count, equal to seen on timeout
+        """
+        if self.version == seen and not self.closed:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.discard(waiter)
+        return self.version
+
+
+async def periodic(interval: float, func, name: str) -> None:
+    """
+    Await func every interval seconds until cancelled, failures are logged and do not stop the task
+    :param interval: seconds between runs
+    :param func: coroutine function without arguments
+    :param name: name of task used in messages
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("periodic task %s failed", name)
@@ -0,0 +1,261 @@
+"""
+Local network simulation: starts N nodes from app.py on consecutive localhost ports, registers
+them through /register_with of the first node and drives a transaction load spread over all nodes.
+
+Every node mines while it has pending transactions, the target is adjusted every --retarget-interval
+blocks towards --block-interval seconds between blocks. Pollers follow the chain of every
+node and record when each submitted transaction first appears in it, which gives the end-to-end
+confirmation latency on the node it was sent to and on all nodes. Results are written as JSON.
+
+Usage: python simulate.py [--nodes N] [--rate TX/S] [--seconds S] [--block-interval S] [--retarget-interval N]
+                          [--difficulty D] [--base-port P] [--drain S] [--output FILE] [--log-dir DIR]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from bench import git_commit
+from bench_server import percentile, wait_ready
+from block import transaction_hash
+
+# Runs app.py with chosen initial difficulty, block interval and retarget interval, without block store
+SERVER = ("import runpy, sys, consts; consts.difficulty = int(sys.argv.pop(1)); "
+          "consts.block_interval = float(sys.argv.pop(1)); consts.retarget_interval = int(sys.argv.pop(1)); "
+          "consts.block_store_dir = None; runpy.run_path('app.py', run_name='__main__')")
+
+
+def start_nodes(count: int, base_port: int, difficulty: int, block_interval: float, retarget_interval: int,
+                log_dir: str = None) -> list:
+    here = os.path.dirname(os.path.abspath(__file__))
+    processes = []
+    for i in range(count):
+        log = open(os.path.join(log_dir, f"node{i}.log"), 'w') if log_dir else subprocess.DEVNULL
+        processes.append(subprocess.Popen([sys.executable, '-u', '-c', SERVER, str(difficulty), str(block_interval),
+                                           str(retarget_interval), '--port', str(base_port + i)],
+                                          cwd=here, stdout=log, stderr=subprocess.STDOUT))
+    return processes
+
+
+def stop_nodes(processes: list) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+class ChainFollower:
+    """
+    Polls the tip of a node and records when transactions first appear in its chain
+    Blocks after a reorganization are fetched again from a few blocks below the known height
+    """
+    reorg_margin = 10
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.height = -1
+        self.tip = None
+        self.confirmed = {}  # transaction hash -> time it was first seen in the chain
+        self.blocks = {}  # block id -> (timestamp, number of transactions) of current chain
+
+    async def poll(self, session: aiohttp.ClientSession) -> None:
+        async with session.get(self.url + 'tip') as response:
+            tip = await response.json()
+        if tip["hash"] == self.tip:
+            return
+        start = max(0, min(self.height, tip["height"]) - self.reorg_margin)
+        now = time.perf_counter()
+        async with session.get(self.url + 'chain', params={"from": start, "format": "ndjson"}) as response:
+            async for line in response.content:
+                if line.strip():
+                    block = json.loads(line)
+                    self.blocks[block["id"]] = (block["timestamp"], len(block["transactions"]))
+                    for tx in block["transactions"]:
+                        self.confirmed.setdefault(transaction_hash(tx), now)
+        self.height, self.tip = tip["height"], tip["hash"]
+
+    async def follow(self, session: aiohttp.ClientSession, interval: float, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                await self.poll(session)
+            except (aiohttp.ClientError, ValueError, KeyError) as e:
+                print(f"polling {self.url} failed: {e}", file=sys.stderr)
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def register(session: aiohttp.ClientSession, urls: list) -> None:
+    for url in urls[1:]:
+        async with session.post(url + 'register_with', json={"node_address": urls[0]}) as response:
+            if response.status != 200:
+                raise RuntimeError(f"registering {url} failed: {await response.text()}")
+
+
+async def drive_load(session: aiohttp.ClientSession, urls: list, rate: float, seconds: float,
+                     submitted: dict, errors: list) -> None:
+    """
+    Submit transactions at a fixed rate, round robin over nodes, without waiting for earlier responses
+    :param submitted: filled with transaction hash -> (node index, submit time)
+    """
+    prefix = f"{os.getpid()}-{time.time()}"
+
+    async def submit(i):
+        node = i % len(urls)
+        tx = {"author": f"author{i % 100}", "content": f"simulated {prefix} {i}", "time": time.time()}
+        tx_hash = transaction_hash(tx)
+        sent = time.perf_counter()
+        try:
+            async with session.post(urls[node] + 'new_transaction', json=tx) as response:
+                if response.status == 201:
+                    submitted[tx_hash] = (node, sent)
+                else:
+                    errors.append(response.status)
+        except aiohttp.ClientError as e:
+            errors.append(str(e))
+
+    tasks = []
+    start = time.perf_counter()
+    i = 0
+    while i < rate * seconds:
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(submit(i)))
+        i += 1
+    await asyncio.gather(*tasks)
+
+
+def block_summary(blocks: dict) -> dict:
+    """
+    Block count, mean transactions per block and mean seconds between blocks of whole chain and of its second half,
+    which shows the interval after the target was adjusted
+    """
+    ordered = [blocks[i] for i in sorted(blocks) if i > 0]
+
+    def mean_interval(part):
+        return (part[-1][0] - part[0][0]) / (len(part) - 1) if len(part) > 1 else None
+    return {"count": len(ordered),
+            "mean_transactions": sum(size for _, size in ordered) / len(ordered) if ordered else None,
+            "mean_interval": mean_interval(ordered),
+            "mean_interval_second_half": mean_interval(ordered[len(ordered) // 2:])}
+
+
+def latency_summary(latencies: list) -> dict:
+    latencies.sort()
+    return {"count": len(latencies),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 0.5) if latencies else None,
+            "p90": percentile(latencies, 0.9) if latencies else None,
+            "p99": percentile(latencies, 0.99) if latencies else None,
+            "max": latencies[-1] if latencies else None}
+
+
+async def simulate(args) -> dict:
+    urls = [f"http://127.0.0.1:{args.base_port + i}/" for i in range(args.nodes)]
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        for url in urls:
+            await wait_ready(session, url)
+        await register(session, urls)
+
+        followers = [ChainFollower(url) for url in urls]
+        stop = asyncio.Event()
+        polling = [asyncio.create_task(f.follow(session, args.poll_interval, stop)) for f in followers]
+        submitted = {}
+        errors = []
+        start = time.perf_counter()
+        await drive_load(session, urls, args.rate, args.seconds, submitted, errors)
+        load_seconds = time.perf_counter() - start
+
+        # wait until every accepted transaction is in the chain of every node or the drain time is over
+        deadline = time.perf_counter() + args.drain
+        while time.perf_counter() < deadline and not all(h in f.confirmed for f in followers for h in submitted):
+            await asyncio.sleep(args.poll_interval)
+        stop.set()
+        await asyncio.gather(*polling)
+
+        tips = []
+        for url in urls:
+            async with session.get(url + 'tip') as response:
+                tips.append(await response.json())
+        peers = []
+        for url in urls:
+            async with session.get(url + 'peers') as response:
+                peers.append(len((await response.json())["peers"]))
+
+    own_latencies = []
+    all_latencies = []
+    confirmation_times = []
+    for tx_hash, (node, sent) in submitted.items():
+        seen = [f.confirmed.get(tx_hash) for f in followers]
+        if seen[node] is not None:
+            own_latencies.append(seen[node] - sent)
+        if all(t is not None for t in seen):
+            all_latencies.append(max(seen) - sent)
+            confirmation_times.append(max(seen))
+    elapsed = (max(confirmation_times) - start) if confirmation_times else None
+
+    return {"meta": {"commit": git_commit(),
+                     "date": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                     "python": platform.python_version(),
+                     "platform": platform.platform(),
+                     "cpus": os.cpu_count()},
+            "config": {"nodes": args.nodes, "rate": args.rate, "seconds": args.seconds,
+                       "block_interval": args.block_interval, "retarget_interval": args.retarget_interval,
+                       "difficulty": args.difficulty,
+                       "poll_interval": args.poll_interval, "drain": args.drain},
+            "load": {"attempted": int(args.rate * args.seconds), "accepted": len(submitted), "errors": len(errors),
+                     "seconds": load_seconds, "submitted_per_second": len(submitted) / load_seconds},
+            "confirmation": {"on_submitting_node": latency_summary(own_latencies),
+                             "on_all_nodes": latency_summary(all_latencies),
+                             "unconfirmed": len(submitted) - len(all_latencies),
+                             "confirmed_per_second": len(all_latencies) / elapsed if elapsed else 0.0},
+            "blocks": block_summary(followers[0].blocks),
+            "nodes": [{"url": url, "height": tip["height"], "tip": tip["hash"], "peers": count}
+                      for url, tip, count in zip(urls, tips, peers)],
+            "converged": len({tip["hash"] for tip in tips}) == 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=50.0, help="transactions submitted per second")
+    parser.add_argument('--seconds', type=float, default=20.0, help="duration of load")
+    parser.add_argument('--block-interval', type=float, default=2.0, help="target seconds between blocks")
+    parser.add_argument('--retarget-interval', type=int, default=10, help="blocks between target adjustments")
+    parser.add_argument('--difficulty', type=int, default=3)
+    parser.add_argument('--base-port', type=int, default=8100)
+    parser.add_argument('--poll-interval', type=float, default=0.1, help="seconds between polls of node tips")
+    parser.add_argument('--drain', type=float, default=None,
+                        help="seconds to wait for confirmations after load, 5 block intervals if not given")
+    parser.add_argument('--connections', type=int, default=100, help="maximum concurrent client connections")
+    parser.add_argument('--output', help="write results to JSON file, printed to stdout if not given")
+    parser.add_argument('--log-dir', help="directory for node output, discarded if not given")
+    args = parser.parse_args()
+    if args.drain is None:
+        args.drain = 5 * args.block_interval
+
+    processes = start_nodes(args.nodes, args.base_port, args.difficulty, args.block_interval, args.retarget_interval,
+                            args.log_dir)
+    try:
+        report = asyncio.run(simulate(args))
+    finally:
+        stop_nodes(processes)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
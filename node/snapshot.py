@@ -0,0 +1,108 @@
+from blockchain import BlockChain
+from merkle import merkle_root
+
+
+def checkpoint(height: int, interval: int) -> int:
+    """
+    Return highest checkpoint height not above height, checkpoints are multiples of interval
+    :param height: block id
+    :param interval: blocks between checkpoints
+    :return: block id, 0 if height is below the first checkpoint
+    """
+    return max(height, 0) // interval * interval
+
+
+def index_root(entries) -> str:
+    """
+    Return Merkle root committing to transaction locations, peers compare index states by their roots
+    :param entries: (tx hash, block id, position) sorted by transaction hash
+    :return: hex encoded root
+    """
+    return merkle_root([f"{tx_hash}:{block_id}:{position}" for tx_hash, block_id, position in entries])
+
+
+def create_snapshot(blockchain: BlockChain, height: int) -> dict:
+    """
+    Return snapshot of chain at height: hash and cumulative work of the block at height and the transaction
+    index up to it. Together with the headers up to height it lets a node continue the chain without
+    downloading earlier blocks.
+    :param blockchain: BlockChain containing height
+    :param height: block id, usually a checkpoint height
+    :return: dict with height, hash, work, index_root and transactions as [tx hash, block id, position]
+    """
+    return snapshot_from_locations(*snapshot_source(blockchain, height))
+
+
+def snapshot_source(blockchain: BlockChain, height: int) -> tuple:
+    """
+    Copy the state a snapshot at height is made of, the copy can be turned into a snapshot while the
+    chain changes, see snapshot_from_locations
+    :param blockchain: BlockChain containing height
+    :param height: block id
+    :return: (height, block hash, cumulative work, list of (tx hash, (block id, position)))
+    """
+    return height, blockchain.chain[height].hash, blockchain.work_at(height), blockchain.index.locations()
+
+
+def snapshot_from_locations(height: int, block_hash: str, work: int, locations) -> dict:
+    """
+    Return snapshot from state copied by snapshot_source, see create_snapshot
+    """
+    entries = sorted((tx_hash, block_id, position) for tx_hash, (block_id, position) in locations
+                     if block_id <= height)
+    return {"height": height,
+            "hash": block_hash,
+            "work": work,
+            "index_root": index_root(entries),
+            "transactions": [list(entry) for entry in entries]}
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check_snapshot(snapshot) -> None:
+    """
+    Check types of snapshot fields received from a peer, raises ValueError if snapshot is malformed
+    :param snapshot: decoded snapshot
+    """
+    if not isinstance(snapshot, dict):
+        raise ValueError("snapshot has to be an object")
+    if not _is_int(snapshot.get("height")) or snapshot["height"] < 0 or not _is_int(snapshot.get("work")):
+        raise ValueError("snapshot height and work have to be non-negative integers")
+    if not isinstance(snapshot.get("hash"), str) or not isinstance(snapshot.get("index_root"), str):
+        raise ValueError("snapshot hash and index root have to be strings")
+    transactions = snapshot.get("transactions")
+    if not isinstance(transactions, list) or not all(
+            isinstance(entry, list) and len(entry) == 3 and isinstance(entry[0], str)
+            and _is_int(entry[1]) and _is_int(entry[2]) for entry in transactions):
+        raise ValueError("snapshot transactions have to be [tx hash, block id, position] entries")
+
+
+def validate_snapshot(blockchain: BlockChain, headers, snapshot: dict) -> tuple:
+    """
+    Check headers form a valid chain under the rules of blockchain ending with the block of snapshot, and that
+    snapshot is consistent with it. Headers are validated as they are received. Transactions of the snapshot
+    can not be checked without bodies, they are trusted as far as the signature of the snapshot is.
+    :param blockchain: BlockChain whose rules apply, not modified
+    :param headers: iterable of Block objects without transactions, from genesis block on
+    :param snapshot: dict returned by create_snapshot
+    :return: (list of headers, list of (tx hash, block id, position)), raises ValueError if invalid
+    """
+    check_snapshot(snapshot)
+    chain = []
+    work = 0
+    for header in headers:
+        if not blockchain.check_block_validity(header, chain[-1] if chain else None, chain):
+            raise ValueError(f"header #{header.id} is invalid")
+        work += blockchain.block_work(header)
+        chain.append(header)
+        if len(chain) > snapshot["height"]:
+            break
+    if len(chain) != snapshot["height"] + 1 or chain[-1].hash != snapshot["hash"] or work != snapshot["work"]:
+        raise ValueError(f"headers do not lead to block #{snapshot['height']} of snapshot")
+
+    entries = [tuple(entry) for entry in snapshot["transactions"]]
+    if index_root(entries) != snapshot["index_root"] or any(entry[1] > snapshot["height"] for entry in entries):
+        raise ValueError("transaction index of snapshot is inconsistent")
+    return chain, entries
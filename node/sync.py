@@ -0,0 +1,272 @@
+import consts
+import wire
+from block import Block
+from blockchain import BlockChain
+from peers import tip_valid
+from snapshot import check_snapshot, validate_snapshot
+from transport import PeerTransport
+
+
+def peer_tip(transport: PeerTransport, peer: str) -> dict:
+    """
+    Return height, hash and cumulative work of last block of peer
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :return: dict with height, hash and work, raises ValueError if peer sent a malformed tip
+    """
+    tip = transport.get(peer, "tip").json()
+    if (not isinstance(tip, dict) or not tip_valid(tip.get("height"), tip.get("work"))
+            or not isinstance(tip.get("hash"), str)):
+        raise ValueError(f"tip of {peer} is malformed")
+    return tip
+
+
+def peer_hash_at(transport: PeerTransport, peer: str, height: int) -> str:
+    """
+    Return hash of block at given height of peer chain
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param height: block id
+    :return: block hash or None if peer has no block at height
+    """
+    headers = transport.get(peer, "headers", params={"from": height, "limit": 1}).json()["headers"]
+    return headers[0]["hash"] if headers else None
+
+
+def direct_call(func):
+    return func()
+
+
+def find_fork_point(blockchain: BlockChain, transport: PeerTransport, peer: str, peer_height: int,
+                    run=direct_call) -> int:
+    """
+    Find highest block shared by local chain and peer chain
+    Steps back exponentially from the lower tip and then bisects, so only O(log n) headers are requested
+    :param blockchain: local BlockChain
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param peer_height: height of peer tip
+    :param run: function running a function that accesses local chain and returning its result
+    :return: height of common block, -1 if even genesis blocks differ
+    """
+    def local_hash(height):
+        return blockchain.chain[height].hash if height < len(blockchain.chain) else None
+
+    def matches(height):
+        return peer_hash_at(transport, peer, height) == run(lambda: local_hash(height))
+
+    mismatch = min(run(lambda: len(blockchain.chain)) - 1, peer_height) + 1
+    candidate = mismatch - 1
+    step = 1
+    while candidate >= 0 and not matches(candidate):
+        mismatch = candidate
+        candidate -= step
+        step *= 2
+    candidate = max(candidate, -1)
+
+    # candidate matches (or is -1), mismatch does not, bisect in between
+    while mismatch - candidate > 1:
+        middle = (candidate + mismatch) // 2
+        if matches(middle):
+            candidate = middle
+        else:
+            mismatch = middle
+    return candidate
+
+
+def fetch_blocks(transport: PeerTransport, peer: str, start: int, stop: int, fmt: str = wire.JSON):
+    """
+    Stream blocks of peer chain as NDJSON or msgpack, blocks are decoded one by one as they arrive
+    Merkle root and hash are recomputed from the received fields when the block is validated
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param start: id of first block
+    :param stop: id after last block
+    :param fmt: wire format negotiated with peer
+    :return: generator of Block objects
+    """
+    params = {"from": start, "limit": stop - start}
+    if fmt == wire.MSGPACK:
+        chunks = transport.stream(peer, "chain", params=params, accept=wire.content_types[fmt], lines=False)
+    else:
+        params["format"] = "ndjson"
+        chunks = transport.stream(peer, "chain", params=params)
+    yield from wire.iter_blocks(chunks, fmt)
+
+
+def import_blocks(blockchain: BlockChain, blocks, run=direct_call) -> int:
+    """
+    Validate and add blocks while they are received, in batches of consts.sync_import_batch
+    Blocks not following the last block are kept as side blocks until their branch has more work,
+    so only blocks of a competing branch are buffered and never the whole chain
+    :param blockchain: local BlockChain
+    :param blocks: iterable of Block objects in chain order
+    :param run: function running a function that accesses local chain and returning its result
+    :return: number of added blocks, import stops at the first invalid block
+    """
+    imported = 0
+    batch = []
+    for block in blocks:
+        batch.append(block)
+        if len(batch) < consts.sync_import_batch:
+            continue
+        added = run(lambda: blockchain.add_blocks(batch))
+        imported += added
+        if added < len(batch):
+            return imported
+        batch = []
+    if batch:
+        imported += run(lambda: blockchain.add_blocks(batch))
+    return imported
+
+
+def adopt_foreign_chain(blockchain: BlockChain, blocks, run=direct_call) -> bool:
+    """
+    Take over a chain starting with another genesis block, blocks are validated while they are received
+    and only buffered until they have more work than the local chain, at most consts.foreign_chain_max_blocks
+    of them. The chain is then replaced and the remaining blocks are imported in batches.
+    :param blockchain: local BlockChain
+    :param blocks: iterable of Block objects from genesis block on
+    :param run: function running a function that accesses local chain and returning its result
+    :return: True if chain was replaced
+    """
+    blocks = iter(blocks)
+    local_work = run(blockchain.total_work)
+    chain = []
+    work = 0
+    for block in blocks:
+        if len(chain) >= consts.foreign_chain_max_blocks:
+            return False
+        if not blockchain.check_block_validity(block, chain[-1] if chain else None, chain):
+            return False
+        chain.append(block)
+        work += blockchain.block_work(block)
+        if work > local_work:
+            break
+    else:
+        return False
+    if not run(lambda: blockchain.replace_foreign_chain(chain)):
+        return False
+    import_blocks(blockchain, blocks, run)
+    return True
+
+
+def adopt_genesis(blockchain: BlockChain, transport: PeerTransport, peer: str, run=direct_call,
+                  fmt: str = wire.JSON) -> bool:
+    """
+    Replace genesis block of a chain without other blocks by the genesis block of peer, so a node joining
+    the network of peer builds on the same chain even while no chain has more work yet
+    :param blockchain: local BlockChain
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param run: function running a function that accesses local chain and returning its result
+    :param fmt: wire format negotiated with peer
+    :return: True if genesis block was replaced
+    """
+    if run(lambda: len(blockchain.chain)) != 1:
+        return False
+    genesis = next(fetch_blocks(transport, peer, 0, 1, fmt), None)
+    if genesis is None or not blockchain.check_block_validity(genesis, None):
+        return False
+
+    def replace():
+        if len(blockchain.chain) != 1 or blockchain.chain[0].hash == genesis.hash:
+            return False
+        blockchain.replace_suffix(0, [genesis])
+        return True
+    return run(replace)
+
+
+def sync_with_peer(blockchain: BlockChain, transport: PeerTransport, peer: str, run=direct_call,
+                   fmt: str = wire.JSON) -> bool:
+    """
+    Switch to chain of peer if it reports more work, only blocks after the fork point are streamed
+    Work reported by peer is only used to skip peers, chain is switched once received blocks have more work
+    :param blockchain: local BlockChain
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param run: function running a function that accesses local chain and returning its result, lets
+                the chain be owned by another thread
+    :param fmt: wire format negotiated with peer
+    :return: True if last block of chain changed
+    """
+    tip = peer_tip(transport, peer)
+    if tip["work"] <= run(blockchain.total_work):
+        return False
+    # Branch of peer may be known already, then there is nothing to download
+    if run(lambda: blockchain.switch_branch(tip["hash"])):
+        return True
+
+    last_hash = run(lambda: blockchain.last_block().hash)
+    fork = find_fork_point(blockchain, transport, peer, tip["height"], run)
+    if fork < 0:
+        # chain of peer has another genesis block, it is taken over once enough of it has more work
+        return adopt_foreign_chain(blockchain, fetch_blocks(transport, peer, 0, tip["height"] + 1, fmt), run)
+    import_blocks(blockchain, fetch_blocks(transport, peer, fork + 1, tip["height"] + 1, fmt), run)
+    return run(lambda: blockchain.last_block().hash) != last_hash
+
+
+def fetch_headers(transport: PeerTransport, peer: str, start: int, stop: int):
+    """
+    Page through headers of peer chain, consts.sync_page_size at a time
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param start: id of first block
+    :param stop: id after last block
+    :return: generator of Block objects without transactions
+    """
+    while start < stop:
+        headers = transport.get(peer, "headers", params={"from": start,
+                                                         "limit": min(consts.sync_page_size, stop - start)}).json()
+        if not headers["headers"]:
+            return
+        for header in headers["headers"]:
+            yield Block.from_header(header)
+        start += len(headers["headers"])
+
+
+def fetch_snapshot(transport: PeerTransport, peer: str, open_message):
+    """
+    Return latest snapshot of peer, raises ValueError if it is not signed by peer
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param open_message: function verifying signed message and returning its data, see Node.open_message
+    :return: snapshot dict or None if peer has no snapshot, raises ValueError if snapshot is malformed
+    """
+    response = transport.get(peer, "snapshot")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    data = open_message(response.content)
+    if not isinstance(data, dict) or data.get("node_address") != peer:
+        raise ValueError(f"snapshot of {peer} is not signed by it")
+    check_snapshot(data.get("snapshot"))
+    return data["snapshot"]
+
+
+def bootstrap_from_peer(blockchain: BlockChain, transport: PeerTransport, peer: str, open_message,
+                        run=direct_call):
+    """
+    Take over headers and transaction index of a chain without other blocks than genesis from the signed
+    snapshot of peer, only blocks after the snapshot are then downloaded by sync_with_peer
+    :param blockchain: local BlockChain
+    :param transport: PeerTransport used for requests
+    :param peer: peer address
+    :param open_message: function verifying signed message and returning its data, see Node.open_message
+    :param run: function running a function that accesses local chain and returning its result
+    :return: snapshot dict if chain was bootstrapped, None otherwise
+    """
+    if run(lambda: len(blockchain.chain)) != 1:
+        return None
+    snapshot = fetch_snapshot(transport, peer, open_message)
+    if snapshot is None:
+        return None
+    headers, entries = validate_snapshot(blockchain, fetch_headers(transport, peer, 0, snapshot["height"] + 1),
+                                         snapshot)
+
+    def apply():
+        if len(blockchain.chain) != 1:
+            return False
+        blockchain.bootstrap(headers, entries)
+        return True
+    return snapshot if run(apply) else None
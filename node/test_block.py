@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import wire
+from block import Block, transaction_hash
+from merkle import merkle_root, verify_proof
+
+
+def transactions(count: int) -> list:
+    return [{"author": "alice", "content": str(i)} for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 8])
+def test_proof_of_every_transaction_verifies_against_root(count):
+    block = Block(1, transactions(count), 1.0, '0')
+    for tx in block.transactions:
+        index, proof = block.transaction_proof(transaction_hash(tx))
+        assert block.transactions[index] is tx
+        assert verify_proof(transaction_hash(tx), proof, block.merkle_root)
+        assert not verify_proof(transaction_hash({"content": "other"}), proof, block.merkle_root)
+
+
+def test_header_hash_commits_to_transactions():
+    block = Block(1, transactions(3), 1.0, '0')
+    header = Block.from_header(dict(block.header(), hash=block.hash))
+    assert header.merkle_root == block.merkle_root == merkle_root([transaction_hash(tx) for tx in block.transactions])
+    assert header.compute_hash() == block.hash
+
+    tampered = Block.from_dict(dict(block.to_dict(), transactions=transactions(2)))
+    assert tampered.compute_hash() != tampered.hash
+
+
+@pytest.mark.parametrize("change", [
+    {"transactions": ["not an object"]},
+    {"transactions": [{"content": "x", "hash": 5}]},
+    {"transactions": {"content": "x"}},
+    {"id": "1"},
+    {"timestamp": None},
+    {"target": 5},
+    {"target": "not hex"},
+])
+def test_malformed_block_is_rejected_before_it_is_created(change):
+    data = dict(Block(1, transactions(2), 1.0, '0').to_dict(), **change)
+    with pytest.raises(ValueError):
+        Block.from_dict(data)
+    with pytest.raises(ValueError):
+        wire.decode_block(json.dumps(data).encode(), wire.JSON)
+
+
+@pytest.mark.parametrize("body", [b'{"id": 1', b'[1, 2]', b'{"id": 1}', b'null'])
+def test_undecodable_block_raises_value_error(body):
+    with pytest.raises(ValueError):
+        wire.decode_block(body, wire.JSON)
+
+
+def test_malformed_msgpack_block_raises_value_error():
+    msgpack = pytest.importorskip("msgpack")
+    fields = wire.block_fields(Block(1, transactions(2), 1.0, '0'))
+    for malformed in (b'\xc1', msgpack.packb(fields[:6]), msgpack.packb(fields[:5] + [[b"binary"], None]),
+                      msgpack.packb(fields[:5] + [[{"content": b"binary"}], None])):
+        with pytest.raises(ValueError):
+            wire.decode_block(malformed, wire.MSGPACK)
@@ -0,0 +1,102 @@
+import pytest
+
+from block import Block
+from blockchain import BlockChain
+from blockstore import BlockStore
+from conftest import extend, make_transaction, new_chain
+
+
+def test_reorg_returns_transactions_of_replaced_blocks_to_mempool():
+    blockchain = new_chain()
+    genesis = blockchain.last_block()
+    replaced, kept = make_transaction("replaced"), make_transaction("kept")
+    blockchain.add_new_transaction(replaced)
+    blockchain.add_new_transaction(kept)
+    block = extend(genesis, [[replaced, kept]], 1.0)[0]
+    assert blockchain.add_block(block)
+    assert len(blockchain.mempool) == 0
+
+    branch = extend(genesis, [[kept], []], 2.0)
+    assert blockchain.add_blocks(branch) == 2
+
+    assert blockchain.last_block() is branch[-1]
+    assert list(blockchain.mempool) == [replaced]
+    assert blockchain.index.locate(kept["hash"]) is not None
+    assert blockchain.index.locate(replaced["hash"]) is None
+
+
+def test_genesis_block_with_heavier_target_is_rejected():
+    blockchain = new_chain(difficulty=1)
+    genesis = Block(0, [], 1.0, BlockChain.genesis_block_previous_hash, target=1)
+    while int(genesis.hash, 16) > blockchain.initial_target:
+        genesis.nonce += 1
+        genesis.hash = genesis.compute_hash()
+
+    assert not blockchain.check_block_validity(genesis, None)
+    assert not blockchain.check_chain_validity([genesis])
+    assert not blockchain.add_block(genesis)
+    assert blockchain.chain[0] is not genesis
+
+
+def test_target_is_retargeted_by_timespan_of_window():
+    blockchain = BlockChain(1, block_interval=10.0, retarget_interval=4)
+    genesis = Block(0, [], 0.0, BlockChain.genesis_block_previous_hash)
+    chain = [genesis] + extend(genesis, [[]] * 6, 0.0)
+    for block in chain:
+        block.timestamp = block.id * 5.0  # blocks come twice as fast as block_interval
+
+    assert blockchain.next_target(chain[2], chain) == blockchain.initial_target
+    assert blockchain.next_target(chain[3], chain) == blockchain.initial_target // 2
+    chain[4].target = blockchain.initial_target // 2
+    assert blockchain.next_target(chain[4], chain) == blockchain.initial_target // 2
+
+
+def test_retarget_interval_below_two_blocks_is_rejected():
+    with pytest.raises(ValueError):
+        BlockChain(0, block_interval=10.0, retarget_interval=1)
+
+
+def test_reorg_below_pruned_blocks_of_store_is_rejected(tmp_path):
+    store = BlockStore(str(tmp_path))
+    blockchain = BlockChain(0, chain=store)
+    blockchain.create_genesis_block()
+    genesis = blockchain.last_block()
+    main = extend(genesis, [[make_transaction(f"main {i}")] for i in range(6)], genesis.timestamp + 1)
+    side = extend(genesis, [[make_transaction(f"side {i}")] for i in range(7)], genesis.timestamp + 1)
+    assert blockchain.add_blocks(main) == 6
+    assert blockchain.add_blocks(side[:6]) == 6  # kept as side blocks, not more work than chain
+    assert blockchain.prune(4) == 4
+    assert blockchain.pruned_height == 0  # bodies stay in the store
+
+    assert blockchain.add_block(side[6])
+    assert blockchain.last_block().hash == main[-1].hash
+    assert not blockchain.add_block(Block(2, [], side[0].timestamp + 1, side[0].hash))
+    branch = extend(main[3], [[], [], []], main[3].timestamp + 1)
+    assert blockchain.add_blocks(branch) == 3
+    assert blockchain.last_block().hash == branch[-1].hash
+    assert blockchain.index.locate(main[3].transactions[0]["hash"]) == (4, 0)
+    assert blockchain.index.locate(main[4].transactions[0]["hash"]) is None
+    store.close()
+
+
+def test_transaction_with_tampered_content_is_rejected():
+    blockchain = new_chain()
+    transaction = make_transaction("original")
+    transaction["content"] = "tampered"
+
+    block = extend(blockchain.last_block(), [[transaction]], 1.0)[0]
+    assert not blockchain.add_block(block)
+    assert len(blockchain.chain) == 1
+
+    block = extend(blockchain.last_block(), [[make_transaction("original")]], 1.0)[0]
+    assert blockchain.add_block(block)
+
+
+def test_transaction_with_author_or_content_of_other_type_is_rejected():
+    blockchain = new_chain()
+    for transaction in ({"author": ["x"], "content": "y"}, {"author": "x", "content": {"y": 1}},
+                        {"author": "x"}):
+        block = extend(blockchain.last_block(), [[transaction]], 1.0)[0]
+        assert not blockchain.add_block(block)
+    assert len(blockchain.chain) == 1
+    assert len(blockchain.index) == 0
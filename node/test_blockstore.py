@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from block import Block
+from blockchain import BlockChain
+from blockstore import BlockStore
+
+
+def fill(store: BlockStore, count: int) -> list:
+    blocks = []
+    previous_hash = '0'
+    for i in range(count):
+        block = Block(i, [{"author": "alice", "content": str(i)}], float(i), previous_hash)
+        block.seal()
+        store.append(block, i + 1)
+        blocks.append(block)
+        previous_hash = block.hash
+    return blocks
+
+
+def test_torn_tail_is_dropped_on_open(tmp_path):
+    store = BlockStore(str(tmp_path))
+    blocks = fill(store, 3)
+    store.close()
+    # append interrupted after part of the next record and part of its index entry were written
+    with open(tmp_path / BlockStore.segment_name.format(0), 'ab') as f:
+        f.write(BlockStore.record_magic + b'garbage')
+    with open(tmp_path / BlockStore.index_name, 'ab') as f:
+        f.write(b'\x03' * (BlockStore.index_record.size // 2))
+
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 3
+    assert [block.hash for block in store] == [block.hash for block in blocks]
+    assert store.work(-1) == 3
+    assert store.timestamps(0, 3) == [0.0, 1.0, 2.0]
+
+    block = Block(3, [], 3.0, blocks[-1].hash)
+    store.append(block, 4)
+    store.close()
+
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 4
+    assert store[-1].hash == block.hash
+    assert store.index_of(block.hash) == 3
+    store.close()
+
+
+def test_index_entry_without_record_is_dropped(tmp_path):
+    store = BlockStore(str(tmp_path))
+    blocks = fill(store, 3)
+    store.close()
+    segment = tmp_path / BlockStore.segment_name.format(0)
+    os.truncate(segment, os.path.getsize(segment) - 1)
+
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 2
+    assert store[-1].hash == blocks[1].hash
+    assert os.path.getsize(tmp_path / BlockStore.index_name) == 2 * BlockStore.index_record.size
+    store.close()
+
+
+def test_store_is_locked_while_open(tmp_path):
+    store = BlockStore(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        BlockStore(str(tmp_path))
+    store.close()
+    BlockStore(str(tmp_path)).close()
+
+
+def test_chain_continues_on_reopened_store(tmp_path):
+    store = BlockStore(str(tmp_path))
+    blockchain = BlockChain(0, chain=store)
+    blockchain.create_genesis_block()
+    genesis = blockchain.last_block()
+    block = Block(1, [{"author": "alice", "content": "stored"}], genesis.timestamp + 1, genesis.hash)
+    assert blockchain.add_block(block)
+    work = blockchain.total_work()
+    store.close()
+
+    store = BlockStore(str(tmp_path))
+    blockchain = BlockChain(0, chain=store)
+    assert blockchain.last_block().hash == block.hash
+    assert blockchain.total_work() == work
+    assert blockchain.add_block(Block(2, [], block.timestamp + 1, block.hash))
+    store.close()
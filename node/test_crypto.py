@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("cryptography")
+
+from crypto import SignatureVerifier, get_scheme, load_public_key, public_key_pem
+
+
+@pytest.mark.parametrize("scheme_name", ["rsa-pss", "ed25519"])
+def test_batch_results_follow_order_of_items(scheme_name):
+    scheme = get_scheme(scheme_name)
+    private_key = scheme.generate_private_key()
+    key = load_public_key(public_key_pem(private_key.public_key()), scheme_name)
+    messages = [f"message {i}".encode() for i in range(5)]
+    items = [(message, scheme.sign(private_key, message), key) for message in messages]
+    items[2] = (b"tampered", items[2][1], key)
+
+    verifier = SignatureVerifier(cache_size=16, max_workers=2)
+    assert verifier.verify_batch(items) == [True, True, False, True, True]
+    assert verifier.verify_batch(items[:1]) == [True]
+    verifier.close()
@@ -0,0 +1,15 @@
+from difficulty import difficulty_target, max_target, retarget, target_work
+
+
+def test_difficulty_target_has_leading_hex_zeroes():
+    assert format(difficulty_target(2), '064x') == "00" + "f" * 62
+    assert difficulty_target(0) == max_target
+    assert target_work(difficulty_target(1)) == 16
+
+
+def test_retarget_change_is_bounded_by_max_factor():
+    target = difficulty_target(4)
+    assert retarget(target, 60.0, 30.0, max_factor=4) == target * 2
+    assert retarget(target, 1.0, 30.0, max_factor=4) == target // 4
+    assert retarget(target, 1000.0, 30.0, max_factor=4) == target * 4
+    assert retarget(max_target, 60.0, 30.0, max_factor=4) == max_target
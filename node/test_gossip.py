@@ -0,0 +1,44 @@
+import threading
+
+from gossip import GossipBuffer
+
+
+class Recorder:
+    """Send function of the buffer recording sent batches, raises on the first failing calls"""
+
+    def __init__(self, failing: int = 0) -> None:
+        self.failing = failing
+        self.calls = 0
+        self.batches = []
+        self.sent = threading.Semaphore(0)  # released once per call
+
+    def __call__(self, batch: list) -> None:
+        self.calls += 1
+        try:
+            if self.calls <= self.failing:
+                raise RuntimeError("peer transport failed")
+            self.batches.append(batch)
+        finally:
+            self.sent.release()
+
+
+def test_full_batch_is_sent_without_waiting_for_delay():
+    recorder = Recorder()
+    buffer = GossipBuffer(recorder, max_delay=60, max_batch=3)
+    buffer.add([1, 2, 3, 4])
+
+    assert recorder.sent.acquire(timeout=5)
+    assert recorder.batches == [[1, 2, 3]]
+    buffer.flush()
+    assert recorder.batches == [[1, 2, 3], [4]]
+
+
+def test_sending_continues_after_failed_batch():
+    recorder = Recorder(failing=1)
+    buffer = GossipBuffer(recorder, max_delay=0.01, max_batch=10)
+    buffer.add([1])
+    assert recorder.sent.acquire(timeout=5)
+
+    buffer.add([2])
+    assert recorder.sent.acquire(timeout=5)
+    assert recorder.batches == [[2]]
@@ -0,0 +1,78 @@
+from block import transaction_hash
+from conftest import extend, make_transaction, new_chain
+from index import ChainIndex
+
+
+def make_chain(count: int) -> list:
+    """Genesis block and count blocks with two transactions each, alternating authors and increasing times"""
+    blockchain = new_chain()
+    genesis = blockchain.last_block()
+    transactions = [[make_transaction(f"{block_id} {position}", author="alice" if position == 0 else "bob",
+                                      time=float(2 * block_id + position)) for position in range(2)]
+                    for block_id in range(count)]
+    assert blockchain.add_blocks(extend(genesis, transactions, genesis.timestamp + 1)) == count
+    return list(blockchain.chain)
+
+
+def test_existing_blocks_are_indexed_in_steps():
+    chain = make_chain(4)
+    index = ChainIndex(chain)
+    assert not index.ready
+    assert index.locate(transaction_hash(chain[1].transactions[0])) is None
+
+    assert not index.build(2)
+    assert index.locate(transaction_hash(chain[1].transactions[1])) == (1, 1)
+    assert index.locate(transaction_hash(chain[2].transactions[0])) is None
+    assert index.build(2) is False and index.build(2) is True
+    assert len(index) == 8
+
+
+def test_blocks_appended_while_building_are_indexed_at_once():
+    chain = make_chain(6)
+    index = ChainIndex(chain[:5])
+    index.chain = chain
+    for block in chain[5:]:
+        index.add_block(block)
+    assert index.locate(transaction_hash(chain[6].transactions[0])) == (6, 0)
+
+    index.build()
+    total, transactions = index.by_time()
+    assert total == 12
+    assert [tx["time"] for tx in transactions] == [float(t) for t in range(12)]
+
+
+def test_queries_by_author_and_time_are_paged():
+    chain = make_chain(4)
+    index = ChainIndex(chain)
+    index.build()
+
+    total, transactions = index.by_author("bob", offset=1, limit=2)
+    assert total == 4
+    assert [tx["content"] for tx in transactions] == ["1 1", "2 1"]
+    total, transactions = index.by_time(start=3.0, end=6.0, offset=1)
+    assert total == 3
+    assert [tx["time"] for tx in transactions] == [4.0, 5.0]
+
+
+def test_removed_blocks_are_unindexed():
+    chain = make_chain(4)
+    index = ChainIndex(chain)
+    index.build(3)
+    index.remove_blocks(chain[2:])
+    del chain[2:]
+
+    assert index.ready
+    assert len(index) == 2
+    assert index.by_author("alice")[0] == 1
+    assert index.by_time()[0] == 2
+
+
+def test_pruned_blocks_are_only_located_by_hash():
+    chain = make_chain(4)
+    index = ChainIndex(chain)
+    index.build()
+    index.prune(3)
+
+    assert index.locate(transaction_hash(chain[1].transactions[1])) == (1, 1)
+    assert index.by_author("alice")[0] == 2
+    assert [tx["time"] for tx in index.by_time()[1]] == [4.0, 5.0, 6.0, 7.0]
@@ -0,0 +1,34 @@
+from mempool import Mempool
+
+
+def transaction(content: str) -> dict:
+    return {"author": "alice", "content": content}
+
+
+def test_duplicates_are_rejected():
+    mempool = Mempool()
+    assert mempool.add(transaction("a"))
+    assert not mempool.add(transaction("a"))
+    assert len(mempool) == 1
+    assert transaction("a") in mempool
+
+
+def test_oldest_transactions_are_evicted_above_max_size():
+    mempool = Mempool(max_size=3)
+    for content in "abcde":
+        mempool.add(transaction(content))
+
+    assert len(mempool) == 3
+    assert [tx["content"] for tx in mempool] == ["c", "d", "e"]
+    assert transaction("a") not in mempool
+
+
+def test_take_returns_oldest_first_without_removing():
+    mempool = Mempool()
+    for content in "abc":
+        mempool.add(transaction(content))
+
+    assert [tx["content"] for tx in mempool.take(2)] == ["a", "b"]
+    assert len(mempool) == 3
+    assert mempool.remove([transaction("a"), transaction("x")]) == 1
+    assert [tx["content"] for tx in mempool.take()] == ["b", "c"]
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+import metrics
+
+
+def test_counter_is_rendered_per_label_values():
+    counter = metrics.counter("test_requests_total", "Requests", ("path",))
+    counter.inc(1, ("tip",))
+    counter.inc(2, ('say "hi"',))
+
+    assert metrics.counter("test_requests_total", "Requests", ("path",)) is counter
+    lines = metrics.render().splitlines()
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{path="tip"} 1' in lines
+    assert 'test_requests_total{path="say \\"hi\\""} 2' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.histogram("test_seconds", "Durations", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+    assert "test_seconds_sum 6.25" in lines
+    assert "test_seconds_count 4" in lines
+
+
+def test_gauge_reads_latest_function():
+    metrics.gauge("test_size", "Size", lambda: 1)
+    gauge = metrics.gauge("test_size", "Size", lambda: 2)
+    assert gauge.render()[-1] == "test_size 2"
+
+
+def test_nothing_is_collected_while_disabled(monkeypatch):
+    counter = metrics.counter("test_disabled_total", "Disabled")
+    histogram = metrics.histogram("test_disabled_seconds", "Disabled")
+    monkeypatch.setattr(metrics, "enabled", False)
+    counter.inc()
+    with histogram.time():
+        pass
+
+    assert counter.value() == 0
+    assert histogram.count() == 0
+
+
+def test_profiler_samples_other_threads():
+    profiler = metrics.SamplingProfiler()
+    with pytest.raises(ValueError):
+        profiler.start(0)
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="test-worker")
+    worker.start()
+    try:
+        assert profiler.start(0.001)
+        assert not profiler.start(0.001)
+        while profiler.samples < 3:
+            stop.wait(0.01)
+    finally:
+        profiler.stop()
+        stop.set()
+        worker.join()
+
+    assert not profiler.stop()
+    assert any(stack.startswith("test-worker;") for stack in profiler.stacks)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from block import Block
+from mining import Miner, MiningJob
+
+
+def make_block(target: int = None) -> Block:
+    transactions = [{"author": "zoë", "content": "grüße 你好 \"quoted\" \\ \n", "time": 1.5},
+                    {"author": "bob", "content": "plain", "extra": {"b": [1, 2.5, None], "a": True}}]
+    return Block(7, transactions, 1234.5, "ab" * 32, target=target)
+
+
+def hash_with_nonce(block: Block, nonce: int) -> str:
+    block.nonce = nonce
+    return block.compute_hash()
+
+
+@pytest.mark.parametrize("target", [None, 2 ** 250 - 1])
+def test_midstate_hashes_are_identical_to_compute_hash(target):
+    block = make_block(target)
+    job = MiningJob.from_block(block)
+    for nonce in (0, 1, 9, 10, 12345, 2 ** 40 + 7):
+        assert job.hash_for(nonce) == hash_with_nonce(block, nonce)
+
+
+@pytest.mark.parametrize("target", [2 ** 256 - 1, 2 ** 252 - 1, 2 ** 246])
+def test_search_finds_first_nonce_whose_hash_meets_target(target):
+    block = make_block()
+    nonce, hash = MiningJob.from_block(block).search(target, start=3, step=2)
+
+    assert hash == hash_with_nonce(block, nonce)
+    assert int(hash, 16) <= target
+    assert all(int(hash_with_nonce(block, n), 16) > target for n in range(3, nonce, 2))
+
+
+def test_search_gives_up_after_attempts():
+    assert MiningJob.from_block(make_block()).search(0, attempts=100) is None
+
+
+def test_parallel_mining_finds_hash_meeting_target():
+    miner = Miner(workers=2, check_interval=256)
+    target = 2 ** 246
+    block = make_block()
+    try:
+        nonce, hash = miner.mine(block, target)
+    finally:
+        miner.shutdown()
+
+    assert hash == hash_with_nonce(block, nonce)
+    assert int(hash, 16) <= target
+    assert len(miner.last_stats) == 2
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cancelled_mining_returns_none(workers):
+    miner = Miner(workers=workers, check_interval=256)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(miner.mine(make_block(), 0)))
+    thread.start()
+    try:
+        while not miner.mining:
+            time.sleep(0.001)
+        miner.cancel()
+        thread.join(timeout=30)
+    finally:
+        miner.shutdown()
+
+    assert not thread.is_alive()
+    assert result == [None]
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("cryptography")
+pytest.importorskip("requests")  # peers are contacted through the peer transport
+
+import consts
+from crypto import get_scheme, public_key_pem
+from node import Node
+
+
+@pytest.fixture
+def node():
+    node = Node()
+    yield node
+    node.close()
+
+
+def peer_entry(address: str, scheme: str = "ed25519") -> dict:
+    private_key = get_scheme(scheme).generate_private_key()
+    return {"node_address": address, "public_key": public_key_pem(private_key.public_key()), "scheme": scheme}
+
+
+def test_invalid_peer_entries_are_skipped(node):
+    valid = peer_entry("http://127.0.0.1:8001/")
+    wrong_scheme = peer_entry("http://127.0.0.1:8002/", scheme="ed25519")
+    wrong_scheme["scheme"] = "rsa-pss"
+    unsupported = dict(peer_entry("http://127.0.0.1:8003/"), scheme="dsa")
+    bad_key = {"node_address": "http://127.0.0.1:8004/", "public_key": "not a key"}
+
+    skipped = node.peer_management([wrong_scheme, unsupported, bad_key, {"public_key": valid["public_key"]},
+                                    "http://127.0.0.1:8005/", valid])
+
+    assert len(skipped) == 5
+    assert list(node.peers) == [valid["node_address"]]
+    assert node.peers[valid["node_address"]]["scheme"] == "ed25519"
+
+
+def test_announcements_are_relayed_once_fanout_skips_peers(node, monkeypatch):
+    monkeypatch.setattr(consts, "gossip_fanout", 2)
+    entries = [peer_entry(f"http://127.0.0.1:{8001 + i}/") for i in range(3)]
+    node.peer_management(entries[:2])
+    assert not node.relays_gossip
+    assert sorted(node.gossip_peers()) == sorted(entry["node_address"] for entry in entries[:2])
+
+    node.peer_management(entries[2:])
+    node.peer_table.record_failure(entries[0]["node_address"])
+    assert node.relays_gossip
+    assert sorted(node.gossip_peers()) == sorted(entry["node_address"] for entry in entries[1:])
+
+
+def test_keep_alive_with_malformed_tip_counts_as_failure(node):
+    entry = peer_entry("http://127.0.0.1:8001/")
+    node.peer_management([entry])
+    node.peer_keep_alive_update({"node_address": entry["node_address"], "height": 3, "work": "99"})
+
+    assert node.peer_table.snapshot()[entry["node_address"]]["work"] is None
+    assert node.peer_table.snapshot()[entry["node_address"]]["failures"] == 1
+    assert node.sync_peers(0) == []
@@ -0,0 +1,63 @@
+from peers import PeerTable, tip_valid
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def table_with(*peers, clock=None) -> PeerTable:
+    table = PeerTable(alpha=0.5, base_backoff=1.0, max_backoff=4.0, clock=clock or Clock())
+    for peer in peers:
+        table.add(peer)
+    return table
+
+
+def test_failures_back_peer_off_exponentially_up_to_max_backoff():
+    clock = Clock()
+    table = table_with("a", "b", clock=clock)
+    for _ in range(4):
+        table.record_failure("a")
+    assert table.snapshot()["a"]["backoff"] == 4.0
+    assert table.healthy() == ["b"]
+
+    clock.now += 4.0
+    assert table.healthy() == ["a", "b"]
+    table.record_success("a", 0.1)
+    table.record_failure("a")
+    assert table.snapshot()["a"]["backoff"] == 1.0
+
+
+def test_fastest_peers_are_ranked_by_round_trip_time_and_failure_rate():
+    table = table_with("slow", "fast", "flaky", "new")
+    table.record_success("slow", 0.3)
+    table.record_success("fast", 0.1)
+    table.record_success("flaky", 0.1)
+    table.record_failure("flaky")
+    table.clock.now += 1.0  # backoff of flaky is over, its failure rate stays
+
+    assert table.fastest(3) == ["new", "fast", "flaky"]
+    assert table.score("flaky") == 0.2
+
+
+def test_sample_and_ahead_skip_backed_off_peers():
+    table = table_with("a", "b", "c", "d")
+    table.record_failure("d")
+    table.record_tip("a", 5, 50)
+    table.record_tip("b", 7, 70)
+    table.record_tip("d", 9, 90)
+
+    sample = table.sample(2)
+    assert len(sample) == 2 and set(sample) <= {"a", "b", "c"}
+    assert sorted(table.sample(None)) == ["a", "b", "c"]
+    assert table.ahead(60) == ["b"]
+    assert table.ahead(0) == ["b", "a"]
+
+
+def test_tips_with_other_types_than_int_are_invalid():
+    assert tip_valid(3, 2 ** 300)
+    for height, work in ((3, "99"), (True, 5), (3, None), (-1, 5), (2.0, 5)):
+        assert not tip_valid(height, work)
@@ -0,0 +1,47 @@
+import asyncio
+
+from runtime import Batcher
+
+
+class Recorder:
+    """Batch function doubling items, records the batches it was called with"""
+
+    def __init__(self) -> None:
+        self.batches = []
+
+    def __call__(self, items: list) -> list:
+        self.batches.append(items)
+        if "fail" in items:
+            raise ValueError("batch failed")
+        return [item * 2 for item in items]
+
+
+def test_concurrent_items_are_processed_as_one_batch():
+    recorder = Recorder()
+
+    async def run():
+        batcher = Batcher(recorder, max_delay=0.05, max_batch=10)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+
+    assert asyncio.run(run()) == [0, 2, 4]
+    assert recorder.batches == [[0, 1, 2]]
+
+
+def test_full_batch_is_processed_without_delay():
+    recorder = Recorder()
+
+    async def run():
+        batcher = Batcher(recorder, max_delay=60, max_batch=2)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(4))), 5)
+
+    assert asyncio.run(run()) == [0, 2, 4, 6]
+    assert recorder.batches == [[0, 1], [2, 3]]
+
+
+def test_exception_is_raised_to_every_caller_of_batch():
+    async def run():
+        batcher = Batcher(Recorder(), max_delay=0.01)
+        return await asyncio.gather(batcher.submit(1), batcher.submit("fail"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
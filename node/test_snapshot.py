@@ -0,0 +1,78 @@
+import pytest
+
+from blockchain import BlockChain
+from blockstore import BlockStore
+from conftest import grow, make_transaction, new_chain
+from snapshot import checkpoint, create_snapshot, validate_snapshot
+
+
+def grown_chain(count: int, archive: BlockStore = None) -> BlockChain:
+    blockchain = new_chain(archive=archive)
+    grow(blockchain, count, "tx")
+    return blockchain
+
+
+def test_checkpoints_are_multiples_of_interval():
+    assert checkpoint(25, 10) == 20
+    assert checkpoint(30, 10) == 30
+    assert checkpoint(-3, 10) == 0
+
+
+def test_chain_is_continued_from_validated_snapshot():
+    source = grown_chain(6)
+    snapshot = create_snapshot(source, 4)
+    blockchain = new_chain()
+
+    headers, entries = validate_snapshot(blockchain, (block.pruned() for block in source.chain), snapshot)
+    assert len(headers) == 5
+    blockchain.bootstrap(headers, entries)
+    assert blockchain.pruned_height == 5
+    assert blockchain.index.locate(source.chain[3].transactions[0]["hash"]) == (3, 0)
+    assert blockchain.add_blocks(source.chain[5:]) == 2
+    assert blockchain.total_work() == source.total_work()
+
+
+def test_inconsistent_snapshot_is_rejected():
+    source = grown_chain(4)
+    headers = [block.pruned() for block in source.chain]
+    blockchain = new_chain()
+
+    for field, value in (("work", 1), ("hash", "0" * 64), ("height", 10)):
+        snapshot = dict(create_snapshot(source, 3), **{field: value})
+        with pytest.raises(ValueError):
+            validate_snapshot(blockchain, iter(headers), snapshot)
+    snapshot = create_snapshot(source, 3)
+    snapshot["transactions"][0][2] += 1
+    with pytest.raises(ValueError):
+        validate_snapshot(blockchain, iter(headers), snapshot)
+
+
+def test_malformed_snapshot_raises_value_error():
+    source = grown_chain(2)
+    headers = [block.pruned() for block in source.chain]
+    blockchain = new_chain()
+    snapshot = create_snapshot(source, 2)
+
+    for malformed in (None, {k: v for k, v in snapshot.items() if k != "height"}, dict(snapshot, height="2"),
+                      dict(snapshot, work=True), dict(snapshot, transactions=[7]),
+                      dict(snapshot, transactions=[["ab", 1]]), dict(snapshot, transactions={})):
+        with pytest.raises(ValueError):
+            validate_snapshot(blockchain, iter(headers), malformed)
+
+
+def test_pruned_bodies_are_only_served_from_archive(tmp_path):
+    blockchain = grown_chain(6)
+    assert blockchain.prune(4) == 4
+    assert not blockchain.chain[3].transactions
+    assert blockchain.available_from() == 4
+    with pytest.raises(LookupError):
+        blockchain.bodies(2, 6)
+    assert blockchain.index.locate(blockchain.chain[4].transactions[0]["hash"]) == (4, 0)
+
+    archive = BlockStore(str(tmp_path))
+    blockchain = grown_chain(6, archive)
+    assert blockchain.prune(4) == 4
+    assert blockchain.available_from() == 0
+    assert [list(block.transactions) for block in blockchain.bodies(2, 6)] == [[make_transaction(f"tx {i}")]
+                                                                                for i in range(1, 5)]
+    archive.close()
@@ -0,0 +1,132 @@
+import pytest
+
+import consts
+
+pytest.importorskip("requests")  # sync requests blocks through the peer transport
+
+from block import Block
+from blockchain import BlockChain
+from conftest import grow, new_chain
+from sync import fetch_snapshot, find_fork_point, peer_tip, sync_with_peer
+
+
+class Response:
+    def __init__(self, data) -> None:
+        self.data = data
+        self.status_code = 200
+
+    def json(self):
+        return self.data
+
+
+class Signed:
+    """Response of /snapshot, its content is the data open_message returns"""
+
+    def __init__(self, data) -> None:
+        self.content = data
+        self.status_code = 200
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class PeerChain:
+    """Transport answering requests from the chain of a peer, records the requested block ranges"""
+
+    def __init__(self, blockchain: BlockChain) -> None:
+        self.blockchain = blockchain
+        self.streamed = []
+
+    def get(self, peer, path, params=None):
+        chain = self.blockchain.chain
+        if path == "tip":
+            last = chain[-1]
+            return Response({"height": last.id, "hash": last.hash, "work": self.blockchain.total_work()})
+        headers = []
+        for block in chain[params["from"]:params["from"] + params["limit"]]:
+            header = block.header()
+            header["hash"] = block.hash
+            headers.append(header)
+        return Response({"headers": headers})
+
+    def stream(self, peer, path, params=None, accept=None, lines=True):
+        self.streamed.append((params["from"], params["from"] + params["limit"]))
+        for block in self.blockchain.chain[params["from"]:params["from"] + params["limit"]]:
+            yield block.encoded()
+
+
+def forked_chains(shared: int, local: int, remote: int) -> tuple:
+    ours = new_chain()
+    grow(ours, shared, "shared")
+    theirs = BlockChain(0, chain=list(ours.chain))
+    grow(ours, local, "ours")
+    grow(theirs, remote, "theirs")
+    return ours, theirs
+
+
+def foreign_chains(local: int, remote: int) -> tuple:
+    ours = new_chain()
+    grow(ours, local, "ours")
+    genesis = Block(0, [], ours.chain[0].timestamp - 1, BlockChain.genesis_block_previous_hash)
+    theirs = BlockChain(0, chain=[genesis])
+    grow(theirs, remote, "theirs")
+    return ours, theirs
+
+
+def test_fork_point_is_last_shared_block():
+    ours, theirs = forked_chains(shared=20, local=3, remote=7)
+    transport = PeerChain(theirs)
+    assert find_fork_point(ours, transport, "peer", len(theirs.chain) - 1) == 20
+
+
+def test_sync_downloads_only_blocks_after_fork_point():
+    ours, theirs = forked_chains(shared=20, local=3, remote=7)
+    transport = PeerChain(theirs)
+
+    assert sync_with_peer(ours, transport, "peer")
+    assert transport.streamed == [(21, 28)]
+    assert [block.hash for block in ours.chain] == [block.hash for block in theirs.chain]
+    assert not sync_with_peer(ours, transport, "peer")
+
+
+def test_chain_with_other_genesis_is_imported_after_it_outweighs_local_chain(monkeypatch):
+    monkeypatch.setattr(consts, "sync_import_batch", 4)
+    ours, theirs = foreign_chains(local=5, remote=20)
+    transport = PeerChain(theirs)
+    blocks = []
+    # blocks are buffered until they have more work than the local chain, the rest is imported in batches
+    monkeypatch.setattr(ours, "replace_foreign_chain",
+                        lambda chain: blocks.append(len(chain)) or BlockChain.replace_foreign_chain(ours, chain))
+
+    assert sync_with_peer(ours, transport, "peer")
+    assert blocks == [7]
+    assert [block.hash for block in ours.chain] == [block.hash for block in theirs.chain]
+
+
+def test_chain_with_other_genesis_needing_too_many_buffered_blocks_is_ignored(monkeypatch):
+    monkeypatch.setattr(consts, "foreign_chain_max_blocks", 5)
+    ours, theirs = foreign_chains(local=5, remote=20)
+    chain = list(ours.chain)
+
+    assert not sync_with_peer(ours, PeerChain(theirs), "peer")
+    assert ours.chain == chain
+
+
+def test_malformed_tip_is_rejected():
+    ours, theirs = forked_chains(shared=2, local=0, remote=1)
+    transport = PeerChain(theirs)
+    assert peer_tip(transport, "peer")["height"] == 3
+    transport.get = lambda peer, path, params=None: Response({"height": 3, "hash": "ab", "work": "99"})
+    with pytest.raises(ValueError):
+        peer_tip(transport, "peer")
+    with pytest.raises(ValueError):
+        sync_with_peer(ours, transport, "peer")
+
+
+def test_signed_but_malformed_snapshot_raises_value_error():
+    ours, theirs = forked_chains(shared=1, local=0, remote=0)
+    transport = PeerChain(theirs)
+    for data in ({"node_address": "peer"}, {"node_address": "peer", "snapshot": {"height": "1"}}, ["peer"]):
+        transport.get = lambda peer, path, params=None, data=data: Signed(data)
+        with pytest.raises(ValueError):
+            fetch_snapshot(transport, "peer", lambda content: content)
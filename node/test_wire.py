@@ -0,0 +1,70 @@
+import pytest
+
+import wire
+from block import Block, transaction_hash
+
+
+def make_block(target: int = None) -> Block:
+    transactions = [{"author": "alice", "content": "hello", "time": 1.5}, {"author": "bob", "content": "world"}]
+    return Block(3, transactions, 12.5, "ab" * 32, target=target)
+
+
+def assert_same_block(received: Block, block: Block) -> None:
+    assert received.hash == block.hash == received.compute_hash()
+    assert received.header() == block.header()
+    assert [transaction_hash(tx) for tx in received.transactions] == [transaction_hash(tx) for tx in
+                                                                      block.transactions]
+
+
+@pytest.mark.parametrize("target", [None, 2 ** 240 - 1])
+def test_json_block_round_trip(target):
+    block = make_block(target)
+    assert_same_block(wire.decode_block(wire.encode_block(block, wire.JSON), wire.JSON), block)
+
+
+def test_json_stream_decodes_one_block_per_line():
+    blocks = [make_block(), make_block(2 ** 200)]
+    received = list(wire.iter_blocks([wire.encode_block(block, wire.JSON) for block in blocks], wire.JSON))
+    for block, copy in zip(blocks, received):
+        assert_same_block(copy, block)
+
+
+def test_malformed_json_block_raises_value_error():
+    with pytest.raises(ValueError):
+        wire.decode_block(b'{"index": "three"}', wire.JSON)
+    with pytest.raises(ValueError):
+        wire.decode_block(b'not json', wire.JSON)
+
+
+def test_peers_not_advertising_formats_get_json():
+    assert wire.choose_format([wire.MSGPACK, wire.JSON], None) == wire.JSON
+    assert wire.choose_format([wire.MSGPACK, wire.JSON], [wire.JSON, wire.MSGPACK]) == wire.MSGPACK
+    assert wire.format_of("application/msgpack; charset=binary") == wire.MSGPACK
+    assert wire.format_of(None) == wire.JSON
+    assert wire.JSON in wire.available_formats([wire.MSGPACK])
+
+
+@pytest.mark.parametrize("target", [None, 2 ** 240 - 1])
+def test_msgpack_block_round_trip(target):
+    pytest.importorskip("msgpack")
+    block = make_block(target)
+    encoded = wire.encode_block(block, wire.MSGPACK)
+    assert len(encoded) < len(wire.encode_block(block, wire.JSON))
+    assert_same_block(wire.decode_block(encoded, wire.MSGPACK), block)
+
+
+def test_msgpack_stream_is_decoded_across_chunk_boundaries():
+    pytest.importorskip("msgpack")
+    blocks = [make_block(), make_block(2 ** 200)]
+    data = b''.join(wire.encode_block(block, wire.MSGPACK) for block in blocks)
+    chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+    for block, copy in zip(blocks, list(wire.iter_blocks(chunks, wire.MSGPACK))):
+        assert_same_block(copy, block)
+
+
+def test_malformed_msgpack_block_raises_value_error():
+    msgpack = pytest.importorskip("msgpack")
+    with pytest.raises(ValueError):
+        wire.decode_block(msgpack.packb([1, 2, 3]), wire.MSGPACK)
+    with pytest.raises(ValueError):
+        wire.decode_block(b'\xc1', wire.MSGPACK)
@@ -0,0 +1,169 @@
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import consts
+import metrics
+from peers import PeerTable
+
+request_seconds = metrics.histogram("peer_request_seconds", "Time until response headers of requests to peers",
+                                    ("peer", "path"))
+request_failures = metrics.counter("peer_request_failures_total", "Requests to peers failed or answered with error",
+                                   ("peer", "path"))
+sent_bytes = metrics.counter("peer_sent_bytes_total", "Request body bytes sent to peers", ("path",))
+received_bytes = metrics.counter("peer_received_bytes_total", "Response body bytes received from peers", ("path",))
+
+
+def peer_url(peer: str, path: str) -> str:
+    return peer.rstrip('/') + '/' + path
+
+
+class PeerTransport:
+    """
+    HTTP client shared by all requests to peers.
+
+    Connections are pooled and kept alive per peer, every request has connect
+    and read timeouts, and requests to many peers are fanned out over a bounded
+    thread pool. Fan-out methods collect failures per peer instead of raising.
+    Round trip times and failures are recorded in the peer table if one is given.
+    """
+
+    def __init__(self, timeout: tuple = (2, 10), max_workers: int = 32, pool_size: int = 256,
+                 table: PeerTable = None) -> None:
+        """
+        Constructor for PeerTransport class
+        :param timeout: (connect, read) timeout in seconds of each request
+        :param max_workers: maximum number of concurrent requests of a fan-out
+        :param pool_size: number of peers whose connections are kept alive
+        :param table: PeerTable recording health of peers
+        """
+        self.timeout = timeout
+        self.table = table
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='peer-transport')
+
+    def _request(self, method: str, peer: str, path: str, data=None, stream: bool = False, **kwargs):
+        """
+        Send request to peer, recording latency, failures and bytes when metrics are enabled
+        Bodies of streamed responses are counted by stream as they are read
+        Server errors count as failures of the peer in the peer table, client errors do not
+        """
+        labels = (peer, path)
+        start = perf_counter()
+        try:
+            response = self.session.request(method, peer_url(peer, path), data=data, stream=stream,
+                                            timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            if self.table is not None:
+                self.table.record_failure(peer)
+            if metrics.enabled:
+                request_failures.inc(1, labels)
+            raise
+        elapsed = perf_counter() - start
+        if self.table is not None:
+            if response.status_code >= 500:
+                self.table.record_failure(peer)
+            else:
+                self.table.record_success(peer, elapsed)
+        if not metrics.enabled:
+            return response
+        request_seconds.observe(elapsed, labels)
+        if response.status_code >= 400:
+            request_failures.inc(1, labels)
+        if data:
+            sent_bytes.inc(len(data), (path,))
+        if not stream:
+            received_bytes.inc(len(response.content), (path,))
+        return response
+
+    def get(self, peer: str, path: str, params: dict = None) -> requests.Response:
+        """
+        Send GET request to peer, raises requests.exceptions.RequestException on failure
+        :param peer: peer address
+        :param path: endpoint path
+        :param params: query parameters
+        :return: response
+        """
+        return self._request('GET', peer, path, params=params)
+
+    def stream(self, peer: str, path: str, params: dict = None, accept: str = None, lines: bool = True):
+        """
+        Send GET request to peer and return response body as it arrives, raises
+        requests.exceptions.RequestException on failure or error status
+        :param peer: peer address
+        :param path: endpoint path
+        :param params: query parameters
+        :param accept: value of Accept header
+        :param lines: split body into lines
+        :return: generator of non empty lines or of received chunks as bytes
+        """
+        headers = {'Accept': accept} if accept else None
+        with self._request('GET', peer, path, params=params, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            chunks = response.iter_lines(chunk_size=65536) if lines else response.iter_content(chunk_size=65536)
+            for chunk in chunks:
+                if chunk:
+                    received_bytes.inc(len(chunk) + lines, (path,))
+                    yield chunk
+
+    def post(self, peer: str, path: str, data, content_type: str = None) -> requests.Response:
+        """
+        Send POST request to peer, raises requests.exceptions.RequestException on failure
+        :param peer: peer address
+        :param path: endpoint path
+        :param data: JSON serializable payload or already serialized string or bytes
+        :param content_type: content type of serialized payload, JSON if None
+        :return: response
+        """
+        if not isinstance(data, (str, bytes)):
+            data = json.dumps(data)
+        headers = {'Content-Type': content_type} if content_type else consts.json_headers
+        return self._request('POST', peer, path, data=data, headers=headers)
+
+    def gather(self, peers, func) -> tuple:
+        """
+        Call func(peer) for every peer concurrently
+        :param peers: iterable of peer addresses
+        :param func: function taking peer address
+        :return: (dict peer -> result, dict peer -> raised exception)
+        """
+        futures = {peer: self.executor.submit(func, peer) for peer in peers}
+        results = {}
+        failures = {}
+        for peer, future in futures.items():
+            try:
+                results[peer] = future.result()
+            except Exception as e:
+                failures[peer] = e
+        return results, failures
+
+    def broadcast(self, peers, path: str, data, content_type: str = None) -> tuple:
+        """
+        POST the same payload to every peer concurrently, payload is serialized once
+        Responses with error status are reported as failures
+        :param peers: iterable of peer addresses
+        :param path: endpoint path
+        :param data: JSON serializable payload or already serialized string or bytes
+        :param content_type: content type of serialized payload, JSON if None
+        :return: (dict peer -> response, dict peer -> exception)
+        """
+        if not isinstance(data, (str, bytes)):
+            data = json.dumps(data)
+
+        def send(peer):
+            response = self.post(peer, path, data, content_type)
+            response.raise_for_status()
+            return response
+
+        return self.gather(peers, send)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+        self.session.close()
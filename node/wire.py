@@ -0,0 +1,173 @@
+import json
+
+from block import Block, check_fields
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, nodes without it talk JSON only
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+content_types = {JSON: "application/json", MSGPACK: "application/msgpack"}
+
+
+def available_formats(preferred: list) -> list:
+    """
+    Return wire formats this node can use, JSON is always available
+    :param preferred: format names in order of preference
+    :return: list of usable format names in order of preference
+    """
+    formats = [f for f in preferred if f == JSON or (f == MSGPACK and msgpack is not None)]
+    return formats if JSON in formats else formats + [JSON]
+
+
+def choose_format(ours: list, theirs: list) -> str:
+    """
+    Return first of our formats the peer supports, JSON for peers not advertising formats
+    :param ours: formats of this node in order of preference
+    :param theirs: formats advertised by peer
+    :return: format name
+    """
+    return next((f for f in ours if f in (theirs or [JSON])), JSON)
+
+
+def format_of(content_type: str) -> str:
+    """
+    Return wire format of request or response body by its content type
+    :param content_type: value of Content-Type or Accept header
+    :return: MSGPACK for msgpack bodies, otherwise JSON
+    """
+    return MSGPACK if content_types[MSGPACK] in (content_type or '') else JSON
+
+
+def dumps(data, fmt: str) -> bytes:
+    if fmt == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data).encode('utf-8')
+
+
+def loads(data: bytes, fmt: str):
+    if fmt == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def _pack_hash(value: str):
+    # hex encoded sha256 hashes are sent as 32 raw bytes, other values like the genesis previous hash as they are
+    if len(value) == 64:
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _unpack_hash(value) -> str:
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def block_fields(block: Block) -> list:
+    """
+    Return block as msgpack array without key names, Merkle root is left out since receivers recompute it
+    :param block: Block object
+    :return: [id, timestamp, nonce, previous hash, hash, transactions, target], target as 32 bytes or None
+    """
+    target = block.target.to_bytes(32, 'big') if block.target is not None else None
+    return [block.id, block.timestamp, block.nonce, _pack_hash(block.previous_hash), _pack_hash(block.hash),
+            list(block.transactions), target]
+
+
+def block_from_fields(fields: list) -> Block:
+    """
+    Create block from array returned by block_fields, Merkle root is computed from the transactions
+    :param fields: decoded msgpack array
+    :return: Block object, raises ValueError if fields are missing or have wrong types
+    """
+    if not isinstance(fields, list) or len(fields) != 7:
+        raise ValueError("block has to be an array of 7 fields")
+    id, timestamp, nonce, previous_hash, hash, transactions, target = fields
+    previous_hash, hash = _unpack_hash(previous_hash), _unpack_hash(hash)
+    check_fields(id, transactions, timestamp, previous_hash, nonce, hash)
+    if target is not None and not isinstance(target, bytes):
+        raise ValueError("block target has to be bytes")
+    try:
+        return Block(id, transactions, timestamp, previous_hash, nonce, hash,
+                     target=int.from_bytes(target, 'big') if target is not None else None)
+    except TypeError:
+        raise ValueError("block transactions can not be encoded as JSON") from None  # e.g. binary values
+
+
+def encode_block(block: Block, fmt: str) -> bytes:
+    """
+    Encode block for sending to peers, JSON uses the cached encoding of sealed blocks
+    :param block: Block object
+    :param fmt: wire format
+    :return: encoded block
+    """
+    if fmt == MSGPACK:
+        return msgpack.packb(block_fields(block), use_bin_type=True)
+    return block.encoded()
+
+
+def decode_block(data, fmt: str) -> Block:
+    """
+    Decode block received from peer, hash and Merkle root are validated when the block is added
+    :param data: encoded block
+    :param fmt: wire format
+    :return: Block object, raises ValueError if data is not a well-formed block
+    """
+    if fmt == MSGPACK:
+        return block_from_fields(_unpack(data))
+    return Block.from_dict(json.loads(data))
+
+
+def _unpack(data: bytes):
+    if msgpack is None:
+        raise ValueError("msgpack is not available")
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"malformed msgpack: {e}") from None
+
+
+def iter_blocks(chunks, fmt: str):
+    """
+    Decode stream of blocks, msgpack blocks follow each other without separator, JSON blocks are one per line
+    :param chunks: iterable of received bytes, lines for JSON
+    :param fmt: wire format
+    :return: generator of Block objects, raises ValueError at the first block that is not well-formed
+    """
+    if fmt == MSGPACK:
+        unpacker = msgpack.Unpacker(raw=False)
+        for chunk in chunks:
+            unpacker.feed(chunk)
+            try:
+                decoded = list(unpacker)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"malformed msgpack: {e}") from None
+            for fields in decoded:
+                yield block_from_fields(fields)
+    else:
+        for line in chunks:
+            yield Block.from_dict(json.loads(line))
+
+
+def encode_signed(payload: bytes, signature: bytes) -> bytes:
+    """
+    Encode signed msgpack message, the signature covers the payload bytes as they are sent
+    :param payload: msgpack encoded data
+    :param signature: signature of payload
+    :return: encoded message
+    """
+    return msgpack.packb([payload, signature], use_bin_type=True)
+
+
+def decode_signed(data: bytes) -> tuple:
+    """
+    Split message created by encode_signed
+    :param data: encoded message
+    :return: (payload bytes, signature bytes, decoded payload)
+    """
+    payload, signature = msgpack.unpackb(data, raw=False)
+    return payload, signature, msgpack.unpackb(payload, raw=False)